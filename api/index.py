@@ -11,6 +11,16 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
+# A serverless instance handles one request at a time, so keep the pool small.
+# The pool lives at module level and stays warm for as long as Vercel reuses
+# this instance, so later invocations skip the TCP/TLS/auth handshake.
+os.environ.setdefault("DB_POOL_MIN", "1")
+os.environ.setdefault("DB_POOL_MAX", "2")
+
+# No worker process runs next to a serverless function, so background jobs
+# (post-checkout rollups, invoice snapshots, image derivatives) run inline.
+os.environ.setdefault("BACKGROUND_JOBS", "False")
+
 # Import the Flask application
 # This must be done after path modification
 from app import app
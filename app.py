@@ -1,18 +1,43 @@
 # app.py - Updated for Supabase (PostgreSQL)
+import hashlib
+import hmac
 import os
+from datetime import datetime
 from flask import (
     Flask, g, render_template, request, redirect, session, url_for,
-    flash, jsonify
+    flash, jsonify, make_response, Response, abort, stream_with_context
 )
-from werkzeug.utils import secure_filename
 
-# SQLAlchemy for database connection
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text, create_engine
-from sqlalchemy.engine import make_url
-from urllib.parse import urlparse, quote_plus
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+from functools import wraps
+from urllib.parse import quote_plus, urlencode
+
+from catalog import parse_catalog_args, fetch_product_page, CATALOG_ARGS
+import catalog_api
+import queries
+from queries import run
+from search import search_products, SUGGEST_LIMIT
+from product_cache import ProductCache
+from stats import incr_counter, dashboard_stats, forget_user_orders
+from exports import stream_export, EXPORTS, EXPORT_FORMATS
+from images import save_upload, image_variants
+from invoices import snapshot_invoices, load_invoice, invoice_context
+from jobs import enqueue
+import tasks  # noqa: F401  registers the job handlers, for inline runs
+from carts import new_cart_id, add_item, cart_products, cart_is_empty, take_cart, claim_cart
+from assets import init_assets
+from template_cache import ShippedBytecodeCache
+from fragment_cache import FragmentCacheExtension
+from page_cache import SharedPageCache
+from instrumentation import Metrics, InstrumentedCursor, server_timing
+from replicas import ReplicaRouter, WROTE_SQL, PRIMARY_LSN_SQL, parse_lsn
+from product_import import (
+    import_products, read_rows, detect_format, text_stream, FIELDS as IMPORT_FIELDS, MAX_REPORTED_ERRORS
+)
+from orders import (
+    place_order, OutOfStockError, parse_order_history_args, fetch_order_history_page
+)
 
 # create app
 app = Flask(__name__)
@@ -21,6 +46,9 @@ app.secret_key = os.environ.get("SECRET_KEY", "change_me_in_prod")
 # Disable debug mode in production
 app.config['DEBUG'] = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
 
+# Precompiled templates from jinja_cache/ (build_assets.py), so a cold start skips compiling them
+app.jinja_env.bytecode_cache = ShippedBytecodeCache()
+
 # -------------------- DATABASE / SQLALCHEMY CONFIG --------------------
 # Priority: use DATABASE_URL (Supabase connection string)
 database_url = os.environ.get("DATABASE_URL")
@@ -34,36 +62,53 @@ if not database_url:
     encoded_password = quote_plus(DB_PASS)
     database_url = f"postgresql://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Configure Flask-SQLAlchemy for PostgreSQL/Supabase
+# Connection pool sizing. The psycopg2 connections used by the raw SQL routes are
+# checked out of the SQLAlchemy engine pool.
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))  # connections opened up front per process
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))  # hard cap per process
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "300"))  # seconds before a connection is replaced
+
+# Streaming replicas for @read_only routes (see replicas.py): comma-separated connection URLs
+REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", "5"))  # seconds; lagging replicas are skipped
+REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", "1"))  # seconds between lag checks
+
+# Engine options for PostgreSQL/Supabase. The engine itself is built on the
+# first request that needs the database (get_engine), so importing the app -
+# a serverless cold start - never loads SQLAlchemy or psycopg2.
 if database_url:
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "connect_args": {"sslmode": "require"} if "supabase.co" in database_url else {},
+    ENGINE_URL = database_url
+    ENGINE_OPTIONS = {
         "pool_pre_ping": True,  # Verify connections before using
-        "pool_recycle": 300,  # Recycle connections after 5 minutes
+        "pool_recycle": DB_POOL_RECYCLE,  # Recycle connections after DB_POOL_RECYCLE seconds
+        "pool_size": DB_POOL_MAX,
+        "max_overflow": 0,
+        "pool_timeout": DB_POOL_TIMEOUT,
     }
 else:
     # Fallback for development
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///temp.db"
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# init SQLAlchemy
-db = SQLAlchemy(app)
+    ENGINE_URL = "sqlite:///temp.db"
+    ENGINE_OPTIONS = {}
 
 # -------------------- PostgreSQL compatibility layer --------------------
-def get_db_conn():
+def get_db_conn(url=None):
     """
     Return a psycopg2 connection for raw SQL queries.
-    Reads DB connection info from DATABASE_URL environment variable.
-    This is called lazily on first request, not at import time.
+    Reads DB connection info from DATABASE_URL environment variable, or
+    from `url` (a replica).
+    Used as the pool's creator, so it only runs when a new physical
+    connection is needed, never at import time.
     """
-    if not database_url:
+    url = url or database_url
+    if not url:
         raise ValueError("DATABASE_URL environment variable is not set")
     
+    import psycopg2
+    from sqlalchemy.engine import make_url
     try:
         # Parse the URL using SQLAlchemy's make_url which handles URL encoding
-        url_obj = make_url(database_url)
+        url_obj = make_url(url)
         # Build connection parameters for psycopg2
         conn_params = {
             "host": url_obj.host or "localhost",
@@ -73,17 +118,17 @@ def get_db_conn():
             "database": url_obj.database or "postgres",
         }
         # Add SSL mode for Supabase
-        if "supabase.co" in database_url or "supabase" in (url_obj.host or ""):
+        if "supabase.co" in url or "supabase" in (url_obj.host or ""):
             conn_params["sslmode"] = "require"
         conn = psycopg2.connect(**conn_params)
         return conn
     except Exception as e:
         # Fallback: try direct connection string if URL parsing fails
         try:
-            if "supabase.co" in database_url or "supabase" in database_url:
-                conn = psycopg2.connect(database_url, sslmode="require")
+            if "supabase.co" in url or "supabase" in url:
+                conn = psycopg2.connect(url, sslmode="require")
             else:
-                conn = psycopg2.connect(database_url)
+                conn = psycopg2.connect(url)
             return conn
         except Exception as db_error:
             # Log error but don't fail silently in production
@@ -92,36 +137,247 @@ def get_db_conn():
             print(traceback.format_exc())
             raise
 
+# Server-side prepared statements for the query layer, unless behind a transaction pooler
+queries.configure(database_url)
+
+# -------------------- Connection pool --------------------
+_pool_counters = {"connects": 0, "checkouts": 0, "invalidated": 0, "timeouts": 0}
+_pool_state = {"warmed_pid": None, "engine": None, "replicas": {}}
+_engine_lock = threading.Lock()
+
+def _count_connect(dbapi_conn, record):
+    _pool_counters["connects"] += 1
+
+def _count_checkout(dbapi_conn, record, proxy):
+    _pool_counters["checkouts"] += 1
+
+def _count_invalidate(dbapi_conn, record, exception):
+    _pool_counters["invalidated"] += 1
+
+def get_engine():
+    """The process's SQLAlchemy engine, created (and SQLAlchemy imported) on first use."""
+    engine = _pool_state["engine"]
+    if engine is None:
+        with _engine_lock:
+            engine = _pool_state["engine"]
+            if engine is None:
+                from sqlalchemy import create_engine, event
+                options = dict(ENGINE_OPTIONS)
+                if database_url:
+                    # The pool opens connections through get_db_conn so Supabase SSL handling stays in one place
+                    options["creator"] = get_db_conn
+                engine = create_engine(ENGINE_URL, **options)
+                event.listen(engine, "connect", _count_connect)
+                event.listen(engine, "checkout", _count_checkout)
+                event.listen(engine, "invalidate", _count_invalidate)
+                _pool_state["engine"] = engine
+    return engine
+
+def get_replica_engine(i):
+    """Pool for replica i of REPLICA_URLS, created on first use like the primary's."""
+    engine = _pool_state["replicas"].get(i)
+    if engine is None:
+        with _engine_lock:
+            engine = _pool_state["replicas"].get(i)
+            if engine is None:
+                from sqlalchemy import create_engine
+                url = REPLICA_URLS[i]
+                engine = create_engine(url, creator=lambda: get_db_conn(url), **ENGINE_OPTIONS)
+                _pool_state["replicas"][i] = engine
+    return engine
+
+# Per process, like the pools; names drop the credentials for /_health/replicas
+replica_router = ReplicaRouter(
+    [url.split("@", 1)[-1] for url in REPLICA_URLS],
+    max_lag=REPLICA_MAX_LAG,
+    check_interval=REPLICA_CHECK_INTERVAL,
+)
+
+def _reset_pool_after_fork():
+    """
+    Drop connections inherited from the parent process (e.g. a gunicorn master
+    with --preload). close=False leaves the parent's sockets alone; the child
+    opens its own connections on first use.
+    """
+    for engine in [_pool_state["engine"], *_pool_state["replicas"].values()]:
+        if engine is not None:
+            engine.dispose(close=False)
+    _pool_state["warmed_pid"] = None
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+def _warm_pool():
+    """Open DB_POOL_MIN connections once per process so the first requests skip the handshake."""
+    _pool_state["warmed_pid"] = os.getpid()
+    conns = []
+    try:
+        engine = get_engine()
+        for _ in range(min(DB_POOL_MIN, DB_POOL_MAX) - engine.pool.checkedin()):
+            conns.append(engine.raw_connection())
+    except Exception as e:
+        print(f"Connection pool warm-up failed: {e}")
+    finally:
+        for conn in conns:
+            conn.close()
+
+def pool_stats():
+    """Snapshot of the connection pool for sizing DB_POOL_MIN / DB_POOL_MAX."""
+    stats = {
+        "pid": os.getpid(),
+        "min": DB_POOL_MIN,
+        "max": DB_POOL_MAX,
+        "timeout": DB_POOL_TIMEOUT,
+        "recycle": DB_POOL_RECYCLE,
+    }
+    pool = _pool_state["engine"].pool if _pool_state["engine"] is not None else None
+    if hasattr(pool, "checkedout"):
+        stats.update({
+            "idle": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            "open": pool.checkedin() + pool.checkedout(),
+        })
+    stats.update(_pool_counters)
+    return stats
+
 def get_request_conn():
+    """
+    Check a connection out of the pool for the current request. It goes back
+    to the pool (rolled back, not closed) in close_request_conn.
+    """
     if not hasattr(g, "db_conn"):
-        g.db_conn = get_db_conn()
+        if _pool_state["warmed_pid"] != os.getpid():
+            _warm_pool()
+        from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+        try:
+            g.db_conn = CompatConnection(get_engine().raw_connection(), primary=True)
+        except PoolTimeoutError:
+            _pool_counters["timeouts"] += 1
+            raise
     return g.db_conn
 
+def get_read_conn():
+    """
+    Connection for a @read_only request: a replica within REPLICA_MAX_LAG
+    that has replayed this session's last write, else the primary's.
+    """
+    if not replica_router:
+        return get_request_conn()
+    if not hasattr(g, "db_read_conn"):
+        choice = replica_router.choose(
+            lambda i: get_replica_engine(i).raw_connection(), parse_lsn(session.get("db_lsn"))
+        )
+        g.db_read_conn = CompatConnection(choice[1]) if choice else get_request_conn()
+    return g.db_read_conn
+
+def read_only(view):
+    """Declare that a route only reads, so its mysql.connection may be a replica's."""
+    @wraps(view)
+    def read_only_view(*args, **kwargs):
+        g.db_intent = "read"
+        return view(*args, **kwargs)
+    return read_only_view
+
 @app.teardown_appcontext
 def close_request_conn(exception=None):
-    conn = g.pop("db_conn", None)
-    try:
-        if conn:
+    # A read_only request without a fit replica holds the primary connection twice
+    conns = {id(c): c for c in (g.pop("db_conn", None), g.pop("db_read_conn", None)) if c}
+    for conn in conns.values():
+        try:
+            # Returns the connection to the pool; uncommitted work is rolled back
             conn.close()
-    except Exception:
-        pass
+        except Exception:
+            pass
+
+class RealDictCursor:
+    """
+    Stand-in for psycopg2.extras.RealDictCursor, which routes pass to
+    cursor() for dict rows. CompatConnection swaps in the real class, so
+    psycopg2.extras is imported with the first connection, not at startup.
+    """
+
+class CompatConnection:
+    """
+    Pooled connection as the routes see it. Like MySQLdb, cursor() takes the
+    cursor class positionally, so `mysql.connection.cursor(RealDictCursor)` works.
+    Everything else (rollback, close) goes to the pooled connection.
+    """
+    def __init__(self, conn, primary=False):
+        self._conn = conn
+        self._primary = primary
+
+    def commit(self):
+        if not (self._primary and replica_router):
+            return self._conn.commit()
+        # Remember the WAL position of this session's last write, so its
+        # reads skip replicas that have not replayed it yet (read-your-writes)
+        cur = self._conn.cursor()
+        cur.execute(WROTE_SQL)
+        wrote = cur.fetchone()[0]
+        self._conn.commit()
+        if wrote:
+            cur.execute(PRIMARY_LSN_SQL)
+            session["db_lsn"] = cur.fetchone()[0]
+        cur.close()
+
+    def cursor(self, cursor_factory=None, **kwargs):
+        if cursor_factory is RealDictCursor:
+            from psycopg2.extras import RealDictCursor as cursor_factory
+        if cursor_factory is not None:
+            kwargs["cursor_factory"] = cursor_factory
+        cur = self._conn.cursor(**kwargs)
+        # Time every statement into the request's stats (see instrumentation.py)
+        stats = g.get("query_stats")
+        return InstrumentedCursor(cur, stats) if stats is not None else cur
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
 
 class PostgreSQLCompat:
     """Compatibility object so existing code using `mysql.connection.cursor()` keeps working."""
     @property
     def connection(self):
+        """The request's connection: possibly a replica's in @read_only routes, else the primary's."""
+        if g.get("db_intent") == "read":
+            return get_read_conn()
+        return get_request_conn()
+
+    @property
+    def primary(self):
+        """The primary's connection, for the occasional write in a @read_only route."""
         return get_request_conn()
     
     def cursor(self, cursor_factory=None):
         """Return a cursor. Use RealDictCursor for dict-like results (like MySQLdb.cursors.DictCursor)"""
-        conn = self.connection
-        if cursor_factory == RealDictCursor:
-            return conn.cursor(cursor_factory=RealDictCursor)
-        return conn.cursor()
+        return self.connection.cursor(cursor_factory)
 
 # instantiate compatibility object
 mysql = PostgreSQLCompat()  # Keep the name 'mysql' for compatibility with existing code
 
+# -------------------- Instrumentation --------------------
+metrics = Metrics(slow_query_ms=float(os.environ.get("SLOW_QUERY_MS", "100")))
+# Off by default: the header tells any client how much SQL a page runs
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "False").lower() == "true"
+HEALTH_MAX_DB_LATENCY_MS = float(os.environ.get("HEALTH_MAX_DB_LATENCY_MS", "250"))
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    g.query_stats = metrics.start_request()
+
+@app.after_request
+def record_request_timing(response):
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe(route, request.method, response.status_code, elapsed, stats)
+    for sql, seconds in stats.slow:
+        app.logger.warning("Slow query on %s %s (%.1f ms): %s", request.method, route, seconds * 1000, sql)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(stats, elapsed)
+    return response
+
 # -------------------- File upload helper --------------------
 UPLOAD_FOLDER = 'static/images/products'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -130,13 +386,357 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Lets templates build srcset markup (templates/_images.html)
+app.jinja_env.globals['image_variants'] = image_variants
+
+# -------------------- Background jobs --------------------
+# Post-checkout work and image derivatives run inline in the request unless
+# BACKGROUND_JOBS=True, which queues them in the jobs table for worker.py
+# (see jobs.py). Off by default: queued jobs never run on a deploy without
+# a worker, and their stats and invoices would silently go missing.
+BACKGROUND_JOBS = os.environ.get("BACKGROUND_JOBS", "False").lower() == "true"
+
+def save_product_image(file):
+    """Store an uploaded product image; returns its file name, or None if it is not a valid image."""
+    if not (file and allowed_file(file.filename)):
+        return None
+    return save_upload(file, app.config['UPLOAD_FOLDER'], derivatives=not BACKGROUND_JOBS)
+
+def queue_image_derivatives(cur, filename):
+    """Have a worker generate the derivatives save_product_image skipped, once the caller commits."""
+    if BACKGROUND_JOBS:
+        path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        enqueue(cur, 'image_derivatives', {'path': path})
+
+# -------------------- Static assets / compression --------------------
+# Fingerprinted static URLs (build_assets.py), immutable caching and gzip/brotli
+init_assets(
+    app,
+    min_size=int(os.environ.get("COMPRESS_MIN_SIZE", "1400")),  # bytes; smaller responses go out as-is
+    level=int(os.environ.get("COMPRESS_LEVEL", "6")),
+)
+
+# -------------------- Product cache --------------------
+product_cache = ProductCache(
+    max_products=int(os.environ.get("PRODUCT_CACHE_SIZE", "1000")),
+    max_pages=int(os.environ.get("PAGE_CACHE_SIZE", "200")),
+    ttl=float(os.environ.get("PRODUCT_CACHE_TTL", "60")),
+    check_interval=float(os.environ.get("CATALOG_VERSION_CHECK_INTERVAL", "2")),
+    max_fragments=int(os.environ.get("FRAGMENT_CACHE_SIZE", "2000")),
+)
+
+# {% cache %} blocks in the product listings, keyed on the catalog version
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = product_cache.fragments
+app.jinja_env.fragment_cache_version = lambda: product_cache.sync(mysql)[0]
+
+def catalog_response(render):
+    """
+    Serve a catalog page from the rendered-page cache, with an ETag of the
+    rendered HTML so browsers get 304s while the page is unchanged.
+    `render` builds the HTML on a miss. Pages with pending flash messages
+    are rendered fresh and never cached.
+
+    The ETag comes from the body, not the catalog version: checkouts change
+    stock without bumping the version, and a version-based ETag (or
+    Last-Modified) would keep revalidating browsers on the old counts past
+    the cache TTL.
+    """
+    if session.get('_flashes'):
+        return render()
+    product_cache.sync(mysql)
+    key = (request.full_path, session.get('username'), session.get('role'))
+    html = product_cache.pages.get(key)
+    if html is None:
+        html = render()
+        product_cache.pages.set(key, html)
+    resp = make_response(html)
+    resp.set_etag(hashlib.sha256(resp.get_data()).hexdigest()[:20], weak=True)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+# -------------------- Shared page cache --------------------
+# Anonymous GET pages shared by every worker on the host (see page_cache.py)
+PAGE_CACHE = os.environ.get("PAGE_CACHE", "True").lower() == "true"
+PAGE_TTL_INDEX = float(os.environ.get("PAGE_TTL_INDEX", "300"))  # seconds a page is fresh
+PAGE_TTL_PRODUCTS = float(os.environ.get("PAGE_TTL_PRODUCTS", "30"))  # bounds staleness of stock counts
+page_cache = SharedPageCache(
+    folder=os.environ.get("PAGE_CACHE_DIR") or None,
+    stale_ttl=float(os.environ.get("PAGE_CACHE_STALE_TTL", "300")),  # seconds a stale copy may still be served
+    lock_wait=float(os.environ.get("PAGE_CACHE_LOCK_WAIT", "2")),
+    max_entries=int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "2000")),  # pages kept per host
+    max_bytes=int(float(os.environ.get("PAGE_CACHE_MAX_MB", "64")) * 1024 * 1024),
+) if PAGE_CACHE else None
+
+def shared_page(ttl, params=()):
+    """
+    Serve anonymous GETs of a route from the shared page cache, fresh for
+    `ttl` seconds. Pages are keyed on the path and the query parameters
+    named in `params`, in sorted order: the view must ignore every other
+    parameter, so junk or reordered query strings share one copy. Logged-in
+    users and pages with pending flash messages get the route as usual.
+    """
+    params = sorted(params)
+    def decorator(view):
+        @wraps(view)
+        def shared_page_view(*args, **kwargs):
+            if page_cache is None or session.get('loggedin') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            uncached = []
+
+            def render():
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200 or resp.direct_passthrough:
+                    uncached.append(resp)
+                    return None
+                return resp.get_data(), resp.mimetype
+
+            key = request.path + '?' + urlencode([(k, request.args[k]) for k in params if k in request.args])
+            entry, state = page_cache.fetch(key, ttl, render)
+            if entry is None:
+                return uncached[0]
+            resp = Response(entry.body, mimetype=entry.mimetype)
+            resp.set_etag(entry.etag)
+            resp.cache_control.private = True
+            resp.cache_control.no_cache = True
+            resp.headers['X-Page-Cache'] = state
+            return resp.make_conditional(request)
+        return shared_page_view
+    return decorator
+
+def catalog_changed():
+    """Purge hook for the product admin routes, after they commit."""
+    if page_cache is not None:
+        page_cache.purge()
+
+# -------------------- Catalog pagination helper --------------------
+def product_page(cur):
+    """Fetch the page of products selected by request.args, plus pager links for _catalog.html."""
+    params = parse_catalog_args(request.args)
+    products, next_cursor = fetch_product_page(cur, params)
+    # Only the catalog's own parameters, so shared_page can key on them
+    filters = {k: v for k, v in request.args.items() if k in CATALOG_ARGS and k != 'after'}
+    page = {
+        'params': params,
+        'filters': filters,
+        'next_url': url_for(request.endpoint, after=next_cursor, **filters) if next_cursor else None,
+        'first_url': url_for(request.endpoint, **filters) if params['after'] else None,
+    }
+    return products, page
+
+# -------------------- Recommendations --------------------
+# "Frequently bought together", precomputed by build_recommendations.py
+RECOMMENDATIONS = os.environ.get("RECOMMENDATIONS", "True").lower() == "true"
+RECOMMENDATIONS_SHOWN = int(os.environ.get("RECOMMENDATIONS_SHOWN", "4"))  # products per panel
+RECOMMENDATIONS_PER_ROW = int(os.environ.get("RECOMMENDATIONS_PER_ROW", "3"))  # on /products rows
+RECENT_PURCHASE_LINES = 20  # order lines the dashboard recommends from
+
+def recommended_products(product_ids, limit=RECOMMENDATIONS_SHOWN):
+    """
+    Product rows often bought with any of product_ids, best first, leaving
+    out product_ids themselves. Scores are summed across them.
+    """
+    if not RECOMMENDATIONS or not product_ids:
+        return []
+    totals = {}
+    for pairs in product_cache.get_related(mysql, product_ids).values():
+        for pid, score in pairs:
+            totals[pid] = totals.get(pid, 0.0) + score
+    for pid in product_ids:
+        totals.pop(pid, None)
+    # A few spare in case some were deleted since the last build
+    ids = sorted(totals, key=lambda pid: (-totals[pid], pid))[:limit * 2]
+    rows = product_cache.get_products(mysql, ids)
+    return [rows[pid] for pid in ids if pid in rows][:limit]
+
+def related_by_product(products, limit=RECOMMENDATIONS_PER_ROW):
+    """{product id: [related product rows]} for a page of products."""
+    if not RECOMMENDATIONS or not products:
+        return {}
+    wanted = {
+        pid: [related for related, _ in pairs[:limit]]
+        for pid, pairs in product_cache.get_related(mysql, [p['id'] for p in products]).items()
+        if pairs
+    }
+    rows = product_cache.get_products(mysql, {pid for ids in wanted.values() for pid in ids})
+    return {pid: [rows[r] for r in ids if r in rows] for pid, ids in wanted.items()}
+
+# -------------------- Cart --------------------
+def current_cart_id(cur, create=False):
+    """
+    The cart id kept in the session. A logged-in user without one gets their
+    own cart back (see carts.claim_cart); an anonymous visitor gets a new id
+    only when `create` is set, i.e. on their first add. The caller commits.
+    """
+    cart_id = session.get('cart_id')
+    if cart_id is None:
+        if session.get('loggedin'):
+            cart_id = claim_cart(cur, None, session['id'])
+        elif create:
+            cart_id = new_cart_id()
+        else:
+            return None
+        session['cart_id'] = cart_id
+    return cart_id
+
+# -------------------- Search --------------------
+@app.route('/search/suggest')
+@read_only
+def search_suggest():
+    """Typeahead: ranked products for ?q=, cached per catalog version."""
+    q = (request.args.get('q') or '').strip()[:200]
+    try:
+        limit = min(max(int(request.args.get('limit', SUGGEST_LIMIT)), 1), 20)
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    version, _ = product_cache.sync(mysql)
+    key = (version, q.lower(), limit)
+    results = product_cache.searches.get(key)
+    if results is None:
+        cur = mysql.connection.cursor(RealDictCursor)
+        rows = search_products(cur, q, limit) if q else []
+        cur.close()
+        results = []
+        for row in rows:
+            variants = image_variants(row['image'])
+            thumb = variants[0]['src'] if variants else row['image']
+            results.append({
+                'id': row['id'],
+                'name': row['name'],
+                'price': str(row['price']) if row['price'] is not None else None,
+                'in_stock': (row['stock'] or 0) > 0,
+                'thumbnail': url_for('static', filename='images/products/' + thumb) if thumb else None,
+            })
+        product_cache.searches.set(key, results)
+    response = jsonify({'query': q, 'results': results})
+    response.headers['Cache-Control'] = 'public, max-age=30'
+    return response
+
+# -------------------- JSON API --------------------
+def api_response(body, status=200):
+    return Response(catalog_api.dumps(body), status=status, mimetype='application/json')
+
+@app.route('/api/v1/products')
+def api_products():
+    """Products as compact JSON, with fields=, keyset paging and since= delta sync (see catalog_api.py)."""
+    # The sync watermark must come from the primary, so these reads stay there
+    cur = mysql.connection.cursor(RealDictCursor)
+    body = catalog_api.product_page(cur, request.args)
+    cur.close()
+    return api_response(body)
+
+@app.route('/api/v1/orders')
+def api_orders():
+    """The logged-in user's orders as compact JSON, like /api/v1/products."""
+    if not (session.get('loggedin') and session.get('role') == 'user'):
+        return api_response({'error': 'login required'}, 401)
+    cur = mysql.connection.cursor(RealDictCursor)
+    body = catalog_api.order_page(cur, session['id'], request.args)
+    cur.close()
+    return api_response(body)
+
 # -------------------- Simple health endpoint --------------------
+# The statistics endpoints show SQL text, replica names and counters: only
+# to a logged-in admin, or with "Authorization: Bearer $OPS_TOKEN" (for
+# Prometheus and monitoring). Without OPS_TOKEN, only admins see them.
+OPS_TOKEN = os.environ.get("OPS_TOKEN", "")
+
+def ops_authorized():
+    if session.get('loggedin') and session.get('is_admin') == 1:
+        return True
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return bool(OPS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), OPS_TOKEN.encode())
+
+def ops_only(view):
+    @wraps(view)
+    def ops_view(*args, **kwargs):
+        if not ops_authorized():
+            return {"error": "forbidden"}, 403
+        return view(*args, **kwargs)
+    return ops_view
+
 @app.route("/_health")
 def _health():
-    return {"status": "ok"}, 200
+    """
+    Liveness by default. With ?ready=1, readiness: a round trip through the
+    pool to the database, failing (503) if that errors, times out waiting
+    for a pooled connection, or takes over HEALTH_MAX_DB_LATENCY_MS.
+    Public, for load balancers; the error and pool details are only shown
+    to ops_authorized() requests.
+    """
+    if not request.args.get('ready'):
+        return {"status": "ok"}, 200
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+    details = ops_authorized()
+    start = time.perf_counter()
+    try:
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+    except PoolTimeoutError:
+        body = {"status": "unavailable", "error": "no free pooled connection"}
+        return ({**body, "pool": pool_stats()} if details else body), 503
+    except Exception as e:
+        body = {"status": "unavailable"}
+        return ({**body, "error": str(e), "pool": pool_stats()} if details else body), 503
+    latency_ms = (time.perf_counter() - start) * 1000
+    ready = latency_ms <= HEALTH_MAX_DB_LATENCY_MS
+    body = {
+        "status": "ok" if ready else "slow",
+        "db_latency_ms": round(latency_ms, 2),
+        "max_db_latency_ms": HEALTH_MAX_DB_LATENCY_MS,
+    }
+    if details:
+        body["pool"] = pool_stats()
+    return body, 200 if ready else 503
+
+@app.route("/_health/pool")
+@ops_only
+def _health_pool():
+    return pool_stats(), 200
+
+@app.route("/_health/cache")
+@ops_only
+def _health_cache():
+    return {**product_cache.stats(), "shared_pages": page_cache.stats() if page_cache else None}, 200
+
+@app.route("/_health/queries")
+@ops_only
+def _health_queries():
+    return queries.stats(), 200
+
+@app.route("/_health/replicas")
+@ops_only
+def _health_replicas():
+    return replica_router.stats(), 200
+
+@app.route("/_health/slow_queries")
+@ops_only
+def _health_slow_queries():
+    return {"threshold_ms": metrics.slow_seconds * 1000, "statements": metrics.slow_statements()}, 200
+
+@app.route("/_metrics")
+@ops_only
+def _metrics():
+    """Prometheus metrics for this worker process."""
+    pool = pool_stats()
+    text = metrics.render({
+        "db_pool_in_use": ("Pooled connections checked out.", pool.get("in_use")),
+        "db_pool_idle": ("Pooled connections idle.", pool.get("idle")),
+        "db_pool_max": ("Pool size limit.", pool["max"]),
+        "db_pool_timeouts": ("Requests that timed out waiting for a connection.", pool["timeouts"]),
+        "cache_catalog_version": ("Catalog version seen by this worker.", product_cache.stats().get("version")),
+        "db_replica_reads": ("Read-only requests served by a replica.",
+                             sum(r["reads"] for r in replica_router.stats()["replicas"])),
+        "db_replica_primary_reads": ("Read-only requests sent to the primary.", replica_router.primary_reads),
+    })
+    return Response(text, mimetype="text/plain; version=0.0.4")
 
 # -------------------- ROUTES (auth / dashboards / products / cart / orders) --------------------
 @app.route('/')
+@shared_page(PAGE_TTL_INDEX)
 def index():
     return render_template('index.html')
 
@@ -147,7 +747,8 @@ def register():
         email = request.form['email']
         password = request.form['password']
         cur = mysql.connection.cursor()
-        cur.execute("INSERT INTO users (username, email, password) VALUES (%s, %s, %s)", (username, email, password))
+        run(cur, queries.CREATE_USER, (username, email, password))
+        incr_counter(cur, 'users')
         mysql.connection.commit()
         cur.close()
         flash("Registration successful! Please login.", "success")
@@ -160,8 +761,7 @@ def login():
         email = request.form['email']
         password = request.form['password']
         cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("SELECT * FROM users WHERE email = %s AND password = %s", (email, password))
-        user = cur.fetchone()
+        user = run(cur, queries.USER_BY_CREDENTIALS, (email, password)).fetchone()
         cur.close()
         if user:
             session['loggedin'] = True
@@ -169,6 +769,11 @@ def login():
             session['username'] = user['username']
             session['role'] = user.get('role', 'user')
             session['is_admin'] = 1 if session['role'] == 'admin' else 0
+            # Merge the cart built before logging in into the user's own cart
+            cur = mysql.connection.cursor()
+            session['cart_id'] = claim_cart(cur, session.get('cart_id'), user['id'])
+            mysql.connection.commit()
+            cur.close()
             return redirect(url_for('admin_dashboard') if session['role'] == 'admin' else url_for('user_dashboard'))
         flash("Incorrect email or password.", "danger")
     return render_template('login.html')
@@ -181,39 +786,43 @@ def logout():
 
 # Dashboards
 @app.route('/user')
+@read_only
 def user_dashboard():
     if session.get('loggedin') and session.get('role') == 'user':
-        cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("SELECT * FROM products")
-        products = cur.fetchall()
-        cur.close()
-        return render_template('user_dashboard.html', username=session['username'], products=products)
+        def render():
+            cur = mysql.connection.cursor(RealDictCursor)
+            products, page = product_page(cur)
+            bought = run(cur, queries.RECENT_PURCHASES, (session['id'], RECENT_PURCHASE_LINES)).fetchall()
+            cur.close()
+            recommended = recommended_products(list(dict.fromkeys(row['product_id'] for row in bought)))
+            return render_template('user_dashboard.html', username=session['username'], products=products,
+                                   page=page, recommended=recommended)
+        return catalog_response(render)
     return redirect(url_for('login'))
 
 @app.route('/admin')
+@read_only
 def admin_dashboard():
     if session.get('loggedin') and session.get('role') == 'admin':
         cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("SELECT COUNT(*) AS total_users FROM users WHERE role='user'")
-        users = cur.fetchone()
-        cur.execute("SELECT COUNT(*) AS total_products FROM products")
-        products = cur.fetchone()
-        cur.execute("SELECT COUNT(*) AS total_orders FROM orders")
-        orders = cur.fetchone()
-        cur.execute("SELECT * FROM products")
-        all_products = cur.fetchall()
+        stats = dashboard_stats(cur)
+        all_products, page = product_page(cur)
         cur.close()
-        return render_template('admin_dashboard.html', users=users, products=products, orders=orders, all_products=all_products)
+        return render_template('admin_dashboard.html', stats=stats, all_products=all_products, page=page)
     return redirect(url_for('login'))
 
 # Products
 @app.route('/products')
+@read_only
+@shared_page(PAGE_TTL_PRODUCTS, params=CATALOG_ARGS)
 def view_products():
-    cur = mysql.connection.cursor(RealDictCursor)
-    cur.execute("SELECT * FROM products")
-    products = cur.fetchall()
-    cur.close()
-    return render_template('products.html', products=products)
+    def render():
+        cur = mysql.connection.cursor(RealDictCursor)
+        products, page = product_page(cur)
+        cur.close()
+        return render_template('products.html', products=products, page=page,
+                               related=related_by_product(products))
+    return catalog_response(render)
 
 @app.route('/add_product', methods=['GET', 'POST'])
 def add_product():
@@ -223,15 +832,15 @@ def add_product():
             description = request.form['description']
             price = request.form['price']
             stock = request.form['stock']
-            file = request.files.get('image')
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            filename = save_product_image(request.files.get('image'))
+            if filename:
                 cur = mysql.connection.cursor()
-                cur.execute("INSERT INTO products (name, description, price, stock, image) VALUES (%s, %s, %s, %s, %s)",
-                            (name, description, price, stock, filename))
+                run(cur, queries.CREATE_PRODUCT, (name, description, price, stock, filename))
+                queue_image_derivatives(cur, filename)
+                incr_counter(cur, 'products')
+                product_cache.bump(cur)
                 mysql.connection.commit()
+                catalog_changed()
                 cur.close()
                 flash("Product added successfully.", "success")
                 return redirect(url_for('admin_products'))
@@ -248,22 +857,19 @@ def edit_product(product_id):
             description = request.form['description']
             price = request.form['price']
             stock = request.form['stock']
-            file = request.files.get('image')
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                cur.execute("UPDATE products SET name=%s, description=%s, price=%s, stock=%s, image=%s WHERE id=%s",
-                            (name, description, price, stock, filename, product_id))
+            filename = save_product_image(request.files.get('image'))
+            if filename:
+                run(cur, queries.UPDATE_PRODUCT_WITH_IMAGE, (name, description, price, stock, filename, product_id))
+                queue_image_derivatives(cur, filename)
             else:
-                cur.execute("UPDATE products SET name=%s, description=%s, price=%s, stock=%s WHERE id=%s",
-                            (name, description, price, stock, product_id))
+                run(cur, queries.UPDATE_PRODUCT, (name, description, price, stock, product_id))
+            product_cache.bump(cur)
             mysql.connection.commit()
+            catalog_changed()
             cur.close()
             flash("Product updated successfully.", "success")
             return redirect(url_for('admin_products'))
-        cur.execute("SELECT * FROM products WHERE id=%s", (product_id,))
-        product = cur.fetchone()
+        product = run(cur, queries.PRODUCT_BY_ID, (product_id,)).fetchone()
         cur.close()
         return render_template('edit_product.html', product=product)
     return redirect(url_for('login'))
@@ -272,32 +878,72 @@ def edit_product(product_id):
 def delete_product(product_id):
     if session.get('loggedin') and session.get('role') == 'admin':
         cur = mysql.connection.cursor()
-        cur.execute("DELETE FROM products WHERE id=%s", (product_id,))
+        run(cur, queries.DELETE_PRODUCT, (product_id,))
+        if cur.rowcount:
+            incr_counter(cur, 'products', -cur.rowcount)
+        product_cache.bump(cur)
         mysql.connection.commit()
+        catalog_changed()
         cur.close()
         flash("Product deleted successfully.", "danger")
         return redirect(url_for('admin_products'))
     return redirect(url_for('login'))
 
 @app.route('/admin_products')
+@read_only
 def admin_products():
     if session.get('loggedin') and session.get('role') == 'admin':
-        cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("SELECT * FROM products")
-        products = cur.fetchall()
-        cur.close()
-        return render_template('admin_products.html', products=products)
+        def render():
+            cur = mysql.connection.cursor(RealDictCursor)
+            products, page = product_page(cur)
+            cur.close()
+            return render_template('admin_products.html', products=products, page=page)
+        return catalog_response(render)
     return redirect(url_for('login'))
 
+@app.route('/admin/import_products', methods=['GET', 'POST'])
+def admin_import_products():
+    if not (session.get('loggedin') and session.get('role') == 'admin'):
+        return redirect(url_for('login'))
+    report = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        mode = request.form.get('mode', 'upsert')
+        if not file or not file.filename or mode not in ('upsert', 'update'):
+            flash("Choose a CSV or NDJSON file and an import mode.", "danger")
+            return redirect(url_for('admin_import_products'))
+        fmt = request.form.get('format') or detect_format(file.filename)
+        cur = mysql.connection.cursor()
+        import psycopg2
+        try:
+            report = import_products(cur, read_rows(text_stream(file.stream), fmt), mode)
+        except (ValueError, UnicodeDecodeError, psycopg2.Error) as e:
+            mysql.connection.rollback()
+            cur.close()
+            flash(f"Import failed: {e}", "danger")
+            return redirect(url_for('admin_import_products'))
+        if report.inserted:
+            incr_counter(cur, 'products', report.inserted)
+        product_cache.bump(cur)
+        mysql.connection.commit()
+        catalog_changed()
+        cur.close()
+        flash(f"Imported {report.rows} rows: {report.inserted} added, {report.updated} updated, "
+              f"{report.error_count} rejected.", "success" if not report.errors else "warning")
+    return render_template('import_products.html', report=report, fields=IMPORT_FIELDS,
+                           max_errors=MAX_REPORTED_ERRORS)
+
 # Cart & orders
 @app.route('/add_to_cart/<int:product_id>')
 def add_to_cart(product_id):
-    if 'cart' not in session:
-        session['cart'] = {}
-    cart = session['cart']
-    cart[str(product_id)] = cart.get(str(product_id), 0) + 1
-    session['cart'] = cart
-    flash("Product added to cart.", "success")
+    cur = mysql.connection.cursor()
+    added = add_item(cur, current_cart_id(cur, create=True), product_id)
+    mysql.connection.commit()
+    cur.close()
+    if added is None:
+        flash("Product not found.", "danger")
+    else:
+        flash("Product added to cart.", "success")
     return redirect(url_for('view_products'))
 
 @app.route('/ajax/add_to_cart', methods=['POST'])
@@ -305,52 +951,71 @@ def ajax_add_to_cart():
     if not session.get('loggedin') or session.get('role') != 'user':
         return jsonify({'status': 'error', 'message': 'Login required'})
     data = request.get_json()
-    product_id = str(data.get('product_id'))
-    quantity = int(data.get('quantity', 1))
-    if 'cart' not in session:
-        session['cart'] = {}
-    cart = session['cart']
-    cart[product_id] = cart.get(product_id, 0) + quantity
-    session['cart'] = cart
-    return jsonify({'status': 'success', 'message': 'Product added to cart'})
+    try:
+        product_id = int(data.get('product_id'))
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid product or quantity'})
+    if quantity < 1:
+        return jsonify({'status': 'error', 'message': 'Invalid product or quantity'})
+    cur = mysql.connection.cursor()
+    added = add_item(cur, current_cart_id(cur, create=True), product_id, quantity)
+    mysql.connection.commit()
+    cur.close()
+    if added is None:
+        return jsonify({'status': 'error', 'message': 'Product not found'})
+    return jsonify({'status': 'success', 'message': 'Product added to cart', 'quantity': added})
 
 @app.route('/cart')
+@read_only
 def view_cart():
-    cart = session.get('cart', {})
-    product_ids = [int(pid) for pid in cart.keys()]
+    cart_id = session.get('cart_id')
+    if cart_id is None and session.get('loggedin'):
+        # Finding the user's cart can write (carts.claim_cart)
+        cur = mysql.primary.cursor()
+        cart_id = current_cart_id(cur)
+        mysql.primary.commit()
+        cur.close()
     cur = mysql.connection.cursor(RealDictCursor)
-    products = []
-    if product_ids:
-        placeholders = ','.join(['%s'] * len(product_ids))
-        cur.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", product_ids)
-        products = cur.fetchall()
+    products = cart_products(cur, cart_id) if cart_id else []
     cur.close()
-    return render_template('cart.html', cart=cart, products=products)
+    recommended = recommended_products([p['id'] for p in products])
+    return render_template('cart.html', products=products, recommended=recommended)
 
 @app.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if not session.get('loggedin') or session.get('role') != 'user':
         return redirect(url_for('login'))
-    cart = session.get('cart', {})
-    if not cart:
-        flash("Your cart is empty.", "warning")
-        return redirect(url_for('view_cart'))
+    cur = mysql.connection.cursor()
+    cart_id = current_cart_id(cur)
     if request.method == 'POST':
         payment_method = request.form['payment_method']
-        cur = mysql.connection.cursor()
-        # PostgreSQL uses RETURNING clause to get the inserted id (no lastrowid)
-        cur.execute("INSERT INTO orders (user_id, payment_method, payment_status) VALUES (%s, %s, %s) RETURNING id",
-                    (session['id'], payment_method, 'Completed'))
-        order_id = cur.fetchone()[0]
-        for pid, qty in cart.items():
-            cur.execute("INSERT INTO order_items (order_id, product_id, quantity) VALUES (%s, %s, %s)",
-                        (order_id, pid, qty))
-            cur.execute("UPDATE products SET stock = stock - %s WHERE id = %s", (qty, pid))
+        try:
+            # Empties the cart in the order's transaction; a rollback restores it
+            cart = take_cart(cur, cart_id)
+            order_id = place_order(cur, session['id'], cart, payment_method)
+            # Rollups and the invoice snapshot, committed (or run inline) with the order
+            enqueue(cur, 'order_placed', {'order_id': order_id}, inline=not BACKGROUND_JOBS)
+        except OutOfStockError as e:
+            mysql.connection.rollback()
+            cur.close()
+            flash(f"{e}. Please update your cart.", "danger")
+            return redirect(url_for('view_cart'))
+        except ValueError:
+            mysql.connection.rollback()
+            cur.close()
+            flash("Your cart is empty.", "warning")
+            return redirect(url_for('view_cart'))
         mysql.connection.commit()
         cur.close()
-        session.pop('cart', None)
         flash("Order placed successfully!", "success")
         return redirect(url_for('order_success', order_id=order_id))
+    empty = cart_is_empty(cur, cart_id)
+    mysql.connection.commit()
+    cur.close()
+    if empty:
+        flash("Your cart is empty.", "warning")
+        return redirect(url_for('view_cart'))
     return render_template('checkout.html')
 
 @app.route('/order_success/<int:order_id>')
@@ -358,100 +1023,80 @@ def order_success(order_id):
     return render_template('order_success.html', order_id=order_id)
 
 @app.route('/orders')
+@read_only
 def user_orders():
     if session.get('loggedin') and session.get('role') == 'user':
         cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("SELECT * FROM orders WHERE user_id = %s", (session['id'],))
-        orders = cur.fetchall()
+        orders = run(cur, queries.ORDERS_BY_USER, (session['id'],)).fetchall()
         cur.close()
         return render_template('orders.html', orders=orders)
     return redirect(url_for('login'))
 
 @app.route('/admin/orders')
+@read_only
 def admin_orders():
     if 'id' in session and session['role'] == 'admin':
+        params = parse_order_history_args(request.args)
         cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("""
-            SELECT 
-                o.id AS order_id,
-                u.email AS user_email,
-                o.order_date,
-                o.payment_method,
-                o.payment_status,
-                p.name AS product_name,
-                oi.quantity,
-                p.price,
-                (p.price * oi.quantity) AS line_total
-            FROM orders o
-            JOIN users u ON o.user_id = u.id
-            JOIN order_items oi ON o.id = oi.order_id
-            JOIN products p ON oi.product_id = p.id
-            ORDER BY o.id DESC
-        """)
-        raw_orders = cur.fetchall()
+        orders, next_cursor = fetch_order_history_page(cur, params)
         cur.close()
 
-        orders = {}
-        for row in raw_orders:
-            oid = row['order_id']
-            if oid not in orders:
-                orders[oid] = {
-                    'order_id': oid,
-                    'user_email': row['user_email'],
-                    'order_date': row['order_date'],
-                    'payment_method': row['payment_method'],
-                    'payment_status': row['payment_status'],
-                    'products': [],
-                    'grand_total': 0
-                }
-            orders[oid]['products'].append({
-                'product_name': row['product_name'],
-                'quantity': row['quantity'],
-                'price': row['price'],
-                'line_total': row['line_total']
-            })
-            orders[oid]['grand_total'] += row['line_total']
-
-        return render_template('admin_orders.html', orders=orders.values())
+        filters = request.args.to_dict()
+        filters.pop('after', None)
+        page = {
+            'filters': filters,
+            'next_url': url_for('admin_orders', after=next_cursor, **filters) if next_cursor else None,
+            'first_url': url_for('admin_orders', **filters) if params['after'] else None,
+        }
+        return render_template('admin_orders.html', orders=orders, page=page)
 
     return redirect(url_for('login'))
 
+@app.route('/admin/export/<kind>.<fmt>')
+@read_only
+def admin_export(kind, fmt):
+    if not (session.get('loggedin') and session.get('role') == 'admin'):
+        return redirect(url_for('login'))
+    if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    params = parse_order_history_args(request.args)
+    chunks = stream_export(mysql.connection, kind, fmt, params['date_from'], params['date_to'])
+    filename = f"{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
 @app.route('/invoice/<int:order_id>')
+@read_only
 def invoice(order_id):
     if not session.get('loggedin'):
         return redirect(url_for('login'))
 
     cur = mysql.connection.cursor(RealDictCursor)
-    cur.execute("""
-        SELECT o.*, u.username, u.email
-        FROM orders o
-        JOIN users u ON o.user_id = u.id
-        WHERE o.id = %s
-    """, (order_id,))
-    order = cur.fetchone()
-
-    invoice_number = f"INV-{order_id:04d}"
-
-    cur.execute("""
-        SELECT p.name, p.price, oi.quantity, (p.price * oi.quantity) AS line_total
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        WHERE oi.order_id = %s
-    """, (order_id,))
-    items = cur.fetchall() or []
+    document = load_invoice(cur, order_id)
     cur.close()
+    if document is None:
+        # Orders from before invoice snapshots, or whose order_placed job has
+        # not run yet, get theirs on first view; written on the primary
+        cur = mysql.primary.cursor(RealDictCursor)
+        if snapshot_invoices(cur, [order_id]):
+            mysql.primary.commit()
+        document = load_invoice(cur, order_id)
+        cur.close()
+    if document is None:
+        abort(404)
 
-    total = sum(item.get('line_total', 0) for item in items)
-
-    return render_template('invoice.html', order=order, items=items, total=total, invoice_number=invoice_number)
+    return render_template('invoice.html', **invoice_context(document))
 
 # Admin user management
 @app.route('/admin/users')
+@read_only
 def admin_users():
     if session.get('loggedin') and session.get('is_admin') == 1:
         cur = mysql.connection.cursor(RealDictCursor)
-        cur.execute("SELECT * FROM users")
-        users = cur.fetchall()
+        users = run(cur, queries.ALL_USERS).fetchall()
         cur.close()
         return render_template('admin_users.html', users=users)
     return redirect(url_for('login'))
@@ -463,13 +1108,12 @@ def edit_user(user_id):
         if request.method == 'POST':
             username = request.form['username']
             email = request.form['email']
-            cur.execute("UPDATE users SET username=%s, email=%s WHERE id=%s", (username, email, user_id))
+            run(cur, queries.UPDATE_USER, (username, email, user_id))
             mysql.connection.commit()
             cur.close()
             flash("User updated successfully.", "success")
             return redirect(url_for('admin_users'))
-        cur.execute("SELECT * FROM users WHERE id=%s", (user_id,))
-        user = cur.fetchone()
+        user = run(cur, queries.USER_BY_ID, (user_id,)).fetchone()
         cur.close()
         return render_template('edit_user.html', user=user)
     return redirect(url_for('login'))
@@ -478,7 +1122,11 @@ def edit_user(user_id):
 def delete_user(user_id):
     if session.get('loggedin') and session.get('is_admin') == 1:
         cur = mysql.connection.cursor()
-        cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
+        # Their orders cascade away with them: take them out of the dashboard totals first
+        forget_user_orders(cur, user_id)
+        deleted = run(cur, queries.DELETE_USER, (user_id,)).fetchone()
+        if deleted and deleted[0] == 'user':
+            incr_counter(cur, 'users', -1)
         mysql.connection.commit()
         cur.close()
         flash("User deleted successfully.", "danger")
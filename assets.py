@@ -0,0 +1,172 @@
+"""
+Fingerprinted static assets and response compression.
+
+build_assets.py copies the files under static/ to static/build/ with a
+content hash in the name (style.css -> build/style.<hash>.css), writes
+.gz (and .br, when the brotli package is installed) variants of text
+assets next to them, and records the mapping in static/build/manifest.json.
+Uploaded product images are left alone: they already get content-hashed
+names (see images.py).
+
+init_assets(app) then:
+
+- resolves url_for('static', filename=...) through the manifest, so
+  templates keep using the source path and the URL changes with the content
+- serves fingerprinted and content-hashed files with
+  Cache-Control: public, max-age=31536000, immutable
+- serves the precompressed variant when the client accepts it
+- compresses HTML/JSON/text responses larger than `min_size` bytes, with
+  the encoding appended to their ETag ("abc" -> "abc-gzip"), since the
+  compressed bytes are a different representation; the suffix is taken off
+  If-None-Match again before the view compares it, so 304s keep working
+
+With no manifest (build_assets.py not run) static URLs are left unchanged.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import re
+
+from flask import g, request, send_from_directory, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 31536000  # one year
+
+# Extensions worth precompressing (images are already compressed)
+COMPRESSIBLE_EXTENSIONS = {'css', 'js', 'svg', 'json', 'txt', 'html', 'xml', 'map', 'ico'}
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'application/json',
+    'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+# Uploaded product images and their derivatives: <16 hex>[-<width>w].<ext>
+CONTENT_HASHED_RE = re.compile(r'^images/products/[0-9a-f]{16}(-\d+w)?\.\w+$')
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# An ETag suffixed by compress_response, in If-None-Match
+ENCODED_ETAG_RE = re.compile(r'-(br|gzip)"')
+
+
+def fingerprint_name(relpath, digest):
+    """'images/logo.JPG' -> 'build/images/logo.<digest>.JPG'"""
+    head, filename = os.path.split(relpath)
+    if '.' in filename:
+        stem, ext = filename.rsplit('.', 1)
+        filename = f"{stem}.{digest}.{ext}"
+    else:
+        filename = f"{filename}.{digest}"
+    return '/'.join(part for part in (BUILD_DIR, head.replace(os.sep, '/'), filename) if part)
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_immutable(filename):
+    return (filename.startswith(BUILD_DIR + '/') and filename != f"{BUILD_DIR}/{MANIFEST}") \
+        or CONTENT_HASHED_RE.match(filename) is not None
+
+
+def _accepted_encoding(available):
+    """Best of `available` encodings the client accepts (br before gzip)."""
+    accept = request.accept_encodings
+    for encoding, _ in ENCODINGS:
+        if encoding in available and accept[encoding]:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level)
+
+
+def init_assets(app, min_size=1400, level=6):
+    """Install the manifest lookup, the static file view and response compression on `app`."""
+    static_folder = app.static_folder
+    manifest = load_manifest(static_folder)
+    app.config['STATIC_MANIFEST'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.get(values['filename'], values['filename'])
+
+    def send_static(filename):
+        path = safe_join(static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        available = {enc for enc, suffix in ENCODINGS if os.path.isfile(path + suffix)}
+        encoding = _accepted_encoding(available) if available else None
+        served = filename + dict(ENCODINGS)[encoding] if encoding else filename
+        immutable = is_immutable(filename)
+        response = send_from_directory(
+            static_folder, served,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            max_age=IMMUTABLE_MAX_AGE if immutable else None,
+        )
+        if encoding:
+            # send_from_directory's ETag is that of the served .br/.gz file,
+            # so each variant already has its own
+            response.headers['Content-Encoding'] = encoding
+        if available:
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = send_static
+
+    @app.before_request
+    def strip_encoded_etags():
+        # Views compare If-None-Match with the ETag of the uncompressed body
+        header = request.environ.get('HTTP_IF_NONE_MATCH')
+        if header and request.endpoint != 'static':
+            match = ENCODED_ETAG_RE.search(header)
+            if match:
+                g.etag_encoding = match.group(1)
+                request.environ['HTTP_IF_NONE_MATCH'] = ENCODED_ETAG_RE.sub('"', header)
+
+    def encode_etag(response, encoding):
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304:
+            # Answer with the tag the client holds
+            if g.get('etag_encoding'):
+                encode_etag(response, g.etag_encoding)
+                response.vary.add('Accept-Encoding')
+            return response
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code == 204
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _accepted_encoding({'br', 'gzip'} if brotli else {'gzip'})
+        if encoding:
+            response.set_data(compress(data, encoding, level))
+            response.headers['Content-Encoding'] = encoding
+            encode_etag(response, encoding)
+        return response
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Checkout concurrency stress test.
+
+Runs many parallel buyers through the checkout transaction
+(orders.place_order + stats.record_order) on a small set of
+scarce products, then checks that no product was oversold (stock never
+negative, units sold + remaining == starting stock) and reports throughput.
+
+    DATABASE_URL=postgresql://... python bench/checkout_stress.py --buyers 64 --orders 20
+
+The test creates its own user and products and removes them afterwards.
+Exits non-zero if any oversell is detected.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from orders import place_order, OutOfStockError  # noqa: E402
+from stats import incr_counter, record_order  # noqa: E402
+
+
+def setup(conn, n_products, stock):
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (username, email, password) VALUES (%s, %s, %s) RETURNING id",
+                ("stress", f"stress-{os.getpid()}-{time.time()}@example.com", "x"))
+    user_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO products (name, description, price, stock, image)
+        SELECT 'stress-' || g, 'checkout stress test product', 10 + g, %s, 'stress.jpg'
+        FROM generate_series(1, %s) AS g
+        RETURNING id
+    """, (stock, n_products))
+    product_ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return user_id, product_ids
+
+
+def teardown(conn, user_id, product_ids):
+    cur = conn.cursor()
+    # Take the test's orders back out of the dashboard statistics
+    cur.execute("""
+        SELECT COUNT(DISTINCT o.id), COALESCE(SUM(oi.quantity * oi.price_at_time), 0)
+        FROM orders o JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.user_id = %s
+    """, (user_id,))
+    n_orders, revenue = cur.fetchone()
+    incr_counter(cur, 'orders', -n_orders)
+    incr_counter(cur, 'revenue', -revenue)
+    cur.execute("DELETE FROM sales_daily WHERE product_id = ANY(%s)", (product_ids,))
+    cur.execute("DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE user_id = %s)", (user_id,))
+    cur.execute("DELETE FROM orders WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM products WHERE id = ANY(%s)", (product_ids,))
+    cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+    conn.commit()
+
+
+def buyer(dsn, user_id, product_ids, n_orders, max_lines, results, lock):
+    conn = psycopg2.connect(dsn)
+    rng = random.Random()
+    placed = rejected = 0
+    latencies = []
+    for _ in range(n_orders):
+        lines = rng.sample(product_ids, rng.randint(1, min(max_lines, len(product_ids))))
+        cart = {str(pid): rng.randint(1, 3) for pid in lines}
+        cur = conn.cursor()
+        start = time.perf_counter()
+        try:
+            order_id = place_order(cur, user_id, cart, 'Stress')
+            record_order(cur, order_id)
+            conn.commit()
+            placed += 1
+        except OutOfStockError:
+            conn.rollback()
+            rejected += 1
+        latencies.append(time.perf_counter() - start)
+        cur.close()
+    conn.close()
+    with lock:
+        results['placed'] += placed
+        results['rejected'] += rejected
+        results['latencies'].extend(latencies)
+
+
+def check_oversell(conn, user_id, product_ids, stock):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT p.id, p.stock, COALESCE(SUM(oi.quantity), 0)
+        FROM products p
+        LEFT JOIN order_items oi ON oi.product_id = p.id
+        WHERE p.id = ANY(%s)
+        GROUP BY p.id, p.stock
+    """, (product_ids,))
+    problems = []
+    for pid, remaining, sold in cur.fetchall():
+        if remaining < 0 or remaining + sold != stock:
+            problems.append((pid, remaining, sold))
+    cur.execute("SELECT COUNT(*) FROM order_items WHERE price_at_time IS NULL AND order_id IN "
+                "(SELECT id FROM orders WHERE user_id = %s)", (user_id,))
+    missing_prices = cur.fetchone()[0]
+    conn.rollback()
+    return problems, missing_prices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=64, help="parallel buyers (default 64)")
+    parser.add_argument("--orders", type=int, default=20, help="checkouts attempted per buyer")
+    parser.add_argument("--products", type=int, default=8, help="number of contended products")
+    parser.add_argument("--stock", type=int, default=200, help="starting stock per product")
+    parser.add_argument("--max-lines", type=int, default=4, help="max distinct products per cart")
+    args = parser.parse_args()
+
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+
+    admin = psycopg2.connect(dsn)
+    user_id, product_ids = setup(admin, args.products, args.stock)
+    results = {'placed': 0, 'rejected': 0, 'latencies': []}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=buyer, args=(dsn, user_id, product_ids, args.orders, args.max_lines, results, lock))
+        for _ in range(args.buyers)
+    ]
+    try:
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        problems, missing_prices = check_oversell(admin, user_id, product_ids, args.stock)
+    finally:
+        teardown(admin, user_id, product_ids)
+        admin.close()
+
+    lat = sorted(results['latencies'])
+    attempts = len(lat)
+    print(f"buyers={args.buyers} attempts={attempts} placed={results['placed']} "
+          f"rejected_out_of_stock={results['rejected']}")
+    print(f"elapsed={elapsed:.2f}s throughput={attempts / elapsed:.1f} checkouts/s "
+          f"p50={lat[attempts // 2] * 1000:.1f}ms p99={lat[int(attempts * 0.99) - 1] * 1000:.1f}ms")
+    if problems or missing_prices:
+        for pid, remaining, sold in problems:
+            print(f"OVERSELL product={pid} remaining={remaining} sold={sold} start={args.stock}")
+        if missing_prices:
+            print(f"{missing_prices} order items without price_at_time")
+        sys.exit(1)
+    print("OK: no oversell")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the "frequently bought together" builder (recommendations.py).
+
+Generates --lines synthetic order lines (default a million) in memory,
+with one to six lines per order and Zipf product popularity like
+bench/seed.py, and a planted companion for every product that is added to
+some of the orders containing it. Then it times:
+
+- the full build: counting the lines in batches of whole orders, as read
+  from the server-side cursor, and the top-K of every product;
+- saving and loading the state file;
+- an incremental run over the last --new-orders orders, held back from
+  the full build;
+- serving: looking up and merging the stored lists for random three-item
+  carts, as the cart page does from its cached rows.
+
+It checks that the planted companion ranks in the top K of the products
+whose companion was planted at least ten times, and exits non-zero if
+fewer than 90% do.
+
+    python bench/recommendations_bench.py
+    python bench/recommendations_bench.py --lines 5000000 --products 100000
+
+With --database, also runs build_recommendations against DATABASE_URL
+(seed it with bench/seed.py first): a full build, an incremental run, and
+primary-key lookups of the stored rows.
+
+Needs NumPy and SciPy (pip install -r requirements-builder.txt).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import recommendations  # noqa: E402
+from recommendations import CoOccurrence  # noqa: E402
+
+# Lines per order (1..6), as in bench/seed.py
+LINES_WEIGHTS = [40, 25, 15, 10, 6, 4]
+COMPANION_RATE = 0.3  # share of an order's later lines replaced by its first product's companion
+MIN_RECALL = 0.9
+
+
+def generate(n_lines, n_products, seed):
+    """
+    (order_ids, product_ids, companion, planted) for about n_lines lines,
+    orders numbered from 1; planted[p] counts the lines of p's companion added.
+    """
+    np = recommendations.np
+    rng = np.random.default_rng(seed)
+    weights = np.array(LINES_WEIGHTS, dtype=np.float64)
+    mean = (weights * np.arange(1, len(weights) + 1)).sum() / weights.sum()
+    sizes = rng.choice(np.arange(1, len(weights) + 1), size=int(n_lines / mean * 1.1) + 1, p=weights / weights.sum())
+    sizes = sizes[:int(np.searchsorted(np.cumsum(sizes), n_lines)) + 1]
+    order_ids = np.repeat(np.arange(1, len(sizes) + 1), sizes)
+
+    popularity = 1 / np.arange(1, n_products + 1) ** 1.1
+    ranked = rng.permutation(np.arange(1, n_products + 1))  # popular products are not simply the low ids
+    product_ids = rng.choice(ranked, size=len(order_ids), p=popularity / popularity.sum())
+
+    companion = np.zeros(n_products + 1, dtype=np.int64)
+    companion[1:] = rng.permutation(np.arange(1, n_products + 1))
+    firsts = np.r_[0, np.cumsum(sizes)[:-1]]
+    first_product = np.repeat(product_ids[firsts], sizes)
+    planted = (rng.random(len(order_ids)) < COMPANION_RATE) & (np.arange(len(order_ids)) != np.repeat(firsts, sizes))
+    product_ids[planted] = companion[first_product[planted]]
+    planted_counts = np.bincount(first_product[planted], minlength=n_products + 1)
+    return order_ids, product_ids.astype(np.int64), companion, planted_counts
+
+
+def batches(order_ids, product_ids, size):
+    """Whole-order batches of about `size` lines, like recommendations.stream_orders."""
+    np = recommendations.np
+    start = 0
+    while start < len(order_ids):
+        end = min(start + size, len(order_ids))
+        if end < len(order_ids):
+            end = int(np.searchsorted(order_ids, order_ids[end], side="left"))
+            if end <= start:
+                end = int(np.searchsorted(order_ids, order_ids[start], side="right"))
+        yield order_ids[start:end], product_ids[start:end]
+        start = end
+
+
+def timed(label, fn, results):
+    started = time.perf_counter()
+    value = fn()
+    results.append((label, time.perf_counter() - started))
+    return value
+
+
+def merge(stored, cart, limit=4):
+    """The cart page's merge of stored lists (app.recommended_products), on in-memory rows."""
+    totals = {}
+    for pid in cart:
+        for related, score in stored.get(pid, ()):
+            totals[related] = totals.get(related, 0.0) + score
+    for pid in cart:
+        totals.pop(pid, None)
+    return sorted(totals, key=lambda pid: (-totals[pid], pid))[:limit]
+
+
+def bench_memory(args):
+    np = recommendations.np
+    results = []
+    order_ids, product_ids, companion, planted = timed(
+        "generate", lambda: generate(args.lines, args.products, args.seed), results)
+    n_orders = int(order_ids[-1])
+    held = int(np.searchsorted(order_ids, n_orders - args.new_orders + 1))
+    print(f"{len(order_ids)} lines in {n_orders} orders over {args.products} products; "
+          f"last {args.new_orders} orders ({len(order_ids) - held} lines) held back for the incremental run")
+
+    co = CoOccurrence()
+
+    def count():
+        for o, p in batches(order_ids[:held], product_ids[:held], recommendations.BATCH_LINES):
+            co.add_orders(o, p)
+    timed("full build: count", count, results)
+    rows = timed("full build: top-k of every product",
+                 lambda: co.top_k(co.products(), args.top, args.min_support), results)
+
+    state = os.path.join(tempfile.mkdtemp(), "recommendations.npz")
+    timed("state file: save", lambda: co.save(state), results)
+    co = timed("state file: load", lambda: CoOccurrence.load(state), results)
+    size = os.path.getsize(state)
+
+    def incremental():
+        touched = co.add_orders(order_ids[held:], product_ids[held:])
+        return co.top_k(touched, args.top, args.min_support), touched
+    new_rows, touched = timed("incremental: count + top-k of touched products", incremental, results)
+
+    stored = {pid: tuple(zip(related, scores)) for pid, related, scores in rows}
+    stored.update({pid: tuple(zip(related, scores)) for pid, related, scores in new_rows})
+    rng = random.Random(args.seed)
+    carts = [rng.sample(range(1, args.products + 1), 3) for _ in range(args.lookups)]
+    timed(f"serving: {args.lookups} three-item carts", lambda: [merge(stored, cart) for cart in carts], results)
+
+    # Companions planted often enough to stand out
+    judged = [pid for pid in stored if planted[pid] >= 10]
+    found = sum(1 for pid in judged if companion[pid] in (r for r, _ in stored[pid]))
+    recall = found / len(judged) if judged else 1.0
+
+    print()
+    for label, seconds in results:
+        print(f"  {label:<48} {seconds * 1000:>10.1f} ms")
+    per_lookup = results[-1][1] / args.lookups * 1e6
+    print(f"\n  co-occurrence pairs {co.matrix.nnz}, products with recommendations {len(stored)}, "
+          f"touched by the new orders {len(touched)}")
+    print(f"  state file {size / 1e6:.1f} MB; serving {per_lookup:.1f} µs per cart")
+    print(f"  planted companion in the top {args.top}: {found}/{len(judged)} ({recall:.1%})")
+    return recall
+
+
+def bench_database(args):
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    import queries
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+    conn = psycopg2.connect(database_url, sslmode="require") if "supabase" in database_url \
+        else psycopg2.connect(database_url)
+    state = os.path.join(tempfile.mkdtemp(), "recommendations.npz")
+    try:
+        print("\nDatabase:")
+        for full in (True, False):
+            summary = recommendations.build(conn, state, full=full, k=args.top, min_support=args.min_support,
+                                            log=lambda msg: None)
+            print(f"  {summary['mode']:<12} {summary['orders']:>9} orders {summary['lines']:>9} lines "
+                  f"{summary['products']:>7} products  {summary['seconds']:.2f}s")
+        cur = conn.cursor(RealDictCursor)
+        cur.execute("SELECT product_id FROM product_recommendations")
+        ids = [row["product_id"] for row in cur.fetchall()]
+        if not ids:
+            print("  no recommendations stored: seed orders with bench/seed.py first")
+            return
+        rng = random.Random(args.seed)
+        latencies = []
+        for _ in range(args.lookups):
+            started = time.perf_counter()
+            queries.run(cur, queries.RELATED_PRODUCTS, (rng.sample(ids, min(3, len(ids))),)).fetchall()
+            latencies.append(time.perf_counter() - started)
+        conn.rollback()
+        cur.close()
+        latencies.sort()
+        print(f"  lookup of three products: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1000000, help="order lines to generate (default 1000000)")
+    parser.add_argument("--products", type=int, default=20000, help="distinct products (default 20000)")
+    parser.add_argument("--new-orders", type=int, default=5000,
+                        help="orders held back for the incremental run (default 5000)")
+    parser.add_argument("--top", type=int, default=recommendations.TOP_K)
+    parser.add_argument("--min-support", type=int, default=recommendations.MIN_SUPPORT)
+    parser.add_argument("--lookups", type=int, default=10000, help="serving lookups to time (default 10000)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database", action="store_true", help="also build and look up against DATABASE_URL")
+    args = parser.parse_args()
+
+    if recommendations.np is None:
+        print("ERROR: needs NumPy and SciPy: pip install -r requirements-builder.txt")
+        sys.exit(1)
+    recall = bench_memory(args)
+    if args.database:
+        bench_database(args)
+    if recall < MIN_RECALL:
+        print(f"❌ planted companions found for under {MIN_RECALL:.0%} of products")
+        sys.exit(1)
+    print("✅ Recommendations benchmark passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Read-routing check against a primary and a streaming replica.
+
+Runs the in-process app with DATABASE_URL as the primary and
+DATABASE_REPLICA_URLS as its replicas, places orders through /checkout
+and opens /orders and the invoice straight after each one. Every order
+must be visible at once (read-your-writes), and after the first rounds
+the read-only routes must have been served by a replica.
+
+With --pause-replay the replica's WAL replay is paused for the second
+half of the rounds (needs a superuser on the replica): its lag grows
+past REPLICA_MAX_LAG, reads must fall back to the primary, and the
+orders must still show up.
+
+    DATABASE_URL=postgresql://localhost:5432/retail \\
+    DATABASE_REPLICA_URLS=postgresql://localhost:5433/retail \\
+        python bench/replica_check.py --rounds 20 --pause-replay
+
+A replica for local testing:
+    pg_basebackup -h localhost -p 5432 -D /tmp/replica -R -X stream
+    postgres -D /tmp/replica -p 5433
+
+The check creates its own user and product and removes them afterwards.
+Exits non-zero on any failure.
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup(conn):
+    cur = conn.cursor()
+    email = f"replica-{os.getpid()}-{time.time()}@example.com"
+    cur.execute("INSERT INTO users (username, email, password) VALUES (%s, %s, %s) RETURNING id",
+                ("replica-check", email, "x"))
+    user_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO products (name, description, price, stock, image)
+        VALUES ('replica-check', 'read routing check product', 1, 1000000, 'replica.jpg')
+        RETURNING id
+    """)
+    product_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return user_id, email, product_id
+
+
+def cleanup(conn, user_id, product_id):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+    cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
+    conn.commit()
+    cur.close()
+
+
+def set_replay_paused(replica_url, paused):
+    conn = psycopg2.connect(replica_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT pg_wal_replay_pause()" if paused else "SELECT pg_wal_replay_resume()")
+    conn.close()
+
+
+def place_and_read(client, product_id):
+    """One checkout followed by the reads; returns a list of failures."""
+    resp = client.post("/ajax/add_to_cart", json={"product_id": product_id, "quantity": 1})
+    if resp.get_json().get("status") != "success":
+        return [f"add to cart: {resp.get_json()}"]
+    resp = client.post("/checkout", data={"payment_method": "Card"})
+    if resp.status_code != 302 or "/order_success/" not in resp.headers.get("Location", ""):
+        return [f"checkout: HTTP {resp.status_code}"]
+    order_id = int(resp.headers["Location"].rstrip("/").rsplit("/", 1)[1])
+    failures = []
+    resp = client.get("/orders")
+    if f"<strong>Order ID:</strong> {order_id}<" not in resp.get_data(as_text=True):
+        failures.append(f"order {order_id} missing from /orders right after checkout")
+    resp = client.get(f"/invoice/{order_id}")
+    if resp.status_code != 200:
+        failures.append(f"invoice {order_id}: HTTP {resp.status_code}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--pause-replay", action="store_true",
+                        help="pause WAL replay on the first replica for the second half of the rounds")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    replica_urls = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    if not database_url or not replica_urls:
+        print("ERROR: set DATABASE_URL (primary) and DATABASE_REPLICA_URLS")
+        sys.exit(1)
+    # Orders, not the job queue, are under test: run post-checkout work inline
+    os.environ.setdefault("BACKGROUND_JOBS", "False")
+    os.environ.setdefault("REPLICA_MAX_LAG", "1")
+    from app import app, replica_router
+
+    conn = psycopg2.connect(database_url)
+    user_id, email, product_id = setup(conn)
+    failures = []
+    paused = False
+    try:
+        client = app.test_client()
+        resp = client.post("/login", data={"email": email, "password": "x"})
+        if resp.status_code != 302:
+            print(f"ERROR: login failed with HTTP {resp.status_code}")
+            sys.exit(1)
+        for i in range(args.rounds):
+            if args.pause_replay and not paused and i >= args.rounds // 2:
+                before = replica_router.primary_reads
+                set_replay_paused(replica_urls[0], True)
+                paused = True
+                time.sleep(replica_router.max_lag + replica_router.check_interval + 0.5)
+            failures.extend(place_and_read(client, product_id))
+            if i == args.rounds // 2 - 1:
+                stats = replica_router.stats()
+                if not any(r["reads"] for r in stats["replicas"]):
+                    failures.append(f"no reads were served by a replica: {stats['replicas']}")
+        if paused and replica_router.primary_reads == before:
+            failures.append("reads kept going to the replica while its replay was paused")
+    finally:
+        if paused:
+            set_replay_paused(replica_urls[0], False)
+        cleanup(conn, user_id, product_id)
+        conn.close()
+
+    stats = replica_router.stats()
+    for r in stats["replicas"]:
+        print(f"  {r['name']:<40} reads {r['reads']:>5}  lag {r['lag']}  {r['error'] or ''}")
+    print(f"  {'primary':<40} reads {stats['primary_reads']:>5}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"✅ {args.rounds} orders visible straight after checkout.")
+
+
+if __name__ == "__main__":
+    main()
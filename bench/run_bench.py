@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Route benchmark: throughput, latency percentiles and queries per request.
+
+Drives each route with --concurrency logged-in clients, each with its own
+session, and reports requests/s, p50/p95/p99 latency and the number of SQL
+statements a request runs. Seed data first with bench/seed.py; the
+clients log in as its bench users and bench admin.
+
+    python bench/seed.py --users 2000
+    python bench/run_bench.py                                 # in-process WSGI app, DATABASE_URL
+    python bench/run_bench.py --url http://127.0.0.1:8000     # running gunicorn, same DATABASE_URL
+    python bench/run_bench.py --sqlite bench.db               # products, cart and invoice only, see below
+    python bench/run_bench.py --routes products,cart --concurrency 16 --requests 400
+    python bench/run_bench.py --compare bench/results/before.json
+
+Results are written as JSON (--output, default bench/results/<time>.json).
+--compare prints the change against an earlier results file and exits 1 if
+any route's p95 latency or queries per request got worse by more than
+--tolerance.
+
+Queries per request come from the app's Server-Timing header, which is
+off by default: the in-process app is started with SERVER_TIMING=true,
+and a server given with --url needs it set too, or they are null.
+
+With --sqlite, there is no web app: the database code behind a route's
+view (catalog.fetch_product_page, carts.cart_products,
+invoices.load_invoice) is timed directly, with the same --concurrency
+threads, each on its own connect_sqlite() connection. Only the products,
+cart and invoice routes run there; the others use
+PostgreSQL-only SQL and are reported as skipped. The bench cart and the
+sampled orders' invoices (invoices.snapshot_invoices) are written first,
+untimed.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from seed import BENCH_ADMIN_EMAIL, BENCH_USER_EMAIL, BENCH_PASSWORD, BENCH_EMAIL_PATTERN, BENCH_SKU_PATTERN  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+CART_LINES = 3
+
+
+# -------------------- Clients --------------------
+_QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def queries_from(server_timing):
+    """Statement count from the app's Server-Timing header, or None if it is missing."""
+    match = _QUERIES_RE.search(server_timing or "")
+    return int(match.group(1)) if match else None
+
+
+class InProcessClient:
+    """A Flask test client with its own cookie jar; requests run in this thread."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json_body=None):
+        resp = self.client.open(path, method=method, data=data, json=json_body)
+        resp.close()
+        return resp.status_code, queries_from(resp.headers.get("Server-Timing"))
+
+
+class HttpClient:
+    """urllib client with a cookie jar; redirects are returned, not followed, like the test client."""
+
+    def __init__(self, base_url):
+        import http.cookiejar
+        import urllib.request
+
+        class NoRedirect(urllib.request.HTTPRedirectHandler):
+            def redirect_request(self, *args, **kwargs):
+                return None
+
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None, json_body=None):
+        import urllib.error
+        import urllib.parse
+        import urllib.request
+        body, headers = None, {}
+        if json_body is not None:
+            body, headers["Content-Type"] = json.dumps(json_body).encode(), "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                resp.read()
+                return resp.status, queries_from(resp.headers.get("Server-Timing"))
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, queries_from(e.headers.get("Server-Timing"))
+
+
+# -------------------- Routes --------------------
+# Each route: (who, prepare, request). `prepare(client, ctx, rng)` runs
+# untimed before every request, e.g. filling the cart before a checkout;
+# `request(ctx, rng)` returns (method, path, form data, json body).
+def _fill_cart(client, ctx, rng):
+    for product_id in rng.sample(ctx["product_ids"], CART_LINES):
+        client.request("POST", "/ajax/add_to_cart", json_body={"product_id": product_id, "quantity": 1})
+
+
+ROUTES = {
+    "products": ("user", None, lambda ctx, rng: ("GET", f"/products?sort={rng.choice(['id', 'name', 'price'])}",
+                                                 None, None)),
+    "user": ("user", None, lambda ctx, rng: ("GET", "/user", None, None)),
+    "cart": ("user", None, lambda ctx, rng: ("GET", "/cart", None, None)),
+    "ajax_add_to_cart": ("user", None, lambda ctx, rng: (
+        "POST", "/ajax/add_to_cart", None, {"product_id": rng.choice(ctx["product_ids"]), "quantity": 1})),
+    "checkout": ("user", _fill_cart, lambda ctx, rng: ("POST", "/checkout", {"payment_method": "Card"}, None)),
+    "admin_orders": ("admin", None, lambda ctx, rng: ("GET", "/admin/orders", None, None)),
+    "invoice": ("user", None, lambda ctx, rng: ("GET", f"/invoice/{rng.choice(ctx['order_ids'])}", None, None)),
+}
+
+
+def _values(row):
+    """Row as a tuple, from psycopg2 (tuples) or connect_sqlite (dicts)."""
+    return tuple(row.values()) if isinstance(row, dict) else row
+
+
+def load_context(conn, sample=2000):
+    """Ids of the seeded data the routes pick from."""
+    cur = conn.cursor()
+    mark = "?" if type(conn).__module__ == "sqlite3" else "%s"
+    cur.execute(f"SELECT id FROM products WHERE sku LIKE {mark} AND stock > 0 ORDER BY id", (BENCH_SKU_PATTERN,))
+    product_ids = [_values(row)[0] for row in cur.fetchall()]
+    cur.execute(f"""
+        SELECT o.id FROM orders o JOIN users u ON u.id = o.user_id
+        WHERE u.email LIKE {mark} ORDER BY o.id DESC LIMIT {int(sample)}
+    """, (BENCH_EMAIL_PATTERN,))
+    order_ids = [_values(row)[0] for row in cur.fetchall()]
+    cur.execute(f"SELECT COUNT(*) FROM users WHERE email LIKE {mark} AND role = 'user'", (BENCH_EMAIL_PATTERN,))
+    n_users = _values(cur.fetchone())[0]
+    cur.close()
+    if not product_ids or not order_ids or not n_users:
+        print("ERROR: no benchmark data; run bench/seed.py first")
+        sys.exit(1)
+    return {"product_ids": product_ids, "order_ids": order_ids, "users": n_users}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values), max(1, math.ceil(p / 100 * len(sorted_values)))) - 1
+    return sorted_values[k]
+
+
+def summarize(latencies, statuses, query_counts, errors, elapsed):
+    lat = sorted(seconds * 1000 for seconds in latencies)
+    return {
+        "requests": len(lat),
+        "errors": errors,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(lat) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(lat), 2) if lat else None,
+            "p50": round(percentile(lat, 50), 2) if lat else None,
+            "p95": round(percentile(lat, 95), 2) if lat else None,
+            "p99": round(percentile(lat, 99), 2) if lat else None,
+            "max": round(lat[-1], 2) if lat else None,
+        },
+        "queries_per_request": round(statistics.fmean(query_counts), 2) if query_counts else None,
+    }
+
+
+def run_route(name, make_client, ctx, concurrency, n_requests, warmup, seed_value):
+    """Run one route with `concurrency` clients, `n_requests` timed requests in total."""
+    who, prepare, build = ROUTES[name]
+    per_client = [n_requests // concurrency + (1 if i < n_requests % concurrency else 0) for i in range(concurrency)]
+    clients = [make_client(who, i) for i in range(concurrency)]
+    lock = threading.Lock()
+    latencies, query_counts, statuses = [], [], {}
+    errors = [0]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(i):
+        client, rng = clients[i], random.Random(seed_value * 1000 + i)
+        local_lat, local_q, local_status, local_errors = [], [], {}, 0
+        for _ in range(warmup):
+            if prepare:
+                prepare(client, ctx, rng)
+            method, path, data, body = build(ctx, rng)
+            client.request(method, path, data, body)
+        barrier.wait()
+        for _ in range(per_client[i]):
+            if prepare:
+                prepare(client, ctx, rng)
+            method, path, data, body = build(ctx, rng)
+            start = time.perf_counter()
+            try:
+                status, n_queries = client.request(method, path, data, body)
+            except Exception as e:
+                local_errors += 1
+                local_status["exception"] = local_status.get("exception", 0) + 1
+                print(f"⚠️ {name}: {method} {path} failed: {e}")
+                continue
+            local_lat.append(time.perf_counter() - start)
+            local_status[status] = local_status.get(status, 0) + 1
+            if status >= 500:
+                local_errors += 1
+            if n_queries is not None:
+                local_q.append(n_queries)
+        with lock:
+            latencies.extend(local_lat)
+            query_counts.extend(local_q)
+            errors[0] += local_errors
+            for code, n in local_status.items():
+                statuses[code] = statuses.get(code, 0) + n
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return summarize(latencies, statuses, query_counts, errors[0], time.perf_counter() - start)
+
+
+def web_client_factory(new_client, ctx):
+    """Returns make_client(who, i): a new client logged in as bench user i, or as the bench admin."""
+    def make_client(who, i):
+        client = new_client()
+        email = BENCH_ADMIN_EMAIL if who == "admin" else BENCH_USER_EMAIL.format(i % ctx["users"] + 1)
+        status, _ = client.request("POST", "/login", {"email": email, "password": BENCH_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"login as {email} failed with HTTP {status}")
+        if who == "user":
+            _fill_cart(client, ctx, random.Random(i))
+        return client
+    return make_client
+
+
+# -------------------- SQLite (database code only) --------------------
+# Routes whose database code also runs on connect_sqlite(); the rest
+# (the dashboard's recommendations, cart writes, checkout, the admin order
+# history) use PostgreSQL-only SQL.
+SQLITE_CART = "bench-cart"
+
+
+def sqlite_setup(conn, ctx):
+    """Untimed fixtures: a filled bench cart and the invoices of the sampled orders."""
+    from invoices import snapshot_invoices
+
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO carts (id) VALUES (?)", (SQLITE_CART,))
+    for product_id in ctx["product_ids"][:CART_LINES]:
+        cur.execute("INSERT OR IGNORE INTO cart_items (cart_id, product_id, quantity) VALUES (?, ?, 1)",
+                    (SQLITE_CART, product_id))
+    snapshot_invoices(cur, ctx["order_ids"])
+    conn.commit()
+    cur.close()
+
+
+def sqlite_routes(ctx):
+    """The database work of each route's view, as callables taking (cursor, rng)."""
+    from carts import cart_products
+    from catalog import parse_catalog_args, fetch_product_page
+    from invoices import load_invoice, invoice_context
+
+    def products(cur, rng):
+        fetch_product_page(cur, parse_catalog_args({"sort": rng.choice(["id", "name", "price"])}))
+
+    def cart(cur, rng):
+        cart_products(cur, SQLITE_CART)
+
+    def invoice(cur, rng):
+        invoice_context(load_invoice(cur, rng.choice(ctx["order_ids"])))
+
+    return {"products": products, "cart": cart, "invoice": invoice}
+
+
+def run_sqlite_route(name, fn, path, ctx, concurrency, n_requests, warmup, seed_value):
+    """Like run_route: `concurrency` threads, each on its own connect_sqlite() connection."""
+    from queries import connect_sqlite
+
+    per_client = [n_requests // concurrency + (1 if i < n_requests % concurrency else 0) for i in range(concurrency)]
+    conns = [connect_sqlite(path) for _ in range(concurrency)]
+    lock = threading.Lock()
+    latencies, query_counts = [], []
+    errors = [0]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(i):
+        cur, rng = conns[i].cursor(), random.Random(seed_value * 1000 + i)
+        local_lat, local_errors = [], 0
+        for _ in range(warmup):
+            fn(cur, rng)
+        barrier.wait()
+        for _ in range(per_client[i]):
+            start = time.perf_counter()
+            try:
+                fn(cur, rng)
+            except Exception as e:
+                local_errors += 1
+                print(f"⚠️ {name}: {e}")
+                continue
+            local_lat.append(time.perf_counter() - start)
+        cur.close()
+        with lock:
+            latencies.extend(local_lat)
+            query_counts.extend([1] * len(local_lat))
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    for conn in conns:
+        conn.close()
+    return summarize(latencies, {}, query_counts, errors[0], elapsed)
+
+
+def run_sqlite(path, routes, concurrency, n_requests, warmup, seed_value):
+    from queries import connect_sqlite
+
+    conn = connect_sqlite(path)
+    ctx = load_context(conn)
+    sqlite_setup(conn, ctx)
+    conn.close()
+    workloads = sqlite_routes(ctx)
+    results = {}
+    for name in routes:
+        fn = workloads.get(name)
+        if fn is None:
+            results[name] = {"skipped": "PostgreSQL only"}
+            continue
+        results[name] = run_sqlite_route(name, fn, path, ctx, concurrency, n_requests, warmup, seed_value)
+        print(f"ℹ️ {name}: {results[name]['throughput_rps']} req/s")
+    return results
+
+
+# -------------------- Reporting --------------------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(results):
+    print(f"{'route':<18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for name, r in results.items():
+        if "skipped" in r:
+            print(f"{name:<18} skipped ({r['skipped']})")
+            continue
+        lat, q = r["latency_ms"], r["queries_per_request"]
+        print(f"{name:<18} {r['throughput_rps']:>8} {lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8} "
+              f"{'-' if q is None else q:>8} {r['errors']:>7}")
+
+
+def compare(baseline, results, tolerance):
+    """Print per-route changes against `baseline`; return the regressions."""
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('revision')} ({baseline['meta'].get('started')}):")
+    for name, r in results.items():
+        old = baseline["routes"].get(name)
+        if not old or "skipped" in r or "skipped" in old:
+            continue
+        changes = []
+        for label, new_value, old_value in [
+            ("req/s", r["throughput_rps"], old["throughput_rps"]),
+            ("p95", r["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            ("queries", r["queries_per_request"], old["queries_per_request"]),
+        ]:
+            if new_value is None or not old_value:
+                continue
+            change = new_value / old_value - 1
+            changes.append(f"{label} {old_value} -> {new_value} ({change:+.0%})")
+            if label != "req/s" and change > tolerance:
+                regressions.append(f"{name}: {label} {old_value} -> {new_value}")
+        print(f"  {name:<18} " + ", ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default=",".join(ROUTES), help=f"comma-separated (default: {','.join(ROUTES)})")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel clients per route (default 8)")
+    parser.add_argument("--requests", type=int, default=400, help="timed requests per route (default 400)")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed requests per client first (default 3)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="benchmark a running server (e.g. gunicorn) instead of the in-process app")
+    parser.add_argument("--sqlite", metavar="PATH", help="time the query layer on a SQLite database")
+    parser.add_argument("--output", help="results file (default: bench/results/<time>.json)")
+    parser.add_argument("--compare", metavar="RESULTS", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p95 / queries increase with --compare (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+    started = datetime.now()
+
+    if args.sqlite:
+        target = f"sqlite:{args.sqlite}"
+        results = run_sqlite(args.sqlite, routes, args.concurrency, args.requests, args.warmup, args.seed)
+    else:
+        dsn = os.environ.get("DATABASE_URL")
+        if not dsn:
+            print("ERROR: environment variable DATABASE_URL not set")
+            sys.exit(1)
+        import psycopg2
+        conn = psycopg2.connect(dsn)
+        ctx = load_context(conn)
+        conn.close()
+        if args.url:
+            target = args.url
+            make_client = web_client_factory(lambda: HttpClient(args.url), ctx)
+        else:
+            # Enough pooled connections for every client, unless set explicitly
+            os.environ.setdefault("DB_POOL_MAX", str(max(args.concurrency, 10)))
+            os.environ.setdefault("SERVER_TIMING", "true")
+            from app import app
+            target = "in-process"
+            make_client = web_client_factory(lambda: InProcessClient(app), ctx)
+        results = {}
+        for name in routes:
+            results[name] = run_route(name, make_client, ctx, args.concurrency, args.requests, args.warmup,
+                                      args.seed)
+            print(f"ℹ️ {name}: {results[name]['throughput_rps']} req/s")
+
+    report = {
+        "meta": {
+            "started": started.isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "target": target,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "python": platform.python_version(),
+        },
+        "routes": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    print()
+    print_table(results)
+    print(f"\n✅ Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
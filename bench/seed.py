@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Benchmark data generator.
+
+Seeds users, products, orders and order_items at shop-like ratios:
+most users have a few orders and some none, orders have one to six lines,
+and product popularity follows a Zipf curve, so a handful of products
+appear in a large share of orders. The same --seed gives the same data.
+
+    DATABASE_URL=postgresql://... python bench/seed.py --users 5000 --products 2000
+    python bench/seed.py --sqlite bench.db --users 5000
+    python bench/seed.py --reset              # remove the benchmark rows again
+
+Every seeded row is tagged (users bench-user-N@example.com with password
+"bench", products with SKU BENCH-N), so --reset removes them and nothing
+else. bench-admin@example.com is an admin for the admin routes. On
+PostgreSQL the dashboard statistics are rebuilt and the catalog version
+bumped afterwards, so the app sees the new rows at once.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_PASSWORD = "bench"
+BENCH_ADMIN_EMAIL = "bench-admin@example.com"
+BENCH_USER_EMAIL = "bench-user-{}@example.com"
+BENCH_EMAIL_PATTERN = "bench-%@example.com"
+BENCH_SKU_PATTERN = "BENCH-%"
+
+BATCH_SIZE = 1000
+
+# Lines per order (1..6) and quantity per line (1..3), as weights
+LINES_WEIGHTS = [40, 25, 15, 10, 6, 4]
+QUANTITY_WEIGHTS = [75, 20, 5]
+PAYMENT_METHODS = ["Card", "UPI", "Cash on Delivery", "Net Banking"]
+
+ADJECTIVES = ["classic", "wireless", "compact", "premium", "organic", "smart", "portable", "vintage",
+              "ergonomic", "waterproof", "handmade", "cotton", "steel", "bamboo", "leather", "digital"]
+NOUNS = ["headphones", "kettle", "backpack", "notebook", "lamp", "jacket", "blender", "sneakers",
+         "watch", "speaker", "mug", "novel", "yoga mat", "camera", "charger", "cookware set"]
+
+
+class Writer:
+    """Batched inserts that return the new ids, for psycopg2 or sqlite3 connections."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.sqlite = type(conn).__module__ == "sqlite3"
+
+    def insert(self, table, columns, rows):
+        ids = []
+        cur = self.conn.cursor()
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            if self.sqlite:
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+                for row in batch:
+                    cur.execute(sql, row)
+                    ids.append(cur.lastrowid)
+            else:
+                from psycopg2.extras import execute_values
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s RETURNING id"
+                ids.extend(row[0] for row in execute_values(cur, sql, batch, page_size=BATCH_SIZE, fetch=True))
+        cur.close()
+        return ids
+
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def make_products(rng, n):
+    rows = []
+    for i in range(1, n + 1):
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        price = Decimal(min(max(round(math.exp(rng.gauss(7, 1.3))), 99), 150000)).quantize(Decimal("0.01"))
+        rows.append((
+            f"bench {adjective} {noun} {i}",
+            f"A {adjective} {noun} for everyday use. Benchmark product {i}.",
+            price,
+            rng.randint(50, 5000),
+            "bench.jpg",
+            f"BENCH-{i:07d}",
+        ))
+    return rows
+
+
+def make_orders(rng, user_ids, orders_per_user, now):
+    """One row per order; users' order counts are geometric around `orders_per_user`."""
+    rows = []
+    p = 1 / (orders_per_user + 1)
+    for user_id in user_ids:
+        n = 0
+        while rng.random() > p:
+            n += 1
+        for _ in range(n):
+            placed = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            rows.append((user_id, rng.choice(PAYMENT_METHODS), "Completed", placed, placed))
+    rows.sort(key=lambda row: row[3])
+    return rows
+
+
+def make_order_items(rng, order_ids, product_ids, prices):
+    weights = zipf_weights(len(product_ids))
+    # Shuffle which products are popular, so it is not simply the lowest ids
+    ranked = product_ids[:]
+    rng.shuffle(ranked)
+    rows = []
+    for order_id in order_ids:
+        n_lines = rng.choices(range(1, len(LINES_WEIGHTS) + 1), LINES_WEIGHTS)[0]
+        lines = set(rng.choices(ranked, weights, k=n_lines))
+        for product_id in lines:
+            quantity = rng.choices(range(1, len(QUANTITY_WEIGHTS) + 1), QUANTITY_WEIGHTS)[0]
+            rows.append((order_id, product_id, quantity, prices[product_id]))
+    return rows
+
+
+def reset(conn):
+    """Delete the benchmark rows; orders, order items and carts cascade."""
+    cur = conn.cursor()
+    mark = "?" if type(conn).__module__ == "sqlite3" else "%s"
+    cur.execute(f"DELETE FROM users WHERE email LIKE {mark}", (BENCH_EMAIL_PATTERN,))
+    users = cur.rowcount
+    cur.execute(f"DELETE FROM products WHERE sku LIKE {mark}", (BENCH_SKU_PATTERN,))
+    products = cur.rowcount
+    cur.close()
+    return users, products
+
+
+def refresh_app_state(conn):
+    """PostgreSQL only: recount the dashboard statistics and invalidate the product caches."""
+    from stats import rebuild_stats
+    from product_cache import bump_catalog_version
+    cur = conn.cursor()
+    rebuild_stats(cur)
+    bump_catalog_version(cur)
+    cur.close()
+
+
+def seed(conn, users, products, orders_per_user, seed_value=42):
+    rng = random.Random(seed_value)
+    writer = Writer(conn)
+    now = datetime.now().replace(microsecond=0)
+
+    product_rows = make_products(rng, products)
+    product_ids = writer.insert("products", ["name", "description", "price", "stock", "image", "sku"], product_rows)
+    prices = {pid: row[2] for pid, row in zip(product_ids, product_rows)}
+
+    user_rows = [(f"bench{i}", BENCH_USER_EMAIL.format(i), BENCH_PASSWORD, "user") for i in range(1, users + 1)]
+    user_rows.append(("bench-admin", BENCH_ADMIN_EMAIL, BENCH_PASSWORD, "admin"))
+    user_ids = writer.insert("users", ["username", "email", "password", "role"], user_rows)[:-1]
+
+    order_rows = make_orders(rng, user_ids, orders_per_user, now)
+    order_ids = writer.insert("orders", ["user_id", "payment_method", "payment_status", "order_date", "created_at"],
+                              order_rows)
+
+    item_rows = make_order_items(rng, order_ids, product_ids, prices)
+    writer.insert("order_items", ["order_id", "product_id", "quantity", "price_at_time"], item_rows)
+    return {"users": len(user_ids), "products": len(product_ids), "orders": len(order_ids),
+            "order_items": len(item_rows)}
+
+
+def connect(args):
+    if args.sqlite:
+        from queries import connect_sqlite
+        return connect_sqlite(args.sqlite)
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        print("ERROR: set DATABASE_URL or pass --sqlite PATH")
+        sys.exit(1)
+    import psycopg2
+    return psycopg2.connect(dsn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=None, help="default: half the number of users")
+    parser.add_argument("--orders-per-user", type=float, default=3.0, help="mean orders per user (default 3)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, for reproducible data")
+    parser.add_argument("--sqlite", metavar="PATH", help="seed a SQLite database instead of DATABASE_URL")
+    parser.add_argument("--reset", action="store_true", help="only remove earlier benchmark rows")
+    args = parser.parse_args()
+
+    conn = connect(args)
+    sqlite = type(conn).__module__ == "sqlite3"
+    try:
+        users, products = reset(conn)
+        if users or products:
+            print(f"ℹ️ Removed {users} benchmark users and {products} benchmark products")
+        if not args.reset:
+            start = time.perf_counter()
+            counts = seed(conn, args.users, args.products or max(args.users // 2, 1), args.orders_per_user,
+                          args.seed)
+            print(f"✅ Seeded {counts['users']} users, {counts['products']} products, {counts['orders']} orders, "
+                  f"{counts['order_items']} order items in {time.perf_counter() - start:.1f}s")
+        if not sqlite:
+            refresh_app_state(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
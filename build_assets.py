@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Build fingerprinted copies of the static assets into static/build/, and
+precompile the templates into jinja_cache/.
+
+Each file under static/ (except uploaded product images) is copied to
+static/build/ with a content hash in its name, text assets get precompressed
+.gz / .br variants, and static/build/manifest.json maps source paths to the
+built ones for url_for('static'). Templates are compiled into the Jinja
+bytecode cache that the app loads at runtime (template_cache.py). Run it
+after changing anything in static/ or templates/ and commit static/build/
+and jinja_cache/, which are deployed with the repo.
+
+    python build_assets.py
+    pip install brotli   # optional, to also write .br variants
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from assets import BUILD_DIR, MANIFEST, COMPRESSIBLE_EXTENSIONS, fingerprint_name, brotli
+from template_cache import BYTECODE_DIR, ShippedBytecodeCache, compile_templates
+
+STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SKIP = {BUILD_DIR, os.path.join("images", "products")}
+
+
+def source_files():
+    for root, dirs, files in os.walk(STATIC):
+        rel_root = os.path.relpath(root, STATIC)
+        dirs[:] = sorted(d for d in dirs if os.path.normpath(os.path.join(rel_root, d)) not in SKIP)
+        for name in sorted(files):
+            yield os.path.normpath(os.path.join(rel_root, name))
+
+
+def write_compressed(path, data):
+    written = []
+    variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    for suffix, fn in variants:
+        packed = fn(data)
+        if len(packed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(packed)
+            written.append(suffix)
+    return written
+
+
+def main():
+    build = os.path.join(STATIC, BUILD_DIR)
+    shutil.rmtree(build, ignore_errors=True)
+    manifest = {}
+    for rel in source_files():
+        with open(os.path.join(STATIC, rel), 'rb') as f:
+            data = f.read()
+        key = rel.replace(os.sep, '/')
+        target = fingerprint_name(rel, hashlib.sha256(data).hexdigest()[:10])
+        out = os.path.join(STATIC, *target.split('/'))
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, 'wb') as f:
+            f.write(data)
+        extra = []
+        if key.rsplit('.', 1)[-1].lower() in COMPRESSIBLE_EXTENSIONS:
+            extra = write_compressed(out, data)
+        manifest[key] = target
+        print(f"  {key} -> {target} {' '.join(extra)}")
+
+    with open(os.path.join(build, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        print("ℹ️  brotli not installed: wrote gzip variants only.")
+    print(f"✅ Built {len(manifest)} assets into static/{BUILD_DIR}/")
+
+    # Templates: compile with the app's own Jinja environment into a fresh cache
+    shutil.rmtree(BYTECODE_DIR, ignore_errors=True)
+    os.makedirs(BYTECODE_DIR)
+    from app import app
+    app.jinja_env.bytecode_cache = ShippedBytecodeCache(writable=True)
+    names = compile_templates(app.jinja_env)
+    print(f"✅ Compiled {len(names)} templates into {os.path.basename(BYTECODE_DIR)}/")
+
+
+if __name__ == "__main__":
+    main()
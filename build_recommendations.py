@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Build the "frequently bought together" table (product_recommendations)
+from order_items; see recommendations.py.
+
+The first run, or --full, counts every order; later runs add just the
+orders placed since the last one, so the command can run every few
+minutes from cron, or keep running with --every:
+
+    DATABASE_URL=postgresql://... python build_recommendations.py --full
+    python build_recommendations.py                  # incremental
+    python build_recommendations.py --every 300      # incremental, every 5 minutes
+
+The co-occurrence counts are kept in --state between runs (default
+RECOMMENDATIONS_STATE or recommendations.npz). Needs NumPy and SciPy
+(pip install -r requirements-builder.txt).
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+import recommendations
+
+
+def connect(database_url):
+    # Supabase requires SSL
+    if "supabase" in database_url:
+        return psycopg2.connect(database_url, sslmode="require")
+    return psycopg2.connect(database_url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="recount every order instead of the queued ones")
+    parser.add_argument("--state", default=os.environ.get("RECOMMENDATIONS_STATE", "recommendations.npz"),
+                        help="co-occurrence state file (default RECOMMENDATIONS_STATE or recommendations.npz)")
+    parser.add_argument("--top", type=int, default=recommendations.TOP_K,
+                        help=f"related products kept per product (default {recommendations.TOP_K})")
+    parser.add_argument("--min-support", type=int, default=recommendations.MIN_SUPPORT,
+                        help=f"orders a pair must share (default {recommendations.MIN_SUPPORT})")
+    parser.add_argument("--every", type=float, metavar="SECONDS",
+                        help="keep running, one incremental build every SECONDS")
+    args = parser.parse_args()
+
+    if recommendations.np is None:
+        print("ERROR: building recommendations needs NumPy and SciPy: pip install -r requirements-builder.txt")
+        sys.exit(1)
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+    print("Using DATABASE_URL:", database_url.split("@", 1)[0] + "@...")
+
+    conn = connect(database_url)
+    full = args.full
+    try:
+        while True:
+            try:
+                summary = recommendations.build(conn, args.state, full=full, k=args.top,
+                                                min_support=args.min_support)
+            except RuntimeError as e:
+                print(f"ERROR: {e}")
+                sys.exit(1)
+            print(f"✅ {summary['mode']} build: {summary['orders']} orders, {summary['lines']} lines, "
+                  f"{summary['products']} products written in {summary['seconds']}s")
+            if not args.every:
+                break
+            full = False
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
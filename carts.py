@@ -0,0 +1,127 @@
+"""
+Server-side shopping carts.
+
+Cart lines live in cart_items, keyed by (cart_id, product_id); the session
+cookie only carries the cart id. Adding to the cart is a single
+INSERT ... ON CONFLICT DO UPDATE, so concurrent adds of the same product
+both count. An anonymous cart is merged into the user's own cart when they
+log in (claim_cart), and checkout reads and empties the cart in one
+statement (take_cart), inside the order's transaction: a failed checkout
+rolls back and leaves the cart as it was, and a double-submitted checkout
+finds the cart already empty.
+
+Anonymous carts left untouched (no add) for CART_TTL_DAYS are deleted,
+lines and all, by worker.py (expire_anonymous_carts); a visitor who comes
+back after that starts a new, empty cart under the same id.
+
+All functions take a cursor; the caller commits.
+"""
+import os
+import secrets
+
+from queries import run, CART_PRODUCTS
+
+CART_TTL_DAYS = int(os.environ.get("CART_TTL_DAYS", "30"))
+EXPIRE_BATCH = 1000  # carts deleted per statement
+
+
+def new_cart_id():
+    return secrets.token_urlsafe(16)
+
+
+def add_item(cur, cart_id, product_id, quantity=1):
+    """
+    Add `quantity` of a product to the cart, creating the cart if needed.
+    Returns the new line quantity, or None if the product does not exist.
+    """
+    cur.execute("""
+        WITH cart AS (
+            INSERT INTO carts (id) VALUES (%s)
+            ON CONFLICT (id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+            RETURNING id
+        )
+        INSERT INTO cart_items (cart_id, product_id, quantity)
+        SELECT cart.id, p.id, %s FROM cart JOIN products p ON p.id = %s
+        ON CONFLICT (cart_id, product_id) DO UPDATE
+            SET quantity = cart_items.quantity + EXCLUDED.quantity
+        RETURNING quantity
+    """, (cart_id, quantity, product_id))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def cart_products(cur, cart_id):
+    """Products in the cart with their `quantity`, oldest line first. Use a RealDictCursor."""
+    return run(cur, CART_PRODUCTS, (cart_id,)).fetchall()
+
+
+def cart_is_empty(cur, cart_id):
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM cart_items WHERE cart_id = %s)", (cart_id,))
+    return cur.fetchone()[0]
+
+
+def take_cart(cur, cart_id):
+    """
+    Remove every line from the cart and return them as {product_id: quantity},
+    for place_order. Rolling back the transaction puts them back.
+    """
+    cur.execute("DELETE FROM cart_items WHERE cart_id = %s RETURNING product_id, quantity", (cart_id,))
+    return dict(cur.fetchall())
+
+
+def claim_cart(cur, cart_id, user_id):
+    """
+    Return the id of the user's cart, merging the cart `cart_id` (usually the
+    anonymous one from before login) into it. If the user has no cart yet,
+    `cart_id` becomes theirs; with neither, a new cart is created.
+    """
+    cur.execute("SELECT id FROM carts WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        if cart_id:
+            cur.execute("""
+                UPDATE carts SET user_id = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND user_id IS NULL
+                RETURNING id
+            """, (user_id, cart_id))
+            if cur.fetchone():
+                return cart_id
+        cur.execute("""
+            INSERT INTO carts (id, user_id) VALUES (%s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+            RETURNING id
+        """, (new_cart_id(), user_id))
+        return cur.fetchone()[0]
+
+    user_cart = row[0]
+    if cart_id and cart_id != user_cart:
+        cur.execute("""
+            WITH moved AS (
+                DELETE FROM cart_items
+                WHERE cart_id = %s AND cart_id IN (SELECT id FROM carts WHERE user_id IS NULL)
+                RETURNING product_id, quantity
+            )
+            INSERT INTO cart_items (cart_id, product_id, quantity)
+            SELECT %s, product_id, quantity FROM moved
+            ON CONFLICT (cart_id, product_id) DO UPDATE
+                SET quantity = cart_items.quantity + EXCLUDED.quantity
+        """, (cart_id, user_cart))
+        cur.execute("DELETE FROM carts WHERE id = %s AND user_id IS NULL", (cart_id,))
+    return user_cart
+
+
+def expire_anonymous_carts(cur, days=CART_TTL_DAYS, batch=EXPIRE_BATCH):
+    """
+    Delete up to `batch` anonymous carts not updated for `days` days, oldest
+    first, skipping carts another transaction is writing. Returns how many.
+    """
+    cur.execute("""
+        DELETE FROM carts WHERE id IN (
+            SELECT id FROM carts
+            WHERE user_id IS NULL AND updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ORDER BY updated_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (days, batch))
+    return cur.rowcount
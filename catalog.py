@@ -0,0 +1,142 @@
+"""
+Keyset pagination for the product catalog.
+
+Pages are addressed by an opaque cursor holding the (sort value, id) of the
+last row shown, so each page is an index range scan no matter how deep the
+visitor goes, unlike OFFSET which re-reads every skipped row.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from search import search_condition
+
+# Sort key -> SQL expression. Each one is backed by an (expression, id) index
+# in db/schema.sql so ORDER BY ... LIMIT never has to sort the whole table.
+SORTS = {
+    "id": "id",
+    "name": "COALESCE(name, '')",
+    "price": "COALESCE(price, 0)",
+    "stock": "COALESCE(stock, 0)",
+}
+
+# Only what the listing templates render; descriptions are cut to a summary.
+LISTING_COLUMNS = "id, name, SUBSTR(description, 1, 200) AS description, price, stock, image"
+
+# Query parameters a catalog page depends on (parse_catalog_args)
+CATALOG_ARGS = ("sort", "order", "per_page", "min_price", "max_price", "in_stock", "q", "after")
+
+DEFAULT_PER_PAGE = 24
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(sort_value, row_id):
+    """Pack the (sort value, id) of the last row on a page into a URL-safe token."""
+    if isinstance(sort_value, Decimal):
+        sort_value = str(sort_value)
+    elif isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def unpack_cursor(token):
+    """Return the raw [sort_value, id] pair from a token; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        pair = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("malformed cursor") from e
+    if not isinstance(pair, list) or len(pair) != 2:
+        raise ValueError("malformed cursor")
+    return pair
+
+
+def decode_cursor(token, sort):
+    """Return (sort_value, id) from a cursor token, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        sort_value, product_id = unpack_cursor(token)
+        if sort == "price":
+            sort_value = Decimal(sort_value)
+        elif sort in ("id", "stock"):
+            sort_value = int(sort_value)
+        else:
+            sort_value = str(sort_value)
+        return sort_value, int(product_id)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+
+
+def _decimal_arg(value):
+    try:
+        return Decimal(value) if value not in (None, "") else None
+    except InvalidOperation:
+        return None
+
+
+def parse_catalog_args(args):
+    """Normalise sort / filter / cursor query parameters from request.args."""
+    sort = args.get("sort", "id")
+    if sort not in SORTS:
+        sort = "id"
+    order = "desc" if args.get("order") == "desc" else "asc"
+    try:
+        per_page = min(max(int(args.get("per_page", DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    return {
+        "sort": sort,
+        "order": order,
+        "per_page": per_page,
+        "min_price": _decimal_arg(args.get("min_price")),
+        "max_price": _decimal_arg(args.get("max_price")),
+        "in_stock": args.get("in_stock") in ("1", "true", "on"),
+        "q": (args.get("q") or "").strip()[:200],
+        "after": decode_cursor(args.get("after"), sort),
+    }
+
+
+def fetch_product_page(cur, params, columns=LISTING_COLUMNS):
+    """
+    Run one keyset page query on a RealDictCursor, or on a cursor from
+    queries.connect_sqlite().
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    sort_expr = SORTS[params["sort"]]
+    direction = "DESC" if params["order"] == "desc" else "ASC"
+    where, args = [], []
+    if params["min_price"] is not None:
+        where.append("price >= %s")
+        args.append(params["min_price"])
+    if params["max_price"] is not None:
+        where.append("price <= %s")
+        args.append(params["max_price"])
+    if params["in_stock"]:
+        where.append("stock > 0")
+    search = search_condition(cur, params["q"]) if params.get("q") else None
+    if search is not None:
+        where.append(search[0])
+        args.extend(search[1])
+    if params["after"] is not None:
+        where.append(f"({sort_expr}, id) {'<' if direction == 'DESC' else '>'} (%s, %s)")
+        args.extend(params["after"])
+    sql = f"SELECT {columns}, {sort_expr} AS sort_key FROM products"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # Fetch one extra row to learn whether there is a next page
+    sql += f" ORDER BY {sort_expr} {direction}, id {direction} LIMIT %s"
+    args.append(params["per_page"] + 1)
+    if type(cur).__module__ == "sqlite3":
+        # Decimals bind as text, which never compares equal to SQLite's numbers
+        sql = sql.replace("%s", "?")
+        args = [float(a) if isinstance(a, Decimal) else a for a in args]
+    cur.execute(sql, args)
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > params["per_page"]:
+        rows = rows[:params["per_page"]]
+        next_cursor = encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+    return rows, next_cursor
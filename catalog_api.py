@@ -0,0 +1,206 @@
+"""
+Compact JSON API for the product catalog and a user's orders (/api/v1/...).
+
+Responses name the selected fields once and give each row as an array:
+
+    {"fields": ["id", "name", "price"], "rows": [[1, "Mug", "9.99"], ...],
+     "next": "<cursor or null>", "sync_token": "<token>"}
+
+- fields=id,name,price picks the columns; only those are read and sent
+  (id is always included).
+- Listing pages are keyset-paginated like the HTML catalog, with the same
+  sort and filter parameters: pass `next` back as after=.
+- since=<sync_token> switches to delta mode: only rows inserted or changed
+  after the token, oldest change first, paged the same way, and on the
+  last page "deleted": ids of products deleted since. Filters do not apply
+  in delta mode. A client keeps the sync_token of the first page of a full
+  listing, or of the last page of a delta, and sends it next time.
+
+Rows are stamped by trigger (db/migrations/0007_sync_columns.sql). A
+transaction can commit after a later one, so the sync token is not simply
+"now": it is the start of the oldest transaction that is still writing,
+taken before the rows are read, so a change committed after a sync is
+never stamped before its token. Changes may then come back twice; clients
+apply rows as upserts. The watermark reads pg_stat_activity, so run it on
+the primary, as a role that can see the other sessions' transactions.
+
+Values are converted in SQL (money as decimal strings, timestamps as
+ISO 8601 UTC), so rows are plain ints and strings for json's C encoder.
+All functions take a RealDictCursor.
+"""
+import json
+from datetime import datetime
+
+from catalog import encode_cursor, unpack_cursor, parse_catalog_args, fetch_product_page
+
+API_MAX_PER_PAGE = 1000
+API_DEFAULT_PER_PAGE = 200
+
+_ISO = "to_char({} AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US\"Z\"')"
+
+# Public field name -> SQL expression
+PRODUCT_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "description": "description",
+    "price": "price::text",
+    "stock": "stock",
+    "image": "image",
+    "sku": "sku",
+    "updated_at": _ISO.format("updated_at"),
+}
+DEFAULT_PRODUCT_FIELDS = ["id", "name", "price", "stock", "image", "updated_at"]
+
+ORDER_FIELDS = {
+    "id": "o.id",
+    "order_date": _ISO.format("o.order_date"),
+    "payment_method": "o.payment_method",
+    "payment_status": "o.payment_status",
+    "created_at": _ISO.format("o.created_at"),
+    "updated_at": _ISO.format("o.updated_at"),
+    # Valued like the admin order history and invoices: lines from before
+    # price_at_time was recorded at the product's current price
+    "total": "(SELECT SUM(oi.quantity * COALESCE(oi.price_at_time, p.price)) FROM order_items oi "
+             "JOIN products p ON p.id = oi.product_id WHERE oi.order_id = o.id)::text",
+}
+DEFAULT_ORDER_FIELDS = ["id", "order_date", "payment_method", "payment_status", "total"]
+
+WATERMARK_SQL = """
+    SELECT LEAST(clock_timestamp(), (
+        SELECT MIN(xact_start) FROM pg_stat_activity
+        WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()
+    )) AS watermark
+"""
+
+
+def parse_fields(value, available, default):
+    """Requested field names in order, unknown ones dropped, id first."""
+    names = [f for f in (value or "").split(",") if f in available] or list(default)
+    return ["id"] + [f for f in dict.fromkeys(names) if f != "id"]
+
+
+def _position(token):
+    """(timestamp, id) from a sync token or delta cursor, or None if malformed."""
+    if not token:
+        return None
+    try:
+        stamp, row_id = unpack_cursor(token)
+        return datetime.fromisoformat(stamp), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_api_args(args, fields, default_fields):
+    try:
+        per_page = min(max(int(args.get("per_page", API_DEFAULT_PER_PAGE)), 1), API_MAX_PER_PAGE)
+    except ValueError:
+        per_page = API_DEFAULT_PER_PAGE
+    return {
+        "fields": parse_fields(args.get("fields"), fields, default_fields),
+        "per_page": per_page,
+        "since": _position(args.get("since")),
+        "after": args.get("after"),
+    }
+
+
+def watermark(cur):
+    """Sync token for everything committed so far. Run before reading the rows."""
+    cur.execute(WATERMARK_SQL)
+    return encode_cursor(cur.fetchone()["watermark"], 0)
+
+
+def _select(fields, mapping):
+    return ", ".join(f"{mapping[f]} AS {f}" for f in fields)
+
+
+def _arrays(rows, fields):
+    return [[row[f] for f in fields] for row in rows]
+
+
+def _delta_page(cur, table_sql, mapping, params, where, args, stamp_col, id_col):
+    """
+    Rows changed after since/after, before the watermark, in (stamp, id)
+    order. Qualify the columns: bare names in ORDER BY would mean the
+    formatted output columns and miss the index.
+    """
+    sync_token = watermark(cur)
+    upper = unpack_cursor(sync_token)[0]
+    start = _position(params["after"]) or params["since"]
+    sql = (f"SELECT {_select(params['fields'], mapping)}, {stamp_col} AS _stamp FROM {table_sql}"
+           f" WHERE {' AND '.join(where + [f'({stamp_col}, {id_col}) > (%s, %s)', f'{stamp_col} < %s'])}"
+           f" ORDER BY {stamp_col}, {id_col} LIMIT %s")
+    cur.execute(sql, args + [start[0], start[1], upper, params["per_page"] + 1])
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > params["per_page"]:
+        rows = rows[:params["per_page"]]
+        next_cursor = encode_cursor(rows[-1]["_stamp"], rows[-1]["id"])
+    return _arrays(rows, params["fields"]), next_cursor, sync_token, upper
+
+
+def product_page(cur, args):
+    """
+    One page of the products API for request.args, as a response dict. Use
+    a RealDictCursor.
+    """
+    params = parse_api_args(args, PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+    fields = params["fields"]
+    if params["since"] is None:
+        sync_token = None if args.get("after") else watermark(cur)
+        catalog = parse_catalog_args(args)
+        catalog["per_page"] = params["per_page"]
+        rows, next_cursor = fetch_product_page(cur, catalog, _select(fields, PRODUCT_FIELDS))
+        body = {"fields": fields, "rows": _arrays(rows, fields), "next": next_cursor}
+        if sync_token:
+            body["sync_token"] = sync_token
+        return body
+
+    rows, next_cursor, sync_token, upper = _delta_page(
+        cur, "products", PRODUCT_FIELDS, params, [], [], "products.updated_at", "products.id")
+    body = {"fields": fields, "rows": rows, "next": next_cursor}
+    if next_cursor is None:
+        # Last page: deletions up to the same watermark, and the token to keep
+        cur.execute("""
+            SELECT product_id FROM product_tombstones
+            WHERE deleted_at >= %s AND deleted_at < %s ORDER BY deleted_at, product_id
+        """, (params["since"][0], upper))
+        body["deleted"] = [row["product_id"] for row in cur.fetchall()]
+        body["sync_token"] = sync_token
+    return body
+
+
+def order_page(cur, user_id, args):
+    """One page of a user's orders for request.args, as a response dict. Use a RealDictCursor."""
+    params = parse_api_args(args, ORDER_FIELDS, DEFAULT_ORDER_FIELDS)
+    fields = params["fields"]
+    if params["since"] is None:
+        sync_token = None if args.get("after") else watermark(cur)
+        try:
+            after = int(unpack_cursor(params["after"])[1]) if params["after"] else 0
+        except (ValueError, TypeError):
+            after = 0
+        cur.execute(f"""
+            SELECT {_select(fields, ORDER_FIELDS)} FROM orders o
+            WHERE o.user_id = %s AND o.id > %s ORDER BY o.id LIMIT %s
+        """, (user_id, after, params["per_page"] + 1))
+        rows = cur.fetchall()
+        next_cursor = None
+        if len(rows) > params["per_page"]:
+            rows = rows[:params["per_page"]]
+            next_cursor = encode_cursor(rows[-1]["id"], rows[-1]["id"])
+        body = {"fields": fields, "rows": _arrays(rows, fields), "next": next_cursor}
+        if sync_token:
+            body["sync_token"] = sync_token
+        return body
+
+    rows, next_cursor, sync_token, _ = _delta_page(
+        cur, "orders o", ORDER_FIELDS, params, ["o.user_id = %s"], [user_id], "o.updated_at", "o.id")
+    body = {"fields": fields, "rows": rows, "next": next_cursor}
+    if next_cursor is None:
+        body["sync_token"] = sync_token
+    return body
+
+
+def dumps(body):
+    """Compact JSON for an API response."""
+    return json.dumps(body, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,115 @@
+-- Tables and indexes as of the first versioned migration. Every statement
+-- is idempotent, so this also runs cleanly on databases created earlier
+-- from db/schema.sql or by older versions of run_migrations.py.
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(150) NOT NULL,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    role VARCHAR(20) DEFAULT 'user' CHECK (role IN ('user', 'admin'))
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    description TEXT,
+    price DECIMAL(10, 2),
+    image VARCHAR(255),
+    stock INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    payment_method VARCHAR(50),
+    payment_status VARCHAR(50) DEFAULT 'Pending',
+    order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER,
+    product_id INTEGER,
+    quantity INTEGER,
+    price_at_time DECIMAL(10, 2),
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+-- Price captured at checkout (older databases were created without it)
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS price_at_time DECIMAL(10, 2);
+
+-- Supplier SKU, the key for bulk imports (see product_import.py)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS sku VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku);
+
+-- Catalog version, bumped by the admin product routes to invalidate every
+-- worker's product cache (see product_cache.py)
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_meta (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Dashboard statistics (see stats.py). Counters are sharded across rows to
+-- avoid a single hot row; readers SUM(value) per name.
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name VARCHAR(50) NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    value NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+CREATE TABLE IF NOT EXISTS sales_daily (
+    day DATE NOT NULL,
+    product_id INTEGER NOT NULL,
+    units BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    orders INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+);
+
+-- Keyset pagination indexes for the product catalog (see catalog.py)
+CREATE INDEX IF NOT EXISTS idx_products_name_id ON products ((COALESCE(name, '')), id);
+CREATE INDEX IF NOT EXISTS idx_products_price_id ON products ((COALESCE(price, 0)), id);
+CREATE INDEX IF NOT EXISTS idx_products_stock_id ON products ((COALESCE(stock, 0)), id);
+
+-- Order history lookups: newest-first paging and per-order line items
+CREATE INDEX IF NOT EXISTS idx_orders_order_date_id ON orders (order_date, id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+
+-- Server-side carts (see carts.py); the session only stores carts.id
+CREATE TABLE IF NOT EXISTS carts (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id VARCHAR(32) NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (cart_id, product_id),
+    FOREIGN KEY (cart_id) REFERENCES carts(id) ON DELETE CASCADE,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_cart_items_product_id ON cart_items (product_id);
+
+-- Invoice documents snapshotted at checkout (see invoices.py)
+CREATE TABLE IF NOT EXISTS invoices (
+    order_id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    total NUMERIC(12, 2) NOT NULL,
+    document JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+);
@@ -0,0 +1,63 @@
+-- db/schema.sql and older versions of run_migrations.py created the base
+-- tables differently. Bring either kind of database to the definitions in
+-- 0001_baseline.sql: the wider of the two column sizes, the defaults, the
+-- NOT NULL constraints (where existing rows allow it), orders.created_at
+-- and the orders -> users foreign key.
+
+ALTER TABLE users ALTER COLUMN username TYPE VARCHAR(150);
+ALTER TABLE users ALTER COLUMN email TYPE VARCHAR(255);
+ALTER TABLE products ALTER COLUMN stock SET DEFAULT 0;
+ALTER TABLE orders ALTER COLUMN payment_status SET DEFAULT 'Pending';
+
+-- products.search_vector (0003) is generated from name, which blocks
+-- changing name's type: drop it here and let 0003 add it back.
+DO $$
+BEGIN
+    IF (SELECT character_maximum_length FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'products' AND column_name = 'name') < 255 THEN
+        ALTER TABLE products DROP COLUMN IF EXISTS search_vector;
+        ALTER TABLE products ALTER COLUMN name TYPE VARCHAR(255);
+    END IF;
+END $$;
+
+-- Existing orders were created at their order date
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = current_schema() AND table_name = 'orders' AND column_name = 'created_at') THEN
+        ALTER TABLE orders ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+        UPDATE orders SET created_at = order_date WHERE order_date IS NOT NULL;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM users WHERE username IS NULL OR email IS NULL OR password IS NULL) THEN
+        ALTER TABLE users ALTER COLUMN username SET NOT NULL;
+        ALTER TABLE users ALTER COLUMN email SET NOT NULL;
+        ALTER TABLE users ALTER COLUMN password SET NOT NULL;
+    ELSE
+        RAISE NOTICE 'users has rows with NULL username, email or password; NOT NULL not added';
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM products WHERE name IS NULL) THEN
+        ALTER TABLE products ALTER COLUMN name SET NOT NULL;
+    ELSE
+        RAISE NOTICE 'products has rows with a NULL name; NOT NULL not added';
+    END IF;
+END $$;
+
+-- NOT VALID enforces the key for new rows at once; validation of existing
+-- rows is attempted separately so orphaned orders do not block the migration.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'orders'::regclass AND confrelid = 'users'::regclass AND contype = 'f') THEN
+        ALTER TABLE orders ADD CONSTRAINT orders_user_id_fkey
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE NOT VALID;
+        BEGIN
+            ALTER TABLE orders VALIDATE CONSTRAINT orders_user_id_fkey;
+        EXCEPTION WHEN foreign_key_violation THEN
+            RAISE NOTICE 'orders has rows for deleted users; orders_user_id_fkey left NOT VALID';
+        END;
+    END IF;
+END $$;
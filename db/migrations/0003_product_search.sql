@@ -0,0 +1,6 @@
+-- Product search (see search.py): generated tsvector, name weighted above description
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', COALESCE(name, '')), 'A') ||
+    setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN (search_vector);
@@ -0,0 +1,6 @@
+-- migrate: optional
+-- Typo-tolerant name matching for search. Not every Postgres build ships
+-- pg_trgm, so a failure here only disables fuzzy matching; the step is
+-- retried on the next run.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- Lookup indexes for the per-user and per-product foreign keys, built
+-- without blocking writes: a user's order list (orders_by_user, ordered by
+-- id), and order lines by product (product deletes, sales queries).
+-- order_items.order_id is already indexed by 0001.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_user_id ON orders (user_id, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_items_product_id ON order_items (product_id);
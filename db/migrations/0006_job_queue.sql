@@ -0,0 +1,19 @@
+-- Background job queue (see jobs.py and worker.py). Routes insert jobs in
+-- their own transaction; workers claim them with FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(64) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(16) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Claim order for queued jobs; dead-lettered jobs stay out of the index
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_at, id) WHERE status = 'queued';
+-- Running jobs whose worker died, reclaimed once their lease runs out
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_until) WHERE status = 'running';
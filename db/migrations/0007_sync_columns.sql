@@ -0,0 +1,37 @@
+-- Delta sync for the JSON API (see catalog_api.py). updated_at is set by
+-- trigger on every insert and update, whoever writes (admin routes,
+-- checkout stock changes, bulk imports), and deleted products leave a
+-- tombstone. clock_timestamp() rather than now(): a row's stamp is when it
+-- was written, not when its transaction began.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    product_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION record_product_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_tombstones (product_id, deleted_at) VALUES (OLD.id, clock_timestamp())
+    ON CONFLICT (product_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_updated_at ON products;
+CREATE TRIGGER products_updated_at BEFORE INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS orders_updated_at ON orders;
+CREATE TRIGGER orders_updated_at BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS products_tombstone ON products;
+CREATE TRIGGER products_tombstone AFTER DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION record_product_tombstone();
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Keyset order of the delta sync (see catalog_api.py): changed products,
+-- tombstones, and a user's changed orders, each by (time, id).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_updated_at_id ON products (updated_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_tombstones_deleted_at ON product_tombstones (deleted_at, product_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_user_updated_at_id ON orders (user_id, updated_at, id);
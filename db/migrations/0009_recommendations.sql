@@ -0,0 +1,25 @@
+-- "Frequently bought together" (see recommendations.py). build_recommendations.py
+-- writes each product's top related products, best first, with their
+-- scores; pages read one row per product by primary key. New orders are
+-- queued by trigger in their own transaction, whoever inserts them, for
+-- the builder's next incremental run.
+CREATE TABLE IF NOT EXISTS product_recommendations (
+    product_id INTEGER PRIMARY KEY,
+    related INTEGER[] NOT NULL,
+    scores REAL[] NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS recommendation_queue (
+    order_id INTEGER PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION queue_recommendation_order() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO recommendation_queue (order_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_recommendation_queue ON orders;
+CREATE TRIGGER orders_recommendation_queue AFTER INSERT ON orders
+    FOR EACH ROW EXECUTE FUNCTION queue_recommendation_order();
@@ -0,0 +1,3 @@
+-- Anonymous carts untouched for a while are deleted by worker.py
+-- (carts.expire_anonymous_carts); add_item bumps updated_at on every add.
+CREATE INDEX IF NOT EXISTS idx_carts_anonymous_updated ON carts (updated_at) WHERE user_id IS NULL;
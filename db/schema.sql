@@ -1,21 +1,24 @@
 -- PostgreSQL schema for Supabase
 -- Note: Database and schema are managed by Supabase
+-- This is the schema db/migrations builds (see migrations.py). A database
+-- created from this file is brought under versioning by running
+-- `python run_migrations.py` once: every migration is idempotent.
 
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
-    username VARCHAR(50) NOT NULL,
-    email VARCHAR(100) NOT NULL UNIQUE,
+    username VARCHAR(150) NOT NULL,
+    email VARCHAR(255) NOT NULL UNIQUE,
     password VARCHAR(255) NOT NULL,
     role VARCHAR(20) DEFAULT 'user' CHECK (role IN ('user', 'admin'))
 );
 
 CREATE TABLE IF NOT EXISTS products (
     id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
+    name VARCHAR(255) NOT NULL,
     description TEXT,
     price DECIMAL(10, 2),
     image VARCHAR(255),
-    stock INTEGER
+    stock INTEGER DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS orders (
@@ -33,11 +36,188 @@ CREATE TABLE IF NOT EXISTS order_items (
     order_id INTEGER,
     product_id INTEGER,
     quantity INTEGER,
-    price_at_time DECIMAL(10,2),
+    price_at_time DECIMAL(10, 2),
     FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
     FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
 );
 
+-- Supplier SKU, the key for bulk imports (see product_import.py)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS sku VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku);
+
+-- Catalog version, bumped by the admin product routes to invalidate every
+-- worker's product cache (see product_cache.py)
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_meta (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Dashboard statistics (see stats.py). Counters are sharded across rows to
+-- avoid a single hot row; readers SUM(value) per name.
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name VARCHAR(50) NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    value NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+CREATE TABLE IF NOT EXISTS sales_daily (
+    day DATE NOT NULL,
+    product_id INTEGER NOT NULL,
+    units BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    orders INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+);
+
+-- Keyset pagination indexes for the product catalog (see catalog.py)
+CREATE INDEX IF NOT EXISTS idx_products_name_id ON products ((COALESCE(name, '')), id);
+CREATE INDEX IF NOT EXISTS idx_products_price_id ON products ((COALESCE(price, 0)), id);
+CREATE INDEX IF NOT EXISTS idx_products_stock_id ON products ((COALESCE(stock, 0)), id);
+
+-- Order history lookups: newest-first paging and per-order line items
+CREATE INDEX IF NOT EXISTS idx_orders_order_date_id ON orders (order_date, id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+
+-- Foreign-key lookups: a user's orders, order lines by product
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id, id);
+CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items (product_id);
+
+-- Server-side carts (see carts.py); the session only stores carts.id
+CREATE TABLE IF NOT EXISTS carts (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id VARCHAR(32) NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (cart_id, product_id),
+    FOREIGN KEY (cart_id) REFERENCES carts(id) ON DELETE CASCADE,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_cart_items_product_id ON cart_items (product_id);
+-- Anonymous carts expire (carts.expire_anonymous_carts)
+CREATE INDEX IF NOT EXISTS idx_carts_anonymous_updated ON carts (updated_at) WHERE user_id IS NULL;
+
+-- Invoice documents snapshotted at checkout (see invoices.py)
+CREATE TABLE IF NOT EXISTS invoices (
+    order_id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    total NUMERIC(12, 2) NOT NULL,
+    document JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+);
+
+-- Background job queue (see jobs.py and worker.py). Routes insert jobs in
+-- their own transaction; workers claim them with FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(64) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(16) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Claim order for queued jobs; dead-lettered jobs stay out of the index
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_at, id) WHERE status = 'queued';
+-- Running jobs whose worker died, reclaimed once their lease runs out
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_until) WHERE status = 'running';
+
+-- Delta sync for the JSON API (see catalog_api.py). updated_at is set by
+-- trigger on every insert and update, whoever writes (admin routes,
+-- checkout stock changes, bulk imports), and deleted products leave a
+-- tombstone. clock_timestamp() rather than now(): a row's stamp is when it
+-- was written, not when its transaction began.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    product_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION record_product_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_tombstones (product_id, deleted_at) VALUES (OLD.id, clock_timestamp())
+    ON CONFLICT (product_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_updated_at ON products;
+CREATE TRIGGER products_updated_at BEFORE INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS orders_updated_at ON orders;
+CREATE TRIGGER orders_updated_at BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS products_tombstone ON products;
+CREATE TRIGGER products_tombstone AFTER DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION record_product_tombstone();
+
+CREATE INDEX IF NOT EXISTS idx_products_updated_at_id ON products (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_deleted_at ON product_tombstones (deleted_at, product_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_updated_at_id ON orders (user_id, updated_at, id);
+
+-- "Frequently bought together" (see recommendations.py). build_recommendations.py
+-- writes each product's top related products, best first, with their
+-- scores; pages read one row per product by primary key. New orders are
+-- queued by trigger in their own transaction, whoever inserts them, for
+-- the builder's next incremental run.
+CREATE TABLE IF NOT EXISTS product_recommendations (
+    product_id INTEGER PRIMARY KEY,
+    related INTEGER[] NOT NULL,
+    scores REAL[] NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS recommendation_queue (
+    order_id INTEGER PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION queue_recommendation_order() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO recommendation_queue (order_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_recommendation_queue ON orders;
+CREATE TRIGGER orders_recommendation_queue AFTER INSERT ON orders
+    FOR EACH ROW EXECUTE FUNCTION queue_recommendation_order();
+
+-- Product search (see search.py): generated tsvector, name weighted above description
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', COALESCE(name, '')), 'A') ||
+    setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN (search_vector);
+
+-- Typo-tolerant name matching for search; optional, search works without it
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
+
 -- Insert admin user (only if not exists)
 INSERT INTO users (username, email, password, role)
 SELECT 'admin', 'admin@admin.com', 'admin123', 'admin'
@@ -98,3 +278,12 @@ SELECT * FROM (VALUES
     ('zenbook_duo', 'ASUS Zenbook Duo dual screen laptop.', 139999.00, 'zenbook_duo.jpg', 2)
 ) AS v(name, description, price, image, stock)
 WHERE NOT EXISTS (SELECT 1 FROM products LIMIT 1);
+
+-- Backfill dashboard statistics on first install (python rebuild_stats.py recomputes them)
+INSERT INTO stats_counters (name, shard, value)
+SELECT 'users', 0, COUNT(*) FROM users WHERE role = 'user'
+UNION ALL SELECT 'products', 0, COUNT(*) FROM products
+UNION ALL SELECT 'orders', 0, COUNT(*) FROM orders
+UNION ALL SELECT 'revenue', 0, COALESCE(SUM(oi.quantity * COALESCE(oi.price_at_time, p.price, 0)), 0)
+    FROM order_items oi LEFT JOIN products p ON p.id = oi.product_id
+ON CONFLICT (name, shard) DO NOTHING;
@@ -0,0 +1,48 @@
+"""
+Fragment caching for Jinja templates.
+
+    {% cache 'product-row', product.id, product.stock %}
+        ... markup for one product ...
+    {% endcache %}
+
+The rendered block is stored under its key parts plus the current catalog
+version, so an admin change to any product re-renders every fragment, while
+identical requests reuse the markup and only the personalised parts of the
+page (outside the blocks) are rendered each time. Add to the key anything
+the block shows that changes without a catalog version bump, like stock
+after checkouts.
+
+The store is any object with get(key) / set(key, value), normally the
+bounded LRU in ProductCache.fragments, which reports hits and misses.
+Without one, blocks render normally.
+"""
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_version=lambda: None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render_cached", [nodes.List(key_parts)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        store = self.environment.fragment_cache
+        if store is None:
+            return caller()
+        key = (tuple(key_parts), self.environment.fragment_cache_version())
+        rendered = store.get(key)
+        if rendered is None:
+            rendered = caller()
+            store.set(key, rendered)
+        return rendered
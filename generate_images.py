@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Generate resized JPEG/PNG and WebP derivatives for product images already
+in static/images/products (new uploads get them automatically). They are
+named after the image's content hash, also for the images shipped under
+plain names (see images.py). Run it after adding an image to the repo and
+commit what it writes: Vercel serves static files from the repo and runs
+no build step for them.
+
+    python generate_images.py            # only images missing derivatives
+    python generate_images.py --force    # regenerate everything
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from images import make_derivatives, is_derivative
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+
+def process(path, force):
+    from PIL import Image
+
+    try:
+        return path, make_derivatives(path, force=force), None
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return path, [], e
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "static", "images", "products"))
+    parser.add_argument("--force", action="store_true", help="overwrite existing derivatives")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    originals = sorted(
+        os.path.join(args.folder, name) for name in os.listdir(args.folder)
+        if '.' in name and name.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS and not is_derivative(name)
+    )
+    print(f"{len(originals)} images in {args.folder}")
+
+    written = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for path, files, error in pool.map(partial(process, force=args.force), originals):
+            if error:
+                failed += 1
+                print(f"  {os.path.basename(path)}: {error}")
+            written += len(files)
+    print(f"✅ Wrote {written} derivative files ({failed} images failed).")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Product image pipeline.
+
+Uploads are stored under a content-hashed name (<sha256 prefix>.<ext>), so
+re-uploading a changed file never collides with a cached copy of the old
+one. Next to the original, resized derivatives are written for each width
+in WIDTHS that is smaller than the image, plus one at the original width,
+each as <hash>-<width>w.<jpg|png> and <hash>-<width>w.webp. Templates
+build <picture> / srcset markup from them through image_variants().
+
+Images from before content-hashed names (1984.jpg) keep their name, but
+their derivatives are named after the hash of their content all the same
+(image_stem), so every derivative URL can be cached as immutable.
+generate_images.py creates the derivatives of the images already on disk;
+those of the shipped images are committed, since Vercel serves static
+files straight from the repo. Without derivatives, pages fall back to the
+original image.
+
+Images are opened through open_image(), which refuses decompression bombs:
+anything over Pillow's Image.MAX_IMAGE_PIXELS raises
+DecompressionBombError, including the sizes for which Pillow itself only
+warns, so an upload never gets decoded at a size that exhausts memory.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+
+WIDTHS = (160, 320, 640, 1280)
+MAX_WIDTH = 1600
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+DERIVATIVE_RE = re.compile(r'^(?P<stem>.+)-(?P<width>\d+)w\.(?P<ext>jpg|png|webp)$')
+HASHED_STEM_RE = re.compile(r'^[0-9a-f]{16}$')
+
+
+def content_name(data, filename):
+    """Content-hashed file name for uploaded bytes, keeping a normalised extension."""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'jpg'
+    if ext == 'jpeg':
+        ext = 'jpg'
+    return f"{hashlib.sha256(data).hexdigest()[:16]}.{ext}"
+
+
+def is_derivative(filename):
+    return DERIVATIVE_RE.match(filename) is not None
+
+
+def image_stem(path):
+    """Stem the derivatives of the image at `path` are named after: its content hash."""
+    stem = os.path.basename(path).rsplit('.', 1)[0]
+    if HASHED_STEM_RE.match(stem):
+        return stem
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def open_image(path):
+    """Image.open, raising Image.DecompressionBombError above Image.MAX_IMAGE_PIXELS."""
+    from PIL import Image  # deferred: only needed when processing images
+
+    im = Image.open(path)
+    if Image.MAX_IMAGE_PIXELS and im.width * im.height > Image.MAX_IMAGE_PIXELS:
+        im.close()
+        raise Image.DecompressionBombError(
+            f"{im.width}x{im.height} pixels is over the limit of {Image.MAX_IMAGE_PIXELS}")
+    return im
+
+
+def make_derivatives(path, force=False):
+    """
+    Write the resized JPEG/PNG and WebP variants of the image at `path`.
+    Returns the list of files written (existing ones are skipped unless force).
+    """
+    from PIL import Image, ImageOps  # deferred: only needed when processing images
+
+    folder = os.path.dirname(path)
+    stem = image_stem(path)
+    written = []
+    with open_image(path) as im:
+        im = ImageOps.exif_transpose(im)
+        has_alpha = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+        im = im.convert('RGBA' if has_alpha else 'RGB')
+        fallback_ext = 'png' if has_alpha else 'jpg'
+        orig_width = min(im.width, MAX_WIDTH)
+        for width in sorted({w for w in WIDTHS if w < orig_width} | {orig_width}):
+            targets = [
+                (os.path.join(folder, f"{stem}-{width}w.{fallback_ext}"), fallback_ext),
+                (os.path.join(folder, f"{stem}-{width}w.webp"), 'webp'),
+            ]
+            if not force and all(os.path.exists(t) for t, _ in targets):
+                continue
+            height = max(1, round(im.height * width / im.width))
+            resized = im if width == im.width else im.resize((width, height), Image.LANCZOS)
+            for target, fmt in targets:
+                if fmt == 'webp':
+                    resized.save(target, 'WEBP', quality=WEBP_QUALITY, method=6)
+                elif fmt == 'png':
+                    resized.save(target, 'PNG', optimize=True)
+                else:
+                    resized.save(target, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                written.append(target)
+    return written
+
+
+def check_image(path):
+    """Raise unless the file at `path` is an image Pillow can read, and not a decompression bomb."""
+    with open_image(path) as im:
+        im.verify()
+
+
+def save_upload(file, folder, derivatives=True):
+    """
+    Save an uploaded FileStorage under its content-hashed name and generate
+    its derivatives (with derivatives=False only check that it is an image,
+    leaving them to the image_derivatives job). Returns the stored file name
+    for products.image, or None if the file is not a readable image or is
+    too large to decode (a decompression bomb).
+    """
+    from PIL import Image
+
+    data = file.read()
+    name = content_name(data, file.filename)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    existed = os.path.exists(path)
+    if not existed:
+        with open(path, 'wb') as f:
+            f.write(data)
+    try:
+        if derivatives:
+            make_derivatives(path)
+        else:
+            check_image(path)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Pillow raises UnidentifiedImageError (an OSError) for non-images
+        if not existed:
+            os.remove(path)
+        return None
+    variant_index.invalidate()
+    return name
+
+
+class VariantIndex:
+    """
+    Which derivative widths exist for each image stem, read from the image
+    folder and re-read when the folder changes (checked at most every
+    `check_interval` seconds).
+    """
+
+    def __init__(self, folder, check_interval=5.0):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._variants = None
+        self._stems = {}  # legacy image name -> content hash, see image_stem
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._checked_at = 0.0
+        self._mtime = None
+
+    def _stem(self, image):
+        stem = image.rsplit('.', 1)[0]
+        if HASHED_STEM_RE.match(stem):
+            return stem
+        if image not in self._stems:
+            try:
+                self._stems[image] = image_stem(os.path.join(self.folder, os.path.basename(image)))
+            except OSError:
+                self._stems[image] = None
+        return self._stems[image]
+
+    def _load(self):
+        self._stems = {}
+        variants = {}
+        for filename in os.listdir(self.folder):
+            m = DERIVATIVE_RE.match(filename)
+            if m:
+                entry = variants.setdefault(m['stem'], {})
+                entry.setdefault(int(m['width']), {})[m['ext'] if m['ext'] == 'webp' else 'src'] = filename
+        self._variants = {
+            stem: [
+                {'width': w, 'src': files['src'], 'webp': files.get('webp')}
+                for w, files in sorted(widths.items()) if 'src' in files
+            ]
+            for stem, widths in variants.items()
+        }
+
+    def get(self, image):
+        if not image:
+            return []
+        now = time.monotonic()
+        if self._variants is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                try:
+                    mtime = os.stat(self.folder).st_mtime
+                except OSError:
+                    return []
+                if self._variants is None or mtime != self._mtime:
+                    self._load()
+                    self._mtime = mtime
+                self._checked_at = now
+        return self._variants.get(self._stem(image), [])
+
+
+variant_index = VariantIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'images', 'products'))
+
+
+def image_variants(image):
+    """Derivatives of a products.image file name, smallest first ([] if none were generated)."""
+    return variant_index.get(image)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Bulk import products, or sync prices and stock, from a CSV or NDJSON file.
+
+    DATABASE_URL=postgresql://... python import_products.py catalog.csv
+    DATABASE_URL=postgresql://... python import_products.py prices.ndjson --mode update
+
+Modes:
+  upsert  add or update products by sku (sku and name required)
+  update  update price and/or stock of existing products matched by id or sku
+
+Rows that fail validation are listed with their line numbers and skipped;
+use --strict to abort the whole import instead, or --dry-run to validate
+and roll back.
+"""
+import argparse
+import os
+import sys
+
+import psycopg2
+
+from product_cache import bump_catalog_version
+from product_import import import_products, read_rows, detect_format
+from stats import incr_counter
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("path", help="CSV (with header) or NDJSON file")
+parser.add_argument("--mode", choices=["upsert", "update"], default="upsert")
+parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+parser.add_argument("--strict", action="store_true", help="roll back if any row is rejected")
+parser.add_argument("--dry-run", action="store_true", help="validate and apply, then roll back")
+args = parser.parse_args()
+
+database_url = os.environ.get("DATABASE_URL")
+if not database_url:
+    print("ERROR: environment variable DATABASE_URL not set")
+    sys.exit(1)
+
+print("Using DATABASE_URL:", database_url.split("@", 1)[0] + "@...")
+
+if "supabase" in database_url:
+    conn = psycopg2.connect(database_url, sslmode="require")
+else:
+    conn = psycopg2.connect(database_url)
+
+fmt = args.format or detect_format(args.path)
+try:
+    cur = conn.cursor()
+    with open(args.path, encoding="utf-8-sig", newline="") as f:
+        report = import_products(cur, read_rows(f, fmt), args.mode)
+    for line, message in report.errors:
+        print(f"  line {line}: {message}")
+    print(f"{report.rows} rows read, {report.inserted} added, {report.updated} updated, "
+          f"{report.error_count} rejected")
+    if args.dry_run or (args.strict and report.errors):
+        conn.rollback()
+        print("Rolled back" + (" (dry run)." if args.dry_run else ": rows were rejected and --strict is set."))
+        sys.exit(0 if args.dry_run else 2)
+    if report.inserted:
+        incr_counter(cur, 'products', report.inserted)
+    bump_catalog_version(cur)
+    conn.commit()
+    cur.close()
+    print("✅ Import committed.")
+except Exception as e:
+    conn.rollback()
+    print("ERROR importing products:", e)
+    raise
+finally:
+    conn.close()
@@ -0,0 +1,214 @@
+"""
+Per-request database instrumentation and Prometheus metrics.
+
+Every cursor the routes get from the request connection is wrapped in an
+InstrumentedCursor that times each statement into the request's
+QueryStats: statement count, total database time, and statements slower
+than the slow-query threshold with their SQL normalised (literals replaced
+by ?, whitespace collapsed), so the same statement from different requests
+groups together.
+
+At the end of a request the app turns QueryStats into a Server-Timing
+header (visible in the browser's network panel and read by
+bench/run_bench.py) and adds the request to Metrics: latency histograms
+per route, database time and query counts per route, and the slowest
+normalised statements. Metrics.render() produces the Prometheus text
+format served at /_metrics.
+
+Metrics are per process. Under gunicorn each worker counts its own
+requests, labelled with its pid, so scrape every worker or read them as a
+sample.
+"""
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; the Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Distinct slow statements kept for /_health/slow_queries
+MAX_SLOW_STATEMENTS = 200
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql, max_length=500):
+    """Statement text with literals as ?, lists of them as (...), and single spaces."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = _STRING_RE.sub("?", str(sql))
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _LIST_RE.sub("(...)", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    return sql[:max_length]
+
+
+class QueryStats:
+    """Statements run during one request."""
+
+    __slots__ = ("count", "seconds", "slow", "slow_seconds")
+
+    def __init__(self, slow_seconds):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = []
+        self.slow_seconds = slow_seconds
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if seconds >= self.slow_seconds:
+            self.slow.append((normalize_sql(sql), seconds))
+
+
+class InstrumentedCursor:
+    """Wraps a DB-API cursor, timing execute() / executemany() into a QueryStats."""
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, *args, **kwargs)
+        finally:
+            self._stats.record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, *args, **kwargs)
+        finally:
+            self._stats.record(sql, time.perf_counter() - start)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def server_timing(stats, total_seconds):
+    """Server-Timing header value: database time and statement count, and the whole request."""
+    return (f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries", '
+            f'total;dur={total_seconds * 1000:.2f}')
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+
+class Metrics:
+    """Request and database metrics for this process, thread-safe."""
+
+    def __init__(self, slow_query_ms=100):
+        self.slow_seconds = slow_query_ms / 1000
+        self._lock = threading.Lock()
+        self._latency = {}   # (route, method) -> Histogram of request seconds
+        self._db_time = {}   # (route, method) -> Histogram of database seconds per request
+        self._requests = {}  # (route, method, status) -> count
+        self._queries = {}   # (route, method) -> statements run
+        self._slow = {}      # (route, method) -> statements over the threshold
+        self._statements = {}  # normalised SQL -> {"count", "total_ms", "max_ms", "route"}
+
+    def start_request(self):
+        return QueryStats(self.slow_seconds)
+
+    def observe(self, route, method, status, seconds, stats):
+        key = (route, method)
+        with self._lock:
+            self._latency.setdefault(key, Histogram()).observe(seconds)
+            self._db_time.setdefault(key, Histogram()).observe(stats.seconds)
+            self._requests[key + (status,)] = self._requests.get(key + (status,), 0) + 1
+            self._queries[key] = self._queries.get(key, 0) + stats.count
+            self._slow[key] = self._slow.get(key, 0) + len(stats.slow)
+            for sql, statement_seconds in stats.slow:
+                entry = self._statements.get(sql)
+                if entry is None:
+                    if len(self._statements) >= MAX_SLOW_STATEMENTS:
+                        continue
+                    entry = self._statements[sql] = {"sql": sql, "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+                ms = statement_seconds * 1000
+                entry["count"] += 1
+                entry["total_ms"] = round(entry["total_ms"] + ms, 2)
+                entry["max_ms"] = round(max(entry["max_ms"], ms), 2)
+                entry["route"] = route
+
+    def slow_statements(self, limit=50):
+        """Slow statements by total time spent in them, largest first."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._statements.values()]
+        return sorted(entries, key=lambda e: e["total_ms"], reverse=True)[:limit]
+
+    def render(self, gauges=None):
+        """Prometheus text exposition; `gauges` adds {name: (help, value)} point-in-time values."""
+        lines, pid = [], os.getpid()
+        with self._lock:
+            self._render_histograms(lines, "http_request_duration_seconds",
+                                    "Request latency by route.", self._latency, pid)
+            self._render_histograms(lines, "db_request_duration_seconds",
+                                    "Database time per request by route.", self._db_time, pid)
+            self._render_counter(lines, "http_requests_total", "Requests by route and status.",
+                                 self._requests, ("route", "method", "status"), pid)
+            self._render_counter(lines, "db_queries_total", "SQL statements run by route.",
+                                 self._queries, ("route", "method"), pid)
+            self._render_counter(lines, "db_slow_queries_total",
+                                 f"SQL statements slower than {self.slow_seconds * 1000:g} ms by route.",
+                                 self._slow, ("route", "method"), pid)
+        for name, (help_text, value) in (gauges or {}).items():
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_labels(pid=pid)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _render_histograms(self, lines, name, help_text, histograms, pid):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (route, method), hist in sorted(histograms.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), hist.counts):
+                cumulative += n
+                labels = _labels(route=route, method=method, pid=pid, le=bound)
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _labels(route=route, method=method, pid=pid)
+            lines.append(f"{name}_sum{labels} {hist.sum:.6f}")
+            lines.append(f"{name}_count{labels} {hist.count}")
+
+    def _render_counter(self, lines, name, help_text, counts, label_names, pid):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(counts.items()):
+            labels = _labels(**dict(zip(label_names, key)), pid=pid)
+            lines.append(f"{name}{labels} {value}")
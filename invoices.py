@@ -0,0 +1,148 @@
+"""
+Invoice snapshots.
+
+Once checkout commits an order, its order_placed job (tasks.py) runs
+snapshot_invoices(), which stores everything the invoice shows (customer,
+payment details, line items at the prices captured in order_items, total)
+as one JSONB document in `invoices`, keyed by order id. Viewing an invoice is then a single primary-key read
+(load_invoice) instead of a four-table join, and later product renames or
+price changes do not rewrite past invoices.
+
+Orders placed before snapshots existed, or whose job has not run yet, get
+theirs on first view, or in bulk from render_invoices.py. Money is stored
+as decimal strings and comes back as Decimal from invoice_context().
+Snapshots are also written on a cursor from queries.connect_sqlite(),
+with SQLite's JSON functions, so the same documents can be built offline.
+
+All functions take a cursor; the caller commits.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from queries import run, INVOICE_DOCUMENT
+
+_SNAPSHOT_SQL = """
+    INSERT INTO invoices (order_id, user_id, total, document)
+    SELECT o.id, o.user_id, t.total, jsonb_build_object(
+        'order_id', o.id,
+        'order_date', o.order_date,
+        'username', u.username,
+        'email', u.email,
+        'payment_method', o.payment_method,
+        'payment_status', o.payment_status,
+        'items', t.items,
+        'total', t.total::text
+    )
+    FROM orders o
+    JOIN users u ON u.id = o.user_id
+    JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object(
+                   'name', p.name,
+                   'price', l.price::text,
+                   'quantity', oi.quantity,
+                   'line_total', (l.price * oi.quantity)::text
+               ) ORDER BY oi.id) AS items,
+               SUM(l.price * oi.quantity) AS total
+        FROM order_items oi
+        JOIN products p ON p.id = oi.product_id
+        CROSS JOIN LATERAL (SELECT COALESCE(oi.price_at_time, p.price, 0) AS price) l
+        WHERE oi.order_id = o.id
+    ) t ON t.items IS NOT NULL
+    WHERE {where}
+    ON CONFLICT (order_id) DO NOTHING
+"""
+
+# The same document with SQLite's JSON functions (json_group_array has no
+# ORDER BY before SQLite 3.44, so the lines are ordered in a subquery)
+_SNAPSHOT_SQL_SQLITE = """
+    INSERT INTO invoices (order_id, user_id, total, document)
+    SELECT o.id, o.user_id, t.total, json_object(
+        'order_id', o.id,
+        'order_date', replace(o.order_date, ' ', 'T'),
+        'username', u.username,
+        'email', u.email,
+        'payment_method', o.payment_method,
+        'payment_status', o.payment_status,
+        'items', json(t.items),
+        'total', printf('%.2f', t.total)
+    )
+    FROM orders o
+    JOIN users u ON u.id = o.user_id
+    JOIN (
+        SELECT order_id,
+               json_group_array(json_object(
+                   'name', name,
+                   'price', printf('%.2f', price),
+                   'quantity', quantity,
+                   'line_total', printf('%.2f', price * quantity)
+               )) AS items,
+               SUM(price * quantity) AS total
+        FROM (
+            SELECT oi.order_id, p.name, oi.quantity, COALESCE(oi.price_at_time, p.price, 0) AS price
+            FROM order_items oi
+            JOIN products p ON p.id = oi.product_id
+            ORDER BY oi.order_id, oi.id
+        )
+        GROUP BY order_id
+    ) t ON t.order_id = o.id
+    WHERE {where}
+    ON CONFLICT (order_id) DO NOTHING
+"""
+
+
+def _is_sqlite(cur):
+    return type(cur).__module__ == "sqlite3"
+
+
+def invoice_number(order_id):
+    return f"INV-{order_id:04d}"
+
+
+def snapshot_invoices(cur, order_ids):
+    """Store the invoice documents for `order_ids` that do not have one yet. Returns how many were written."""
+    if _is_sqlite(cur):
+        cur.execute(_SNAPSHOT_SQL_SQLITE.format(where="o.id IN (SELECT value FROM json_each(?))"),
+                    (json.dumps(list(order_ids)),))
+    else:
+        cur.execute(_SNAPSHOT_SQL.format(where="o.id = ANY(%s)"), (list(order_ids),))
+    return cur.rowcount
+
+
+def snapshot_missing_invoices(cur, date_from=None, date_to=None):
+    """Snapshot every order placed in [date_from, date_to) that has no invoice yet."""
+    sql, mark = (_SNAPSHOT_SQL_SQLITE, "?") if _is_sqlite(cur) else (_SNAPSHOT_SQL, "%s")
+    where, args = ["NOT EXISTS (SELECT 1 FROM invoices i WHERE i.order_id = o.id)"], []
+    if date_from:
+        where.append(f"o.order_date >= {mark}")
+        args.append(date_from)
+    if date_to:
+        where.append(f"o.order_date < {mark}")
+        args.append(date_to)
+    cur.execute(sql.format(where=" AND ".join(where)), args)
+    return cur.rowcount
+
+
+def load_invoice(cur, order_id):
+    """The stored invoice document for an order, or None. Use a RealDictCursor."""
+    row = run(cur, INVOICE_DOCUMENT, (order_id,)).fetchone()
+    if row is None:
+        return None
+    document = row["document"]
+    return json.loads(document) if isinstance(document, str) else document
+
+
+def invoice_context(document):
+    """Template variables for invoice.html from a stored document."""
+    order = dict(document)
+    order["order_date"] = datetime.fromisoformat(document["order_date"])
+    items = [
+        dict(item, price=Decimal(item["price"]), line_total=Decimal(item["line_total"]))
+        for item in document["items"]
+    ]
+    return {
+        "order": order,
+        "items": items,
+        "total": Decimal(document["total"]),
+        "invoice_number": invoice_number(document["order_id"]),
+    }
@@ -0,0 +1,147 @@
+"""
+Background jobs stored in PostgreSQL.
+
+Work that does not have to finish before the response (sales rollups,
+invoice snapshots, image derivatives) goes into the jobs table through
+enqueue(), in the caller's transaction: a job exists exactly when the order
+or product it belongs to was committed. worker.py runs them.
+
+A worker claims the oldest due job with FOR UPDATE SKIP LOCKED, so workers
+never wait on each other, and holds it under a lease (locked_until). The
+handler then runs in a transaction that also deletes the job, so its
+database writes and the job's completion commit together. A failed job goes
+back to 'queued' with exponential backoff, or to 'dead' once it has used
+max_attempts; dead jobs stay in the table until retry_dead(). A job whose
+worker died is requeued when its lease runs out, so handlers should not
+mind repeating side effects outside the database (files).
+
+Handlers are registered with @handler('kind') (see tasks.py) and called
+as handler(cur, payload). enqueue(..., inline=True) calls the handler at
+once on the caller's cursor, for deployments that run no worker.
+
+All functions take a cursor; the caller commits.
+"""
+import json
+
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE = 10  # seconds before the first retry, doubled for each further attempt
+BACKOFF_MAX = 3600
+LEASE = 300  # seconds a claimed job may run before another worker may take it over
+
+# Workers LISTEN here; enqueue() notifies on commit so they wake without polling
+NOTIFY_CHANNEL = "jobs"
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register a function as the handler for jobs of `kind`."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(cur, kind, payload=None, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS, inline=False):
+    """Queue a job to run once the caller's transaction commits, or run it now if `inline`."""
+    if inline:
+        HANDLERS[kind](cur, payload or {})
+        return
+    cur.execute("""
+        INSERT INTO jobs (kind, payload, max_attempts, run_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+    """, (kind, json.dumps(payload or {}), max_attempts, delay))
+    cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, kind))
+
+
+def claim(cur, lease=LEASE):
+    """Take the oldest due job: (id, kind, payload, attempts, max_attempts), or None."""
+    cur.execute("""
+        UPDATE jobs SET status = 'running', attempts = attempts + 1,
+               locked_until = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_at <= CURRENT_TIMESTAMP
+            ORDER BY run_at, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, payload, attempts, max_attempts
+    """, (lease,))
+    return cur.fetchone()
+
+
+def complete(cur, job_id):
+    cur.execute("DELETE FROM jobs WHERE id = %s", (job_id,))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed `attempts` times."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def fail(cur, job_id, attempts, max_attempts, error):
+    """Schedule a retry of a failed job, or dead-letter it. Returns the new status."""
+    status = "dead" if attempts >= max_attempts else "queued"
+    cur.execute("""
+        UPDATE jobs SET status = %s, locked_until = NULL, last_error = %s,
+               run_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        WHERE id = %s
+    """, (status, error, backoff(attempts), job_id))
+    return status
+
+
+def requeue_expired(cur):
+    """Release jobs whose lease ran out (their worker died). Returns how many."""
+    cur.execute("""
+        UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+               locked_until = NULL, last_error = 'lease expired before the job finished'
+        WHERE status = 'running' AND locked_until < CURRENT_TIMESTAMP
+    """)
+    return cur.rowcount
+
+
+def retry_dead(cur, kind=None):
+    """Put dead-lettered jobs (optionally of one kind) back in the queue with fresh attempts."""
+    cur.execute("""
+        UPDATE jobs SET status = 'queued', attempts = 0, run_at = CURRENT_TIMESTAMP
+        WHERE status = 'dead' AND (%s::text IS NULL OR kind = %s)
+    """, (kind, kind))
+    return cur.rowcount
+
+
+def run_next(conn, lease=LEASE, log=print):
+    """Claim and run one due job on `conn`. Returns False if none was due."""
+    cur = conn.cursor()
+    try:
+        job = claim(cur, lease)
+        conn.commit()
+        if job is None:
+            return False
+        job_id, kind, payload, attempts, max_attempts = job
+        try:
+            if kind not in HANDLERS:
+                raise LookupError(f"no handler for job kind {kind!r}")
+            HANDLERS[kind](cur, payload)
+            complete(cur, job_id)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            status = fail(cur, job_id, attempts, max_attempts, f"{type(e).__name__}: {e}")
+            conn.commit()
+            if status == "dead":
+                log(f"job {job_id} ({kind}) failed {attempts} times, dead-lettered: {e}")
+            else:
+                log(f"job {job_id} ({kind}) failed, retrying in {backoff(attempts)}s: {e}")
+        return True
+    finally:
+        cur.close()
+
+
+def queue_counts(cur):
+    """[(kind, status, jobs, oldest run_at)] for every kind and status in the table."""
+    cur.execute("""
+        SELECT kind, status, COUNT(*), MIN(run_at) FROM jobs
+        GROUP BY kind, status ORDER BY kind, status
+    """)
+    return cur.fetchall()
@@ -0,0 +1,188 @@
+"""
+Versioned schema migrations.
+
+Migrations are the numbered SQL files in db/migrations, NNNN_name.sql,
+applied in order. Each applied version is recorded in schema_migrations
+with a checksum of its file, so a run only applies the ones still
+pending. Every step is also written to be idempotent (IF NOT EXISTS,
+guarded DO blocks), so databases created before versioning, from
+db/schema.sql, are brought under it by simply running everything.
+
+A file normally runs as one transaction. Header comments change that:
+
+    -- migrate: no-transaction
+        Statements run one at a time in autocommit, as CREATE INDEX
+        CONCURRENTLY requires. An index left invalid by an interrupted
+        concurrent build is dropped and rebuilt on the next run. Write one
+        plain statement per line-ending ';' (no DO blocks) in these files.
+    -- migrate: optional
+        A failure is reported but does not stop the run, and the version is
+        not recorded, so it is retried next time (e.g. an extension that not
+        every Postgres build ships).
+
+A session advisory lock keeps two deploys from migrating at once.
+"""
+import hashlib
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "migrations")
+
+# Arbitrary, fixed key for pg_advisory_lock
+LOCK_KEY = 724_104_019
+
+_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+_CONCURRENT_INDEX_RE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+class Migration:
+    def __init__(self, version, name, sql):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.encode()).hexdigest()
+        header = [line.strip().lower() for line in sql.splitlines() if line.startswith("-- migrate:")]
+        self.transactional = "-- migrate: no-transaction" not in header
+        self.optional = "-- migrate: optional" in header
+
+    def statements(self):
+        """Statements of a no-transaction file: split where a line ends with ';'."""
+        body = "\n".join(line for line in self.sql.splitlines() if not line.strip().startswith("--"))
+        return [s.strip() for s in re.split(r";\s*$", body, flags=re.M) if s.strip()]
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def load_migrations(folder=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(folder)):
+        match = _FILE_RE.match(filename)
+        if match:
+            with open(os.path.join(folder, filename), encoding="utf-8") as f:
+                migrations.append(Migration(int(match.group(1)), match.group(2), f.read()))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"duplicate migration version in {folder}")
+    return migrations
+
+
+def ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            checksum VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_migrations(cur):
+    """{version: checksum} of the migrations already applied."""
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cur.fetchall())
+
+
+def _record(cur, migration):
+    cur.execute("""
+        INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)
+        ON CONFLICT (version) DO UPDATE SET name = EXCLUDED.name, checksum = EXCLUDED.checksum,
+            applied_at = CURRENT_TIMESTAMP
+    """, (migration.version, migration.name, migration.checksum))
+
+
+def _drop_invalid_index(cur, name):
+    cur.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    """, (name,))
+    if cur.fetchone():
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+        return True
+    return False
+
+
+def apply_migration(conn, migration, log=print):
+    """Apply one migration and record it; raises on failure (after rolling back what it can)."""
+    if migration.transactional:
+        cur = conn.cursor()
+        try:
+            cur.execute(migration.sql)
+            _record(cur, migration)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+        return
+
+    conn.commit()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        for statement in migration.statements():
+            match = _CONCURRENT_INDEX_RE.match(statement)
+            if match and _drop_invalid_index(cur, match.group(1)):
+                log(f"  rebuilding invalid index {match.group(1)} left by an interrupted build")
+            cur.execute(statement)
+        _record(cur, migration)
+    finally:
+        cur.close()
+        conn.autocommit = False
+
+
+def migrate(conn, target=None, log=print):
+    """
+    Apply every pending migration up to `target` (default: all) in version
+    order. Returns (applied, failed_optional) lists of migrations.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+    try:
+        ensure_version_table(cur)
+        conn.commit()
+        done = applied_migrations(cur)
+        applied, failed = [], []
+        for migration in load_migrations():
+            if target is not None and migration.version > target:
+                break
+            if migration.version in done:
+                if done[migration.version] != migration.checksum:
+                    log(f"⚠️  {migration} was changed after it was applied; not re-running it")
+                continue
+            log(f"Applying {migration}...")
+            try:
+                apply_migration(conn, migration, log)
+            except Exception as e:
+                if not migration.optional:
+                    raise
+                log(f"⚠️  optional migration {migration} failed, will retry next run: {e}")
+                failed.append(migration)
+                continue
+            applied.append(migration)
+        return applied, failed
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+        conn.commit()
+        cur.close()
+
+
+def migration_status(conn):
+    """[(migration, state)] with state 'applied', 'pending' or 'changed'."""
+    cur = conn.cursor()
+    ensure_version_table(cur)
+    done = applied_migrations(cur)
+    conn.commit()
+    cur.close()
+    status = []
+    for migration in load_migrations():
+        if migration.version not in done:
+            state = "pending"
+        elif done[migration.version] != migration.checksum:
+            state = "changed"
+        else:
+            state = "applied"
+        status.append((migration, state))
+    return status
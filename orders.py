@@ -0,0 +1,195 @@
+"""
+Order placement and the admin order history.
+
+A checkout is three statements no matter how many lines the cart has:
+lock the cart's product rows in id order, decrement stock for all lines at
+once, and insert the order with all of its items. Locking in a fixed order
+means two checkouts sharing products queue behind each other instead of
+deadlocking, and the conditional decrement means stock never goes negative.
+
+The admin history is keyset-paginated on (order_date, id) with totals
+computed in SQL, so each page costs the same however many orders exist.
+"""
+from datetime import date, datetime, timedelta
+
+from catalog import encode_cursor, unpack_cursor
+
+
+class OutOfStockError(Exception):
+    """Raised when a cart line asks for more than is in stock. The caller must roll back."""
+
+    def __init__(self, shortages):
+        # shortages: list of dicts with product_id, name, requested, available
+        self.shortages = shortages
+        names = ", ".join(f"{s['name']} (only {s['available']} left)" for s in shortages)
+        super().__init__(f"Not enough stock for: {names}" if names else "Not enough stock")
+
+
+def normalize_cart(cart):
+    """Turn a cart ({product_id: qty}) into sorted (ids, quantities) lists, dropping bad lines."""
+    lines = {}
+    for pid, qty in cart.items():
+        try:
+            pid, qty = int(pid), int(qty)
+        except (TypeError, ValueError):
+            continue
+        if qty > 0:
+            lines[pid] = lines.get(pid, 0) + qty
+    ids = sorted(lines)
+    return ids, [lines[pid] for pid in ids]
+
+
+def place_order(cur, user_id, cart, payment_method, payment_status='Completed'):
+    """
+    Write an order for `cart` and take its stock, using cursor `cur`.
+    Returns the new order id. The caller commits; on OutOfStockError the
+    caller must roll back (stock rows are still locked until it does).
+    """
+    product_ids, quantities = normalize_cart(cart)
+    if not product_ids:
+        raise ValueError("cart is empty")
+
+    # Lock every product in the cart in id order and capture current prices
+    cur.execute("""
+        SELECT id, name, price, stock FROM products
+        WHERE id = ANY(%s)
+        ORDER BY id
+        FOR UPDATE
+    """, (product_ids,))
+    products = {row[0]: row for row in cur.fetchall()}
+
+    shortages = []
+    for pid, qty in zip(product_ids, quantities):
+        row = products.get(pid)
+        available = (row[3] or 0) if row else 0
+        if available < qty:
+            shortages.append({
+                'product_id': pid,
+                'name': row[1] if row else f"product #{pid}",
+                'requested': qty,
+                'available': available,
+            })
+    if shortages:
+        raise OutOfStockError(shortages)
+
+    # Conditional decrement for all lines; the guard is a backstop to the check above
+    cur.execute("""
+        UPDATE products p SET stock = p.stock - c.quantity
+        FROM unnest(%s::int[], %s::int[]) AS c(product_id, quantity)
+        WHERE p.id = c.product_id AND p.stock >= c.quantity
+    """, (product_ids, quantities))
+    if cur.rowcount != len(product_ids):
+        raise OutOfStockError([])
+
+    prices = [products[pid][2] for pid in product_ids]
+    cur.execute("""
+        WITH new_order AS (
+            INSERT INTO orders (user_id, payment_method, payment_status)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        )
+        INSERT INTO order_items (order_id, product_id, quantity, price_at_time)
+        SELECT new_order.id, c.product_id, c.quantity, c.price
+        FROM new_order, unnest(%s::int[], %s::int[], %s::numeric[]) AS c(product_id, quantity, price)
+        RETURNING order_id
+    """, (user_id, payment_method, payment_status, product_ids, quantities, prices))
+    return cur.fetchone()[0]
+
+
+# -------------------- Admin order history --------------------
+
+ORDERS_PER_PAGE = 25
+
+
+def _date_arg(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_order_history_args(args):
+    """Normalise date range / cursor query parameters for the admin order history."""
+    after = None
+    if args.get("after"):
+        try:
+            order_date, order_id = unpack_cursor(args["after"])
+            after = (datetime.fromisoformat(order_date), int(order_id))
+        except (ValueError, TypeError):
+            after = None
+    return {
+        "date_from": _date_arg(args.get("date_from")),
+        "date_to": _date_arg(args.get("date_to")),
+        "after": after,
+        "per_page": ORDERS_PER_PAGE,
+    }
+
+
+def fetch_order_history_page(cur, params):
+    """
+    One page of orders, newest first, with item counts and grand totals
+    computed in SQL, plus the line items of just those orders in a second
+    batched query. Returns (orders, next_cursor) where each order dict has
+    a 'products' list.
+    """
+    where, args = [], []
+    if params["date_from"]:
+        where.append("o.order_date >= %s")
+        args.append(params["date_from"])
+    if params["date_to"]:
+        where.append("o.order_date < %s")
+        args.append(params["date_to"] + timedelta(days=1))
+    if params["after"]:
+        where.append("(o.order_date, o.id) < (%s, %s)")
+        args.extend(params["after"])
+    sql = """
+        SELECT
+            o.id AS order_id,
+            u.email AS user_email,
+            o.order_date,
+            o.payment_method,
+            o.payment_status,
+            COALESCE(t.item_count, 0) AS item_count,
+            COALESCE(t.grand_total, 0) AS grand_total
+        FROM orders o
+        JOIN users u ON o.user_id = u.id
+        LEFT JOIN LATERAL (
+            SELECT SUM(oi.quantity) AS item_count,
+                   SUM(COALESCE(oi.price_at_time, p.price) * oi.quantity) AS grand_total
+            FROM order_items oi
+            JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id = o.id
+        ) t ON TRUE
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY o.order_date DESC, o.id DESC LIMIT %s"
+    args.append(params["per_page"] + 1)
+    cur.execute(sql, args)
+    orders = cur.fetchall()
+
+    next_cursor = None
+    if len(orders) > params["per_page"]:
+        orders = orders[:params["per_page"]]
+        next_cursor = encode_cursor(orders[-1]["order_date"], orders[-1]["order_id"])
+
+    by_id = {}
+    for order in orders:
+        order["products"] = []
+        by_id[order["order_id"]] = order
+    if by_id:
+        cur.execute("""
+            SELECT
+                oi.order_id,
+                p.name AS product_name,
+                oi.quantity,
+                COALESCE(oi.price_at_time, p.price) AS price,
+                (COALESCE(oi.price_at_time, p.price) * oi.quantity) AS line_total
+            FROM order_items oi
+            JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id = ANY(%s)
+            ORDER BY oi.order_id, oi.id
+        """, (list(by_id),))
+        for item in cur.fetchall():
+            by_id[item["order_id"]]["products"].append(item)
+    return orders, next_cursor
@@ -0,0 +1,258 @@
+"""
+Full-page cache shared by the worker processes on one host.
+
+Anonymous visitors all get the same HTML for a URL, so one rendered copy
+is stored in a local folder (in /dev/shm when the host has it, so reads
+come from memory) and every gunicorn worker serves it. Each page is one
+file, written to a temporary name and renamed into place, so readers see
+either the old or the new copy, never a partial one.
+
+An entry is fresh for its route's `ttl`, then stale for `stale_ttl` more
+seconds (stale-while-revalidate). A request for a stale page tries to take
+the page's lock (flock on a side file) without waiting: the one worker
+that gets it renders the page again for its own request and stores it,
+while the others keep serving the stale copy. A request with no usable
+copy at all waits up to `lock_wait` seconds for whoever is rendering it,
+so a cold page under a traffic spike is still rendered once per host.
+
+purge() drops every entry on this host at once by advancing a generation
+stamp (the mtime of a marker file); entries from an older generation are
+ignored and later overwritten or pruned. Other hosts expire theirs by TTL.
+
+The folder is usually in RAM, so it is bounded: every PRUNE_EVERY stores a
+worker sweeps out expired pages and then, while there are more than
+`max_entries` pages or more than `max_bytes` in them, the least recently
+written ones. Between sweeps each worker can go over by PRUNE_EVERY pages.
+A lock file is only removed once its page is gone and while the sweeping
+worker holds the lock itself, and a worker that gets a lock checks that
+its file is still in place, so a sweep never lets two workers render the
+same page.
+Callers should also key pages on the parameters the page depends on, not
+the raw URL, so junk query strings do not each get their own copy.
+
+Without fcntl (Windows) pages are still cached and shared, but each
+worker renders its own copy when one expires.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # optional: no single-flight regeneration
+    fcntl = None
+
+PRUNE_EVERY = 50  # stores between sweeps for expired and surplus files
+
+
+def default_folder():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "retail-page-cache")
+
+
+def _same_file(f, path):
+    """Whether the open file `f` is still the file at `path`."""
+    try:
+        return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+    except OSError:
+        return False
+
+
+class PageEntry:
+    __slots__ = ("body", "mimetype", "etag", "expires", "generation")
+
+    def __init__(self, body, mimetype, etag, expires, generation):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.expires = expires
+        self.generation = generation
+
+
+class SharedPageCache:
+    def __init__(self, folder=None, stale_ttl=300.0, lock_wait=2.0, max_entries=2000, max_bytes=64 * 1024 * 1024):
+        self.folder = folder or default_folder()
+        self.stale_ttl = stale_ttl
+        self.lock_wait = lock_wait
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(self.folder, exist_ok=True)
+        self._marker = os.path.join(self.folder, "generation")
+        if not os.path.exists(self._marker):
+            open(self._marker, "a").close()
+        self._stores = 0
+        self.counts = {"hit": 0, "stale": 0, "miss": 0, "purges": 0, "evicted": 0}
+
+    def _path(self, key):
+        return os.path.join(self.folder, hashlib.sha256(key.encode()).hexdigest()[:32])
+
+    def generation(self):
+        try:
+            return os.stat(self._marker).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def purge(self):
+        """Invalidate every page on this host, e.g. after the catalog changed."""
+        now = time.time_ns()
+        # Strictly increasing even if two purges land in the same clock tick
+        stamp = max(now, self.generation() + 1)
+        try:
+            os.utime(self._marker, ns=(stamp, stamp))
+        except FileNotFoundError:
+            open(self._marker, "a").close()
+            os.utime(self._marker, ns=(stamp, stamp))
+        self.counts["purges"] += 1
+
+    def read(self, key):
+        """The stored entry for `key` from the current generation, or None."""
+        try:
+            with open(self._path(key) + ".page", "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta["generation"] < self.generation():
+            return None
+        return PageEntry(body, meta["mimetype"], meta["etag"], meta["expires"], meta["generation"])
+
+    def store(self, key, body, mimetype, ttl, generation):
+        """Write a page rendered during `generation` (read before rendering, so a purge mid-render wins)."""
+        if generation < self.generation():
+            return None
+        entry = PageEntry(body, mimetype, hashlib.sha256(body).hexdigest()[:20], time.time() + ttl, generation)
+        meta = {"mimetype": mimetype, "etag": entry.etag, "expires": entry.expires, "generation": generation}
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(meta).encode() + b"\n")
+                f.write(body)
+            os.replace(tmp, self._path(key) + ".page")
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        self._stores += 1
+        if self._stores % PRUNE_EVERY == 0:
+            self.prune()
+        return entry
+
+    def _lock(self, key, wait):
+        """An flock'ed file object for `key`, or None if not acquired within `wait` seconds."""
+        if fcntl is None:
+            return None
+        path = self._path(key) + ".lock"
+        f = open(path, "a")
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    f.close()
+                    return None
+                time.sleep(0.02)
+                continue
+            if _same_file(f, path):
+                return f
+            # prune() removed the lock file after we opened it: lock the new one
+            f.close()
+            f = open(path, "a")
+
+    def fetch(self, key, ttl, render):
+        """
+        (entry, state) for `key`, with state 'hit', 'stale' or 'miss'. On a
+        miss, render() -> (body bytes, mimetype) builds the page, or returns
+        None for a response that must not be cached; then entry is None.
+        """
+        entry = self.read(key)
+        if entry is not None and time.time() < entry.expires:
+            self.counts["hit"] += 1
+            return entry, "hit"
+        stale = entry is not None and time.time() < entry.expires + self.stale_ttl
+        lock = self._lock(key, 0 if stale else self.lock_wait)
+        if lock is None and stale and fcntl is not None:
+            # Another worker is rendering it
+            self.counts["stale"] += 1
+            return entry, "stale"
+        try:
+            if lock is not None:
+                # Whoever held the lock before us may have just stored it
+                entry = self.read(key)
+                if entry is not None and time.time() < entry.expires:
+                    self.counts["hit"] += 1
+                    return entry, "hit"
+            self.counts["miss"] += 1
+            generation = self.generation()
+            rendered = render()
+            if rendered is None:
+                return None, "miss"
+            body, mimetype = rendered
+            entry = self.store(key, body, mimetype, ttl, generation)
+            if entry is None:
+                entry = PageEntry(body, mimetype, hashlib.sha256(body).hexdigest()[:20], 0, generation)
+            return entry, "miss"
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def _remove(self, path):
+        """Delete a page file (its lock file stays: another worker may hold it)."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remove_lock(self, path):
+        """Delete a lock file, only while holding its lock, so no render is under way."""
+        try:
+            with open(path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if _same_file(f, path):
+                    os.remove(path)
+        except OSError:  # BlockingIOError: someone is rendering the page
+            pass
+
+    def prune(self):
+        """
+        Delete page files past their stale window or from an older
+        generation, then the least recently written ones over max_entries
+        or max_bytes.
+        """
+        now, generation = time.time(), self.generation()
+        pages, locks = [], set()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if name.endswith(".page"):
+                    with open(path, "rb") as f:
+                        meta = json.loads(f.readline())
+                    if meta["expires"] + self.stale_ttl < now or meta["generation"] < generation:
+                        self._remove(path)
+                    else:
+                        st = os.stat(path)
+                        pages.append((st.st_mtime, st.st_size, path))
+                elif name.endswith(".lock"):
+                    locks.add(path)
+                elif name.endswith(".tmp") and os.stat(path).st_mtime < now - 60:
+                    os.remove(path)
+            except (OSError, ValueError):
+                pass
+        pages.sort()
+        total = sum(size for _, size, _ in pages)
+        while pages and (len(pages) > self.max_entries or total > self.max_bytes):
+            _, size, path = pages.pop(0)
+            self._remove(path)
+            total -= size
+            self.counts["evicted"] += 1
+        # Lock files of pages that are gone, unless a worker holds them
+        if fcntl is not None:
+            live = {path[:-len(".page")] + ".lock" for _, _, path in pages}
+            for path in locks - live:
+                self._remove_lock(path)
+
+    def stats(self):
+        return {"folder": self.folder, "stale_ttl": self.stale_ttl, "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes, **self.counts}
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the hot queries.
+
+Runs EXPLAIN on the statements behind the busiest routes (login, product
+and cart lookups, the catalog, a user's orders, the admin order history,
+invoices) with parameters taken from the data, and fails (exit 1) if any
+plan contains a sequential scan on a table with at least --min-rows rows.
+Small tables are left alone: scanning them is what the planner should do.
+
+    DATABASE_URL=postgresql://... python plan_check.py
+    python plan_check.py --min-rows 1000 --analyze --verbose
+
+The plans depend on table statistics; --analyze refreshes them first.
+"""
+import argparse
+import json
+import os
+import sys
+
+from catalog import parse_catalog_args, fetch_product_page
+from orders import parse_order_history_args, fetch_order_history_page
+import queries
+
+DEFAULT_MIN_ROWS = 10000
+
+TABLES = ["users", "products", "orders", "order_items", "carts", "cart_items", "invoices"]
+
+
+class ExplainCursor:
+    """
+    Stands in for a RealDictCursor in code that builds and runs its own
+    query: each execute() runs EXPLAIN of the statement instead, and the
+    fetches return nothing.
+    """
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.plans = []
+
+    def execute(self, sql, params=None):
+        self._cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        self.plans.append((sql, self._cur.fetchone()[0][0]["Plan"]))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+def explain_query(cur, q, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + q.sql, [list(p) if isinstance(p, tuple) else p for p in params])
+    return cur.fetchone()[0][0]["Plan"]
+
+
+def seq_scans(plan):
+    """Relation names of every Seq Scan node in a plan tree."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def sample_values(cur):
+    """Real ids to plan with, so the planner sees typical selectivity."""
+    def scalar(sql):
+        cur.execute(sql)
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    return {
+        "email": scalar("SELECT email FROM users ORDER BY id DESC LIMIT 1") or "nobody@example.com",
+        "user_id": scalar("SELECT user_id FROM orders ORDER BY id DESC LIMIT 1") or 0,
+        "product_id": scalar("SELECT id FROM products ORDER BY id DESC LIMIT 1") or 0,
+        "order_id": scalar("SELECT id FROM orders ORDER BY id DESC LIMIT 1") or 0,
+        "cart_id": scalar("SELECT id FROM carts ORDER BY updated_at DESC LIMIT 1") or "",
+    }
+
+
+def hot_query_plans(cur, sample):
+    """[(name, plan)] for every hot query."""
+    plans = [
+        ("login", explain_query(cur, queries.USER_BY_CREDENTIALS, (sample["email"], "x"))),
+        ("user by id", explain_query(cur, queries.USER_BY_ID, (sample["user_id"],))),
+        ("product by id", explain_query(cur, queries.PRODUCT_BY_ID, (sample["product_id"],))),
+        ("products by ids", explain_query(cur, queries.PRODUCTS_BY_IDS, ([sample["product_id"]] * 3,))),
+        ("cart", explain_query(cur, queries.CART_PRODUCTS, (sample["cart_id"],))),
+        ("user orders", explain_query(cur, queries.ORDERS_BY_USER, (sample["user_id"],))),
+        ("invoice", explain_query(cur, queries.INVOICE_DOCUMENT, (sample["order_id"],))),
+    ]
+    explain = ExplainCursor(cur)
+    for sort in ("id", "name", "price"):
+        fetch_product_page(explain, parse_catalog_args({"sort": sort}))
+        plans.append((f"catalog by {sort}", explain.plans[-1][1]))
+    fetch_order_history_page(explain, parse_order_history_args({}))
+    plans.append(("admin order history", explain.plans[-1][1]))
+    return plans
+
+
+def check_plans(conn, min_rows=DEFAULT_MIN_ROWS):
+    """Return ([(name, plan)], [(name, table, rows)] of sequential scans on large tables)."""
+    cur = conn.cursor()
+    cur.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s) AND relkind = 'r'",
+                (TABLES,))
+    rows = dict(cur.fetchall())
+    plans = hot_query_plans(cur, sample_values(cur))
+    conn.rollback()
+    cur.close()
+    problems = [
+        (name, table, rows.get(table, 0))
+        for name, plan in plans
+        for table in seq_scans(plan)
+        if rows.get(table, 0) >= min_rows
+    ]
+    return plans, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS,
+                        help=f"tables with fewer (estimated) rows may be scanned (default {DEFAULT_MIN_ROWS})")
+    parser.add_argument("--analyze", action="store_true", help="ANALYZE the tables first")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+    import psycopg2
+    if "supabase" in database_url:
+        conn = psycopg2.connect(database_url, sslmode="require")
+    else:
+        conn = psycopg2.connect(database_url)
+
+    try:
+        if args.analyze:
+            cur = conn.cursor()
+            cur.execute("ANALYZE " + ", ".join(TABLES))
+            conn.commit()
+            cur.close()
+        plans, problems = check_plans(conn, args.min_rows)
+    finally:
+        conn.close()
+
+    for name, plan in plans:
+        scans = seq_scans(plan)
+        print(f"  {name:<22} {plan['Node Type']:<18} cost {plan['Total Cost']:>10.1f}"
+              + (f"  seq scan: {', '.join(scans)}" if scans else ""))
+        if args.verbose:
+            print(json.dumps(plan, indent=2))
+    for name, table, n in problems:
+        print(f"❌ {name}: sequential scan on {table} (~{n} rows)")
+    if problems:
+        sys.exit(1)
+    print(f"✅ No sequential scans on tables with {args.min_rows}+ rows.")
+
+
+if __name__ == "__main__":
+    main()
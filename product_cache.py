@@ -0,0 +1,170 @@
+"""
+In-process product cache, invalidated through a catalog version in the database.
+
+Every worker keeps its own LRU of product rows (by id), rendered catalog
+pages, rendered template fragments (fragment_cache.py), search suggestions
+and related products (recommendations.py). The admin product routes bump
+catalog_meta.version in the same transaction as their write; other workers
+and serverless instances notice the new version at their next check (at
+most every `check_interval` seconds) and drop everything they cached.
+Entries also expire after `ttl` seconds, which bounds how stale stock
+counts changed by checkouts, and recommendations rebuilt offline, can get.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from queries import run, PRODUCTS_BY_IDS, RELATED_PRODUCTS
+
+
+def bump_catalog_version(cur):
+    """
+    Advance catalog_meta.version and return (version, updated_at). For code
+    outside the web app (scripts); routes use ProductCache.bump, which also
+    clears the local cache at once.
+    """
+    cur.execute("""
+        INSERT INTO catalog_meta (id, version, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (id) DO UPDATE
+            SET version = catalog_meta.version + 1, updated_at = CURRENT_TIMESTAMP
+        RETURNING version, updated_at
+    """)
+    return cur.fetchone()
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with a size bound and per-entry TTL."""
+
+    def __init__(self, maxsize=1000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class ProductCache:
+    def __init__(self, max_products=1000, max_pages=200, ttl=60.0, check_interval=2.0, max_fragments=2000):
+        self.products = LRUCache(max_products, ttl)
+        self.pages = LRUCache(max_pages, ttl)
+        self.fragments = LRUCache(max_fragments, ttl)
+        self.searches = LRUCache(max_pages, ttl)
+        self.related = LRUCache(max_products, ttl)
+        self.check_interval = check_interval
+        self.version = None
+        self.last_modified = None
+        self._checked_at = 0.0
+
+    def _apply_version(self, version, updated_at):
+        if version != self.version:
+            self.products.clear()
+            self.pages.clear()
+            self.fragments.clear()
+            self.searches.clear()
+            self.related.clear()
+        self.version, self.last_modified = version, updated_at
+        self._checked_at = time.monotonic()
+
+    def sync(self, mysql):
+        """
+        Re-read the catalog version if the last check is older than
+        check_interval, clearing the cache when it moved. Returns
+        (version, last_modified).
+        """
+        if self.version is None or time.monotonic() - self._checked_at >= self.check_interval:
+            cur = mysql.connection.cursor()
+            cur.execute("SELECT version, updated_at FROM catalog_meta WHERE id = 1")
+            row = cur.fetchone()
+            cur.close()
+            if row and self.version is not None and row[0] < self.version:
+                # A lagging replica (@read_only routes) behind a version this worker already saw
+                self._checked_at = time.monotonic()
+            else:
+                self._apply_version(*(row or (0, None)))
+        return self.version, self.last_modified
+
+    def bump(self, cur):
+        """Advance the catalog version; call inside the transaction that changes products."""
+        self._apply_version(*bump_catalog_version(cur))
+
+    def get_products(self, mysql, product_ids):
+        """Return {id: product row} for product_ids, querying only the ids not cached."""
+        self.sync(mysql)
+        found, missing = {}, []
+        for pid in product_ids:
+            row = self.products.get(pid)
+            if row is None:
+                missing.append(pid)
+            else:
+                found[pid] = row
+        if missing:
+            from psycopg2.extras import RealDictCursor
+            cur = mysql.connection.cursor(RealDictCursor)
+            for row in run(cur, PRODUCTS_BY_IDS, (missing,)).fetchall():
+                self.products.set(row['id'], row)
+                found[row['id']] = row
+            cur.close()
+        return found
+
+    def get_related(self, mysql, product_ids):
+        """
+        Return {id: ((related id, score), ...)} for product_ids, best first,
+        querying only the ids not cached. Products without recommendations
+        map to an empty tuple, which is cached too.
+        """
+        self.sync(mysql)
+        found, missing = {}, []
+        for pid in product_ids:
+            pairs = self.related.get(pid)
+            if pairs is None:
+                missing.append(pid)
+            else:
+                found[pid] = pairs
+        if missing:
+            from psycopg2.extras import RealDictCursor
+            cur = mysql.connection.cursor(RealDictCursor)
+            rows = {row['product_id']: row for row in run(cur, RELATED_PRODUCTS, (missing,)).fetchall()}
+            cur.close()
+            for pid in missing:
+                row = rows.get(pid)
+                pairs = tuple(zip(row['related'], row['scores'])) if row else ()
+                self.related.set(pid, pairs)
+                found[pid] = pairs
+        return found
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "products": self.products.stats(),
+            "pages": self.pages.stats(),
+            "fragments": self.fragments.stats(),
+            "searches": self.searches.stats(),
+            "related": self.related.stats(),
+        }
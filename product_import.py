@@ -0,0 +1,281 @@
+"""
+Bulk product import and price/stock sync.
+
+Rows are read from CSV or NDJSON and validated in Python, with errors
+recorded per input line. The valid rows are COPY'd into a temporary
+staging table and applied to products with one set-based statement:
+
+- mode 'upsert': insert or update by sku (sku and name required, and a
+  price for skus that are not in products yet)
+- mode 'update': update price and/or stock of existing products matched
+  by id or sku; unknown keys are reported, nothing is inserted
+
+A product named twice in one file (the same sku, or in update mode the
+same id, directly or through its sku) is applied from its first line
+only; the later lines are reported as duplicates.
+
+Used by the admin upload (/admin/import_products) and import_products.py.
+The caller commits, and bumps the catalog version so caches drop the old rows.
+"""
+import csv
+import io
+import json
+import tempfile
+from decimal import Decimal, InvalidOperation
+
+FIELDS = ['id', 'sku', 'name', 'description', 'price', 'stock', 'image']
+NAME_MAX = 100
+SKU_MAX = 64
+MAX_REPORTED_ERRORS = 500
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []  # (line, message)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def error_count(self):
+        return len(self.errors)
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'errors': self.error_count,
+        }
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) from a text stream of CSV (with header) or NDJSON."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f"invalid JSON: {e}")
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError("expected a JSON object")
+    else:
+        raise ValueError(f"unsupported format: {fmt}")
+
+
+def _clean(row, mode):
+    """Validate one input row; returns the staging tuple or raises ValueError."""
+    def text(key):
+        value = row.get(key)
+        if value is None:
+            return None
+        value = str(value).strip()
+        return value or None
+
+    product_id = text('id')
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+        except ValueError:
+            raise ValueError("id must be an integer")
+    sku = text('sku')
+    if sku is not None and len(sku) > SKU_MAX:
+        raise ValueError(f"sku longer than {SKU_MAX} characters")
+    name = text('name')
+    if name is not None and len(name) > NAME_MAX:
+        raise ValueError(f"name longer than {NAME_MAX} characters")
+
+    price = text('price')
+    if price is not None:
+        try:
+            price = Decimal(price)
+        except InvalidOperation:
+            raise ValueError("price must be a number")
+        if price < 0 or price >= Decimal('100000000'):
+            raise ValueError("price out of range")
+        price = price.quantize(Decimal('0.01'))
+    stock = text('stock')
+    if stock is not None:
+        try:
+            stock = int(stock)
+        except ValueError:
+            raise ValueError("stock must be an integer")
+        if stock < 0:
+            raise ValueError("stock cannot be negative")
+
+    if mode == 'upsert':
+        if not sku:
+            raise ValueError("sku is required")
+        if not name:
+            raise ValueError("name is required")
+    else:
+        if product_id is None and not sku:
+            raise ValueError("id or sku is required")
+        if price is None and stock is None:
+            raise ValueError("nothing to update: give price and/or stock")
+    return product_id, sku, name, text('description'), price, stock, text('image')
+
+
+def _stage(cur, rows, mode, report):
+    """Validate rows and COPY the good ones into the product_import temp table."""
+    cur.execute("""
+        CREATE TEMP TABLE product_import (
+            line INTEGER, id INTEGER, sku TEXT, name TEXT, description TEXT,
+            price NUMERIC(10, 2), stock INTEGER, image TEXT
+        ) ON COMMIT DROP
+    """)
+    seen = {}
+    # Spills to disk past 8 MB so large files don't sit in memory
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+', newline='') as buf:
+        writer = csv.writer(buf)
+        for line, row in rows:
+            report.rows += 1
+            if isinstance(row, Exception):
+                report.error(line, str(row))
+                continue
+            try:
+                values = _clean(row, mode)
+            except ValueError as e:
+                report.error(line, str(e))
+                continue
+            # The key the mode matches products on; update mode also checks
+            # ids once skus are resolved (_update)
+            if mode == 'upsert' or values[0] is None:
+                key = ('sku', values[1])
+            else:
+                key = ('id', values[0])
+            if key in seen:
+                report.error(line, f"duplicate {key[0]} {key[1]} (first on line {seen[key]})")
+                continue
+            seen[key] = line
+            writer.writerow([line] + ['\\N' if v is None else v for v in values])
+        buf.seek(0)
+        cur.copy_expert(
+            "COPY product_import (line, id, sku, name, description, price, stock, image) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buf,
+        )
+    cur.execute("ANALYZE product_import")
+
+
+def _upsert(cur, report):
+    # New products need a price: pages format it and checkout copies it
+    cur.execute("""
+        DELETE FROM product_import s
+        WHERE s.price IS NULL AND NOT EXISTS (SELECT 1 FROM products p WHERE p.sku = s.sku)
+        RETURNING s.line
+    """)
+    for (line,) in cur.fetchall():
+        report.error(line, "price required for new products")
+    # Lock in id order, the same order checkout uses, so the two never deadlock
+    cur.execute("""
+        SELECT p.id FROM products p
+        JOIN product_import s ON s.sku = p.sku
+        ORDER BY p.id
+        FOR UPDATE OF p
+    """)
+    # Columns left empty in the file keep their current value on existing products
+    cur.execute("""
+        WITH updated AS (
+            UPDATE products p SET
+                name = s.name,
+                description = COALESCE(s.description, p.description),
+                price = COALESCE(s.price, p.price),
+                stock = COALESCE(s.stock, p.stock),
+                image = COALESCE(s.image, p.image)
+            FROM product_import s
+            WHERE p.sku = s.sku
+            RETURNING p.id
+        ), inserted AS (
+            INSERT INTO products (sku, name, description, price, stock, image)
+            SELECT s.sku, s.name, s.description, s.price, COALESCE(s.stock, 0), COALESCE(s.image, '')
+            FROM product_import s
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.sku = s.sku)
+            ORDER BY s.line
+            ON CONFLICT (sku) DO NOTHING
+            RETURNING id
+        )
+        SELECT (SELECT COUNT(*) FROM inserted), (SELECT COUNT(*) FROM updated)
+    """)
+    report.inserted, report.updated = cur.fetchone()
+
+
+def _update(cur, report):
+    # Resolve sku-only rows to ids, then report keys that match nothing
+    cur.execute("""
+        UPDATE product_import s SET id = p.id
+        FROM products p
+        WHERE s.id IS NULL AND p.sku = s.sku
+    """)
+    # An id row and a sku row can name the same product: keep the first
+    cur.execute("""
+        WITH first AS (
+            SELECT id, MIN(line) AS line FROM product_import WHERE id IS NOT NULL GROUP BY id
+        )
+        DELETE FROM product_import s USING first f
+        WHERE s.id = f.id AND s.line > f.line
+        RETURNING s.line, s.id, f.line
+    """)
+    for line, product_id, first in cur.fetchall():
+        report.error(line, f"duplicate id {product_id} (first on line {first})")
+    cur.execute("""
+        SELECT s.line, COALESCE(s.id::text, s.sku) FROM product_import s
+        WHERE s.id IS NULL OR NOT EXISTS (SELECT 1 FROM products p WHERE p.id = s.id)
+        ORDER BY s.line
+    """)
+    for line, key in cur.fetchall():
+        report.error(line, f"no product with id/sku {key}")
+    # Same id-order locking as checkout
+    cur.execute("""
+        SELECT p.id FROM products p
+        JOIN product_import s ON s.id = p.id
+        ORDER BY p.id
+        FOR UPDATE OF p
+    """)
+    cur.execute("""
+        UPDATE products p SET
+            price = COALESCE(s.price, p.price),
+            stock = COALESCE(s.stock, p.stock)
+        FROM product_import s
+        WHERE p.id = s.id
+    """)
+    report.updated = cur.rowcount
+
+
+def import_products(cur, rows, mode='upsert'):
+    """
+    Validate and apply `rows` (from read_rows) with cursor `cur`.
+    Returns an ImportReport. The caller commits or rolls back.
+    """
+    if mode not in ('upsert', 'update'):
+        raise ValueError(f"unsupported mode: {mode}")
+    report = ImportReport()
+    _stage(cur, rows, mode, report)
+    if mode == 'upsert':
+        _upsert(cur, report)
+    else:
+        _update(cur, report)
+    report.errors.sort()
+    return report
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def text_stream(binary):
+    """Wrap an uploaded binary file for read_rows."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Report what a cold start of the Vercel entry point spends its import time on.
+
+Runs `python -X importtime -c "import api.index"` in a fresh interpreter and
+groups the per-module self times by top-level package, so a new heavy import
+shows up at the top of the list.
+
+    python profile_startup.py              # top 20 packages
+    python profile_startup.py --top 50 --modules   # individual modules instead
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINT = "api.index"
+
+
+def import_profile(entry_point=ENTRY_POINT):
+    """Return [(module, self_us, cumulative_us)] for importing `entry_point` in a new interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {entry_point}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {entry_point} failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line.split(":", 1)[1].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--modules", action="store_true", help="list modules instead of packages")
+    parser.add_argument("--entry-point", default=ENTRY_POINT)
+    args = parser.parse_args()
+
+    rows = import_profile(args.entry_point)
+    costs, counts = defaultdict(int), defaultdict(int)
+    for module, self_us, _ in rows:
+        key = module if args.modules else module.split(".")[0]
+        costs[key] += self_us
+        counts[key] += 1
+    total = sum(costs.values())
+
+    print(f"Import of {args.entry_point}: {total / 1000:.1f} ms across {len(rows)} modules\n")
+    print(f"{'ms':>8} {'share':>6} {'modules':>8}  {'module' if args.modules else 'package'}")
+    for key, us in sorted(costs.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{us / 1000:8.1f} {us / total:6.1%} {counts[key]:8d}  {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Central definitions of the app's own queries.
+
+Each query is declared once below with psycopg2-style %s placeholders and
+run through run(cur, QUERY, params):
+
+- PostgreSQL: the first run on a connection PREPAREs it server-side and
+  every run is an EXECUTE, so the hot paths (login, product by id, cart,
+  orders by user) are parsed and planned once per pooled connection rather
+  than on every request. Lists are bound as one array parameter
+  (id = ANY(%s)), so the statement text does not depend on the list length.
+  Transaction-mode poolers (PgBouncer, Supabase's port 6543) cannot keep
+  prepared statements between transactions: there, or with
+  DB_PREPARED_STATEMENTS=0, queries run as plain parameterised statements.
+- SQLite: placeholders become ?, and = ANY(%s) becomes
+  IN (SELECT value FROM json_each(?)) with the list bound as JSON, so the
+  same definitions run offline against connect_sqlite(). A query whose SQL
+  does not translate declares its own SQLite text (sqlite="..."), or
+  sqlite=False when it is PostgreSQL only, and run() then raises
+  NotImplementedError on SQLite instead of failing inside the statement.
+
+Outside this module, the catalog listing (catalog.fetch_product_page) and
+the invoice snapshots (invoices.py) also run on SQLite. Cart writes
+(carts.py), checkout and the admin order history (orders.py), imports and
+the stats rollups (stats.py) are PostgreSQL only.
+"""
+import json
+import os
+import re
+import weakref
+from decimal import Decimal
+
+PRODUCT_COLUMNS = "id, name, description, price, stock, image, sku"
+USER_COLUMNS = "id, username, email, role"
+
+_ANY_RE = re.compile(r"=\s*ANY\(%s\)")
+
+
+class Query:
+    def __init__(self, name, sql, sqlite=None):
+        self.name = name
+        self.sql = " ".join(sql.split())
+        self.n_params = self.sql.count("%s")
+        numbered = iter(range(1, self.n_params + 1))
+        self.prepare_sql = f"PREPARE {name} AS " + re.sub(r"%s", lambda m: f"${next(numbered)}", self.sql)
+        self.execute_sql = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * self.n_params)})" if self.n_params else "")
+        if sqlite is False:
+            self.sqlite_sql = None
+        else:
+            sqlite = self.sql if sqlite is None else " ".join(sqlite.split())
+            if sqlite.count("%s") != self.n_params:
+                raise ValueError(f"{name}: the SQLite variant takes a different number of parameters")
+            self.sqlite_sql = _ANY_RE.sub("IN (SELECT value FROM json_each(%s))", sqlite).replace("%s", "?")
+
+
+QUERIES = {}
+
+
+def query(name, sql, sqlite=None):
+    q = Query(name, sql, sqlite)
+    QUERIES[name] = q
+    return q
+
+
+# -------------------- Users --------------------
+USER_BY_CREDENTIALS = query("user_by_credentials", f"""
+    SELECT {USER_COLUMNS} FROM users WHERE email = %s AND password = %s
+""")
+USER_BY_ID = query("user_by_id", f"SELECT {USER_COLUMNS} FROM users WHERE id = %s")
+ALL_USERS = query("all_users", f"SELECT {USER_COLUMNS} FROM users ORDER BY id")
+CREATE_USER = query("create_user", """
+    INSERT INTO users (username, email, password) VALUES (%s, %s, %s) RETURNING id
+""")
+UPDATE_USER = query("update_user", "UPDATE users SET username = %s, email = %s WHERE id = %s")
+DELETE_USER = query("delete_user", "DELETE FROM users WHERE id = %s RETURNING role")
+
+# -------------------- Products --------------------
+PRODUCT_BY_ID = query("product_by_id", f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = %s")
+PRODUCTS_BY_IDS = query("products_by_ids", f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = ANY(%s)")
+CREATE_PRODUCT = query("create_product", """
+    INSERT INTO products (name, description, price, stock, image) VALUES (%s, %s, %s, %s, %s) RETURNING id
+""")
+UPDATE_PRODUCT = query("update_product", """
+    UPDATE products SET name = %s, description = %s, price = %s, stock = %s WHERE id = %s
+""")
+UPDATE_PRODUCT_WITH_IMAGE = query("update_product_with_image", """
+    UPDATE products SET name = %s, description = %s, price = %s, stock = %s, image = %s WHERE id = %s
+""")
+DELETE_PRODUCT = query("delete_product", "DELETE FROM products WHERE id = %s")
+
+# -------------------- Carts --------------------
+CART_PRODUCTS = query("cart_products", """
+    SELECT p.id, p.name, p.description, p.price, p.stock, p.image, ci.quantity
+    FROM cart_items ci
+    JOIN products p ON p.id = ci.product_id
+    WHERE ci.cart_id = %s
+    ORDER BY ci.added_at, ci.product_id
+""")
+
+# -------------------- Orders --------------------
+ORDERS_BY_USER = query("orders_by_user", """
+    SELECT id, user_id, payment_method, payment_status, order_date, created_at
+    FROM orders WHERE user_id = %s ORDER BY id
+""")
+INVOICE_DOCUMENT = query("invoice_document", "SELECT document FROM invoices WHERE order_id = %s")
+RECENT_PURCHASES = query("recent_purchases", """
+    SELECT oi.product_id FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.user_id = %s ORDER BY o.id DESC, oi.id LIMIT %s
+""")
+
+# -------------------- Recommendations --------------------
+RELATED_PRODUCTS = query("related_products", """
+    SELECT product_id, related, scores FROM product_recommendations WHERE product_id = ANY(%s)
+""", sqlite=False)
+
+
+# -------------------- Execution --------------------
+_settings = {"prepared": True}
+
+# Statement names already prepared on each live psycopg2 connection
+_prepared = weakref.WeakKeyDictionary()
+
+
+def configure(database_url=None, prepared=None):
+    """
+    Decide whether to use server-side prepared statements. `prepared` None
+    means automatic: on, unless DB_PREPARED_STATEMENTS=0 or the URL points
+    at a transaction-mode pooler.
+    """
+    if prepared is None:
+        setting = os.environ.get("DB_PREPARED_STATEMENTS", "auto").lower()
+        if setting in ("0", "false", "off"):
+            prepared = False
+        elif setting in ("1", "true", "on"):
+            prepared = True
+        else:
+            url = database_url or ""
+            prepared = not (":6543" in url or "pgbouncer=true" in url)
+    _settings["prepared"] = prepared
+
+
+def _is_sqlite(cur):
+    return type(cur).__module__ == "sqlite3"
+
+
+def run(cur, q, params=()):
+    """Execute query `q` with `params` on `cur` and return the cursor for fetching."""
+    if len(params) != q.n_params:
+        raise TypeError(f"{q.name} takes {q.n_params} parameters, got {len(params)}")
+    if _is_sqlite(cur):
+        if q.sqlite_sql is None:
+            raise NotImplementedError(f"{q.name} is PostgreSQL only")
+        cur.execute(q.sqlite_sql, [json.dumps(p) if isinstance(p, (list, tuple)) else p for p in params])
+        return cur
+    params = [list(p) if isinstance(p, tuple) else p for p in params]
+    if not _settings["prepared"]:
+        cur.execute(q.sql, params)
+        return cur
+    conn = cur.connection
+    names = _prepared.get(conn)
+    if names is None:
+        names = _prepared[conn] = set()
+    if q.name not in names:
+        cur.execute(q.prepare_sql)
+        names.add(q.name)
+    cur.execute(q.execute_sql, params)
+    return cur
+
+
+def stats():
+    return {
+        "prepared": _settings["prepared"],
+        "queries": len(QUERIES),
+        "connections": len(_prepared),
+        "prepared_statements": sum(len(names) for names in _prepared.values()),
+    }
+
+
+# -------------------- SQLite (offline) --------------------
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "schema_sqlite.sql")
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def connect_sqlite(path="temp.db"):
+    """
+    Open (and if needed create) an offline SQLite database with the app's
+    tables and the product search index. Rows come back as dicts, like
+    psycopg2's RealDictCursor.
+    """
+    import sqlite3
+    from search import ensure_sqlite_search
+
+    sqlite3.register_adapter(Decimal, str)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = _dict_row
+    conn.execute("PRAGMA foreign_keys = ON")
+    with open(SQLITE_SCHEMA) as f:
+        conn.executescript(f.read())
+    ensure_sqlite_search(conn)
+    return conn
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Recompute the dashboard statistics (stats_counters, sales_daily) from the
+orders, order_items, users and products tables.
+
+Run after bulk data changes made outside the app, or to reconcile the
+incrementally maintained numbers:
+
+    DATABASE_URL=postgresql://... python rebuild_stats.py
+"""
+import os
+import sys
+
+import psycopg2
+
+from stats import rebuild_stats
+
+database_url = os.environ.get("DATABASE_URL")
+if not database_url:
+    print("ERROR: environment variable DATABASE_URL not set")
+    sys.exit(1)
+
+print("Using DATABASE_URL:", database_url.split("@", 1)[0] + "@...")
+
+if "supabase" in database_url:
+    conn = psycopg2.connect(database_url, sslmode="require")
+else:
+    conn = psycopg2.connect(database_url)
+
+try:
+    cur = conn.cursor()
+    rebuild_stats(cur)
+    conn.commit()
+    cur.execute("SELECT name, SUM(value) FROM stats_counters GROUP BY name ORDER BY name")
+    for name, value in cur.fetchall():
+        print(f"  {name}: {value}")
+    cur.execute("SELECT COUNT(*), MIN(day), MAX(day) FROM sales_daily")
+    rows, first_day, last_day = cur.fetchone()
+    print(f"  sales_daily: {rows} rows ({first_day} .. {last_day})")
+    cur.close()
+    print("✅ Statistics rebuilt.")
+except Exception as e:
+    conn.rollback()
+    print("ERROR rebuilding statistics:", e)
+    raise
+finally:
+    conn.close()
@@ -0,0 +1,286 @@
+"""
+"Frequently bought together" recommendations, computed offline.
+
+build_recommendations.py reads order_items through a server-side cursor,
+whole orders at a time, and counts for every pair of products the orders
+that contain both: each batch becomes a sparse order x product incidence
+matrix B (SciPy), and B.T @ B adds that batch's counts to a product x
+product co-occurrence matrix whose diagonal is each product's own order
+count. A product's related products are ranked by cosine similarity,
+together / sqrt(orders_a * orders_b), among pairs seen in at least
+`min_support` orders, so best sellers do not top every list. The top `k`
+per product, with their scores, go to product_recommendations, one row per
+product, and pages read them by primary key (cached per worker in
+ProductCache.related).
+
+The co-occurrence matrix is kept between runs in a state file (.npz), and
+orders placed since are queued by trigger (recommendation_queue), so an
+incremental run counts just the queued orders and rewrites the rows of the
+products in them. Other products' scores drift slightly as popularity
+moves, and orders deleted later are still counted, until the next full
+build (--full, e.g. nightly), which recounts everything in one snapshot.
+
+The state file records the queued orders of its last run, so a run
+interrupted between saving it and committing does not count them twice;
+the next run still rewrites the rows of their products.
+Only one builder runs at a time (advisory lock).
+
+The builder needs NumPy and SciPy (requirements-builder.txt). The web
+app does not import this module: it only reads the table.
+"""
+import os
+import tempfile
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional: only the builder needs them
+    np = sparse = None
+
+TOP_K = 10  # related products stored per product
+MIN_SUPPORT = 2  # orders a pair must share to count as related
+BATCH_LINES = 100000  # order lines per batch read from the server-side cursor
+QUEUE_CHUNK = 50000  # queued orders per incremental transaction
+LOCK_NAME = "build_recommendations"
+
+LINES_SQL = """
+    SELECT order_id, product_id FROM order_items
+    WHERE product_id IS NOT NULL {where}
+    ORDER BY order_id
+"""
+
+UPSERT_SQL = """
+    INSERT INTO product_recommendations (product_id, related, scores, updated_at) VALUES %s
+    ON CONFLICT (product_id) DO UPDATE
+        SET related = EXCLUDED.related, scores = EXCLUDED.scores, updated_at = EXCLUDED.updated_at
+"""
+UPSERT_TEMPLATE = "(%s, %s::integer[], %s::real[], CURRENT_TIMESTAMP)"
+
+
+def _require():
+    if np is None:
+        raise RuntimeError("building recommendations needs NumPy and SciPy (pip install -r requirements-builder.txt)")
+
+
+class CoOccurrence:
+    """
+    Symmetric product x product counts of orders containing both products,
+    indexed by product id; the diagonal holds each product's order count.
+    """
+
+    def __init__(self, matrix=None, applied=None):
+        _require()
+        self.matrix = matrix if matrix is not None else sparse.csr_matrix((0, 0), dtype=np.int32)
+        # Queued order ids already counted by the last saved run
+        self.applied = np.asarray(applied if applied is not None else [], dtype=np.int64)
+
+    def add_orders(self, order_ids, product_ids):
+        """
+        Count the orders in these lines (parallel integer arrays holding every
+        line of each order). A product twice in one order counts once.
+        Returns the ids of the products involved.
+        """
+        if not len(order_ids):
+            return np.empty(0, dtype=np.int64)
+        orders, rows = np.unique(order_ids, return_inverse=True)
+        n = max(self.matrix.shape[0], int(product_ids.max()) + 1)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, product_ids)), shape=(len(orders), n))
+        incidence.data[:] = 1  # duplicates were summed on construction
+        counts = (incidence.T @ incidence).tocsr()
+        if self.matrix.shape[0] < n:
+            self.matrix.resize((n, n))
+        self.matrix = self.matrix + counts
+        return np.unique(product_ids)
+
+    def products(self):
+        """Ids of the products that appear in any counted order."""
+        return np.flatnonzero(self.matrix.diagonal())
+
+    def top_k(self, product_ids, k=TOP_K, min_support=MIN_SUPPORT):
+        """[(product_id, [related ids], [scores])] for product_ids, best first, skipping products with none."""
+        rows = np.unique(np.asarray(product_ids, dtype=np.int64))
+        rows = rows[rows < self.matrix.shape[0]]
+        sub = self.matrix[rows]
+        owner = np.repeat(rows, np.diff(sub.indptr))
+        related = sub.indices.astype(np.int64)
+        together = sub.data
+        keep = (related != owner) & (together >= min_support)
+        owner, related, together = owner[keep], related[keep], together[keep]
+        if not len(owner):
+            return []
+
+        orders = self.matrix.diagonal().astype(np.float64)
+        scores = together / np.sqrt(orders[owner] * orders[related])
+        # By product, then best score first (ties by id), and the first k of each product
+        order = np.lexsort((related, -scores, owner))
+        owner, related, scores = owner[order], related[order], scores[order]
+        rank = np.arange(len(owner)) - np.searchsorted(owner, owner)
+        keep = rank < k
+        owner, related, scores = owner[keep], related[keep], np.round(scores[keep], 4)
+
+        starts = np.r_[0, np.flatnonzero(np.diff(owner)) + 1]
+        ends = np.r_[starts[1:], len(owner)]
+        return [
+            (int(owner[s]), related[s:e].tolist(), scores[s:e].tolist())
+            for s, e in zip(starts, ends)
+        ]
+
+    def save(self, path):
+        """Write the state file atomically (temporary file renamed into place)."""
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                         shape=np.array(self.matrix.shape), applied=self.applied)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """The saved state, or None if there is no state file."""
+        _require()
+        try:
+            with np.load(path) as state:
+                matrix = sparse.csr_matrix(
+                    (state["data"], state["indices"], state["indptr"]), shape=tuple(state["shape"]))
+                return cls(matrix, state["applied"])
+        except FileNotFoundError:
+            return None
+
+
+# -------------------- Database (PostgreSQL) --------------------
+def stream_orders(conn, where="", args=(), batch=BATCH_LINES):
+    """
+    Yield (order_ids, product_ids) arrays of whole orders, about `batch`
+    lines at a time, from a named cursor in conn's current transaction.
+    """
+    cur = conn.cursor(name="recommendation_lines")
+    cur.itersize = batch
+    try:
+        cur.execute(LINES_SQL.format(where=where), args)
+        carry = np.empty((0, 2), dtype=np.int64)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            lines = np.concatenate([carry, np.array(rows, dtype=np.int64)])
+            # The last order may go on in the next batch
+            split = int(np.searchsorted(lines[:, 0], lines[-1, 0]))
+            carry = lines[split:]
+            if split:
+                yield lines[:split, 0], lines[:split, 1]
+        if len(carry):
+            yield carry[:, 0], carry[:, 1]
+    finally:
+        cur.close()
+
+
+def write_rows(cur, rows, page_size=1000):
+    """Upsert (product_id, related, scores) rows into product_recommendations."""
+    from psycopg2.extras import execute_values
+
+    execute_values(cur, UPSERT_SQL, rows, template=UPSERT_TEMPLATE, page_size=page_size)
+
+
+def _unlimited(cur):
+    cur.execute("SET LOCAL statement_timeout = 0")
+    cur.execute("SET LOCAL idle_in_transaction_session_timeout = 0")
+
+
+def build_full(conn, state_path, k=TOP_K, min_support=MIN_SUPPORT, log=print):
+    """Recount every order in one snapshot and replace all rows. Returns a summary dict."""
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    _unlimited(cur)
+    # Orders queued before the snapshot are in the count below; later ones stay queued
+    cur.execute("DELETE FROM recommendation_queue RETURNING order_id")
+    applied = [row[0] for row in cur.fetchall()]
+
+    co, orders, lines = CoOccurrence(), 0, 0
+    for order_ids, product_ids in stream_orders(conn):
+        co.add_orders(order_ids, product_ids)
+        orders += len(np.unique(order_ids))
+        lines += len(order_ids)
+        log(f"  {lines} lines counted")
+    rows = co.top_k(co.products(), k, min_support)
+
+    cur.execute("DELETE FROM product_recommendations")
+    write_rows(cur, rows)
+    co.applied = np.asarray(applied, dtype=np.int64)
+    co.save(state_path)
+    conn.commit()
+    cur.close()
+    return {"mode": "full", "orders": orders, "lines": lines, "products": len(rows)}
+
+
+def build_incremental(conn, co, state_path, k=TOP_K, min_support=MIN_SUPPORT, log=print, chunk=QUEUE_CHUNK):
+    """Count the queued orders into `co` and rewrite the rows they touch. Returns a summary dict."""
+    orders, lines, written = 0, 0, 0
+    while True:
+        cur = conn.cursor()
+        _unlimited(cur)
+        cur.execute("SELECT order_id FROM recommendation_queue ORDER BY order_id LIMIT %s", (chunk,))
+        queued = np.array([row[0] for row in cur.fetchall()], dtype=np.int64)
+        if not len(queued):
+            conn.commit()
+            cur.close()
+            break
+        new = queued[~np.isin(queued, co.applied)]
+        # Orders counted by a run that saved the state file but did not commit
+        # are not counted again, but their products' rows are still rewritten
+        touched = [np.empty(0, dtype=np.int64)]
+        for order_ids, product_ids in stream_orders(conn, "AND order_id = ANY(%s)", (queued.tolist(),)):
+            touched.append(np.unique(product_ids))
+            fresh = np.isin(order_ids, new)
+            if fresh.any():
+                co.add_orders(order_ids[fresh], product_ids[fresh])
+                lines += int(fresh.sum())
+        rows = co.top_k(np.concatenate(touched), k, min_support)
+        write_rows(cur, rows)
+        co.applied = queued
+        co.save(state_path)
+        cur.execute("DELETE FROM recommendation_queue WHERE order_id = ANY(%s)", (queued.tolist(),))
+        conn.commit()
+        cur.close()
+        orders += len(new)
+        written += len(rows)
+        log(f"  {orders} queued orders counted")
+    return {"mode": "incremental", "orders": orders, "lines": lines, "products": written}
+
+
+def build(conn, state_path, full=False, k=TOP_K, min_support=MIN_SUPPORT, log=print):
+    """
+    Incremental run from the state file, or a full build when asked or when
+    there is no state file yet. Raises RuntimeError if another build is running.
+    """
+    _require()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LOCK_NAME,))
+    locked = cur.fetchone()[0]
+    conn.commit()
+    if not locked:
+        raise RuntimeError("another build_recommendations.py is running")
+    started = time.monotonic()
+    try:
+        co = None if full else CoOccurrence.load(state_path)
+        if co is None:
+            summary = build_full(conn, state_path, k, min_support, log)
+        else:
+            summary = build_incremental(conn, co, state_path, k, min_support, log)
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (LOCK_NAME,))
+        conn.commit()
+        cur.close()
+    summary["seconds"] = round(time.monotonic() - started, 2)
+    return summary
+
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Render stored invoices to files in bulk, e.g. at month-end.
+
+Orders in the range without an invoice snapshot get one first (see
+invoices.py), then the documents are streamed from the database and
+rendered with templates/invoice.html across a pool of worker processes,
+one file per invoice named after its invoice number.
+
+    DATABASE_URL=postgresql://... python render_invoices.py --month 2026-09
+    python render_invoices.py --from 2026-09-01 --to 2026-10-01 --out invoices/q3 --workers 8
+    python render_invoices.py --month 2026-09 --format pdf
+
+PDF output needs WeasyPrint (pip install weasyprint); HTML needs nothing
+extra. Existing files are skipped unless --force is given.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date
+from pathlib import Path
+
+from invoices import snapshot_missing_invoices, invoice_context, invoice_number
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BATCH_SIZE = 200
+
+_worker = {}
+
+
+def _static_url(endpoint, filename):
+    """url_for stand-in for rendering outside the app: static files by absolute file URI."""
+    return Path(ROOT, "static", filename).as_uri()
+
+
+def init_worker(fmt, out_dir, force):
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    env = Environment(loader=FileSystemLoader(os.path.join(ROOT, "templates")), autoescape=select_autoescape())
+    env.globals["url_for"] = _static_url
+    if fmt == "pdf":
+        from weasyprint import HTML
+        _worker["html_class"] = HTML
+    _worker.update(template=env.get_template("invoice.html"), fmt=fmt, out_dir=out_dir, force=force)
+
+
+def render_batch(documents):
+    """Render documents to files in the worker's output folder; returns (written, skipped)."""
+    written = skipped = 0
+    for document in documents:
+        path = os.path.join(_worker["out_dir"], f"{invoice_number(document['order_id'])}.{_worker['fmt']}")
+        if not _worker["force"] and os.path.exists(path):
+            skipped += 1
+            continue
+        html = _worker["template"].render(**invoice_context(document))
+        if _worker["fmt"] == "pdf":
+            _worker["html_class"](string=html, base_url=ROOT).write_pdf(path)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(html)
+        written += 1
+    return written, skipped
+
+
+def stream_documents(conn, date_from, date_to):
+    """Yield lists of up to BATCH_SIZE invoice documents for orders placed in [date_from, date_to)."""
+    cur = conn.cursor(name="render_invoices")
+    cur.itersize = BATCH_SIZE
+    cur.execute("""
+        SELECT i.document FROM invoices i
+        JOIN orders o ON o.id = i.order_id
+        WHERE o.order_date >= %s AND o.order_date < %s
+        ORDER BY i.order_id
+    """, (date_from, date_to))
+    try:
+        while True:
+            rows = cur.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+    finally:
+        cur.close()
+
+
+def month_range(month):
+    year, mon = (int(part) for part in month.split("-"))
+    start = date(year, mon, 1)
+    return start, date(year + mon // 12, mon % 12 + 1, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--month", help="YYYY-MM; shorthand for --from/--to")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="day after the last, YYYY-MM-DD")
+    parser.add_argument("--out", help="output folder (default: invoices/<from>_<to>)")
+    parser.add_argument("--format", choices=["html", "pdf"], default="html")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="overwrite existing files")
+    args = parser.parse_args()
+
+    if args.month:
+        try:
+            args.date_from, args.date_to = month_range(args.month)
+        except ValueError:
+            parser.error("--month must be YYYY-MM")
+    if not (args.date_from and args.date_to):
+        parser.error("give --month, or both --from and --to")
+    if args.format == "pdf":
+        try:
+            import weasyprint  # noqa: F401
+        except ImportError:
+            print("ERROR: PDF output needs WeasyPrint: pip install weasyprint")
+            sys.exit(1)
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+    import psycopg2
+    if "supabase" in database_url:
+        conn = psycopg2.connect(database_url, sslmode="require")
+    else:
+        conn = psycopg2.connect(database_url)
+
+    out_dir = args.out or os.path.join("invoices", f"{args.date_from}_{args.date_to}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    written = skipped = 0
+    try:
+        cur = conn.cursor()
+        created = snapshot_missing_invoices(cur, args.date_from, args.date_to)
+        conn.commit()
+        cur.close()
+        if created:
+            print(f"ℹ️ Snapshotted {created} invoices for orders placed before snapshots existed")
+
+        with ProcessPoolExecutor(args.workers, initializer=init_worker,
+                                 initargs=(args.format, out_dir, args.force)) as pool:
+            pending = set()
+            for documents in stream_documents(conn, args.date_from, args.date_to):
+                # Keep a couple of batches per worker queued, not the whole month in memory
+                if len(pending) >= args.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        w, s = future.result()
+                        written, skipped = written + w, skipped + s
+                pending.add(pool.submit(render_batch, documents))
+            for future in pending:
+                w, s = future.result()
+                written, skipped = written + w, skipped + s
+        conn.rollback()
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {written} invoices written to {out_dir} ({skipped} already there) in {elapsed:.1f}s "
+          f"with {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Read routing between the primary and streaming replicas.
+
+Routes that only read declare it (@read_only in app.py); their
+mysql.connection then comes from a replica when one is fit to serve the
+request, and from the primary otherwise. Writes always go to the primary.
+
+A replica is fit when its last status check (at most every
+`check_interval` seconds per process, on a connection the request is
+about to use anyway) found it:
+
+- replaying WAL, with a replay lag of at most `max_lag` seconds. A
+  replica that is streaming from the primary and has replayed everything
+  it received counts as 0 lag, so an idle primary does not make its
+  replicas look stale. One whose WAL receiver is not streaming (primary
+  unreachable, replication broken) has its lag measured from its last
+  replayed transaction, so it drops out once that is older than
+  `max_lag`. The status of pg_stat_wal_receiver is only visible to
+  superusers and pg_read_all_stats: grant that role to the app's user,
+  or every replica counts as not streaming and goes unused while the
+  primary is idle;
+- past the session's last write. After a commit that wrote, the app
+  stores the primary's WAL position (LSN) in the session, and reads for
+  that session skip replicas that have not replayed up to it. That keeps
+  read-your-writes, e.g. the order list right after checkout, without
+  pinning the session to the primary for a fixed time.
+
+Replicas that fail the check, or whose connection fails, are skipped until
+the next check. Among fit replicas, requests are spread round-robin.
+"""
+import itertools
+import time
+
+# A NULL lag (no transaction replayed yet, and not caught up) counts as unhealthy
+STATUS_SQL = """
+    SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text,
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                     AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+           END
+"""
+
+# txid_current_if_assigned() is NULL unless the transaction has written
+WROTE_SQL = "SELECT txid_current_if_assigned() IS NOT NULL"
+PRIMARY_LSN_SQL = "SELECT pg_current_wal_lsn()::text"
+
+
+def parse_lsn(lsn):
+    """'16/B374D848' -> int, so WAL positions compare numerically. None stays None."""
+    if not lsn:
+        return None
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaStatus:
+    __slots__ = ("name", "healthy", "lag", "replay_lsn", "checked_at", "error", "reads")
+
+    def __init__(self, name):
+        self.name = name
+        self.healthy = False
+        self.lag = None
+        self.replay_lsn = None
+        self.checked_at = 0.0
+        self.error = None
+        self.reads = 0
+
+
+class ReplicaRouter:
+    """
+    Picks a replica for a read. `connect(i)` returns a connection to replica
+    i (from its pool); the router only runs STATUS_SQL on it.
+    """
+
+    def __init__(self, names, max_lag=5.0, check_interval=1.0):
+        self.replicas = [ReplicaStatus(name) for name in names]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.primary_reads = 0
+        self._next = itertools.count()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def check(self, i, conn):
+        """Refresh replica i's status on `conn`."""
+        status = self.replicas[i]
+        try:
+            cur = conn.cursor()
+            cur.execute(STATUS_SQL)
+            in_recovery, replay_lsn, lag = cur.fetchone()
+            cur.close()
+            conn.rollback()
+        except Exception as e:
+            status.healthy, status.error = False, str(e)
+        else:
+            status.lag = float(lag) if lag is not None else None
+            status.replay_lsn = parse_lsn(replay_lsn)
+            status.healthy = bool(in_recovery) and status.lag is not None and status.lag <= self.max_lag
+            status.error = None if in_recovery else "not a replica (pg_is_in_recovery() is false)"
+        status.checked_at = time.monotonic()
+        return status.healthy
+
+    def _fit(self, status, min_lsn):
+        return status.healthy and (min_lsn is None or (status.replay_lsn or 0) >= min_lsn)
+
+    def choose(self, connect, min_lsn=None):
+        """
+        (index, connection) of a replica fit to serve a read that must see
+        WAL position `min_lsn`, or None to read from the primary.
+        """
+        n = len(self.replicas)
+        start = next(self._next)
+        now = time.monotonic()
+        for step in range(n):
+            i = (start + step) % n
+            status = self.replicas[i]
+            stale = now - status.checked_at >= self.check_interval
+            if not stale and not self._fit(status, min_lsn):
+                continue
+            try:
+                conn = connect(i)
+            except Exception as e:
+                status.healthy, status.error, status.checked_at = False, str(e), now
+                continue
+            if stale:
+                self.check(i, conn)
+            if self._fit(status, min_lsn):
+                status.reads += 1
+                return i, conn
+            conn.close()
+        self.primary_reads += 1
+        return None
+
+    def stats(self):
+        return {
+            "max_lag": self.max_lag,
+            "check_interval": self.check_interval,
+            "primary_reads": self.primary_reads,
+            "replicas": [
+                {
+                    "name": s.name,
+                    "healthy": s.healthy,
+                    "lag": s.lag,
+                    "error": s.error,
+                    "reads": s.reads,
+                    "checked_ago": round(time.monotonic() - s.checked_at, 2) if s.checked_at else None,
+                }
+                for s in self.replicas
+            ],
+        }
@@ -1,69 +1,78 @@
-from sqlalchemy import create_engine, text
+#!/usr/bin/env python3
+"""
+Apply the pending schema migrations in db/migrations (see migrations.py).
+
+    DATABASE_URL=postgresql://... python run_migrations.py
+    python run_migrations.py --status          # list applied / pending migrations
+    python run_migrations.py --target 3        # stop after version 3
+
+Then check the hot queries' plans with `python plan_check.py`.
+"""
+import argparse
 import os
 import sys
 
-# Read DATABASE_URL from environment (Supabase connection string)
-database_url = os.environ.get("DATABASE_URL")
-if not database_url:
-    print("ERROR: environment variable DATABASE_URL not set")
-    sys.exit(1)
+import psycopg2
 
-print("Using DATABASE_URL:", database_url.split("@", 1)[0] + "@...")
+from migrations import migrate, migration_status
+from stats import rebuild_stats
 
-# Create engine for PostgreSQL
-# Supabase uses SSL by default, so we enable SSL mode
-engine = create_engine(database_url, connect_args={"sslmode": "require"})
 
-# -------------------------------------------------------------------
-# SQL to create tables (PostgreSQL syntax)
-# -------------------------------------------------------------------
-schema_sql = """
-CREATE TABLE IF NOT EXISTS users (
-  id SERIAL PRIMARY KEY,
-  username VARCHAR(150),
-  email VARCHAR(255) UNIQUE,
-  password VARCHAR(255),
-  role VARCHAR(20) DEFAULT 'user' CHECK (role IN ('user', 'admin'))
-);
+def connect(database_url):
+    # Supabase requires SSL
+    if "supabase" in database_url:
+        return psycopg2.connect(database_url, sslmode="require")
+    return psycopg2.connect(database_url)
 
-CREATE TABLE IF NOT EXISTS products (
-  id SERIAL PRIMARY KEY,
-  name VARCHAR(255),
-  description TEXT,
-  price DECIMAL(10,2),
-  stock INTEGER DEFAULT 0,
-  image VARCHAR(255)
-);
 
-CREATE TABLE IF NOT EXISTS orders (
-  id SERIAL PRIMARY KEY,
-  user_id INTEGER,
-  order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  payment_method VARCHAR(50),
-  payment_status VARCHAR(50)
-);
+def backfill_stats(conn):
+    """Fill the dashboard statistics the first time their tables exist. Later rebuilds: python rebuild_stats.py"""
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM stats_counters LIMIT 1")
+    if cur.fetchone() is None:
+        print("Backfilling dashboard statistics...")
+        rebuild_stats(cur)
+        conn.commit()
+        print("✅ Statistics backfilled.")
+    else:
+        conn.rollback()
+    cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="show migration status and exit")
+    parser.add_argument("--target", type=int, help="apply up to this version only")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+
+    print("Using DATABASE_URL:", database_url.split("@", 1)[0] + "@...")
+    conn = connect(database_url)
+    try:
+        if args.status:
+            for migration, state in migration_status(conn):
+                print(f"  {state:<8} {migration}")
+            return
+
+        try:
+            applied, failed = migrate(conn, target=args.target)
+        except Exception as e:
+            print("ERROR running migration:", e)
+            raise
+        if applied:
+            print(f"✅ Applied {len(applied)} migration(s): {', '.join(map(str, applied))}")
+        else:
+            print("✅ Schema is up to date.")
+        if failed:
+            print(f"⚠️  Optional migration(s) not applied: {', '.join(map(str, failed))}")
+        backfill_stats(conn)
+    finally:
+        conn.close()
 
-CREATE TABLE IF NOT EXISTS order_items (
-  id SERIAL PRIMARY KEY,
-  order_id INTEGER,
-  product_id INTEGER,
-  quantity INTEGER,
-  FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-  FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-);
-"""
 
-# -------------------------------------------------------------------
-# Run migration by splitting the SQL and executing each statement.
-# -------------------------------------------------------------------
-try:
-    statements = [s.strip() for s in schema_sql.split(";") if s.strip()]
-    with engine.begin() as conn:
-        print("Running schema SQL...")
-        for stmt in statements:
-            if stmt:  # ensure each ends without trailing semicolon for safety
-                conn.execute(text(stmt))
-    print("✅ Tables created (or already existed).")
-except Exception as e:
-    print("ERROR running migration:", e)
-    raise
+if __name__ == "__main__":
+    main()
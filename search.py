@@ -0,0 +1,166 @@
+"""
+Product search over name and description.
+
+PostgreSQL: products.search_vector is a generated tsvector column (name
+weighted above description) with a GIN index, so it follows every insert
+and update, from add_product / edit_product and bulk imports alike. Each
+query word is matched as a prefix, which is what typeahead needs. When the
+pg_trgm extension is installed, names within trigram distance of the query
+are added after the full-text hits, so small typos still find the product.
+
+SQLite (offline runs on sqlite:///temp.db): an FTS5 table over products,
+kept in sync by triggers (ensure_sqlite_search), queried the same way and
+ranked with bm25. FTS5 has no typo matching; prefix matching still applies.
+"""
+import re
+
+SUGGEST_LIMIT = 8
+MAX_TERMS = 8
+TRIGRAM_THRESHOLD = 0.4
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# Whether pg_trgm is installed, looked up once per process
+_has_trigram = None
+
+
+def query_terms(q):
+    """Words of a search string, lower-cased; punctuation and underscores split words."""
+    return [t[:64] for t in _WORD_RE.findall((q or "").lower())][:MAX_TERMS]
+
+
+def prefix_tsquery(terms):
+    """to_tsquery input matching every term as a prefix: 'air:* & fry:*'."""
+    return " & ".join(f"{t}:*" for t in terms)
+
+
+def has_trigram(cur):
+    global _has_trigram
+    if _has_trigram is None:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS present")
+        row = cur.fetchone()
+        _has_trigram = bool(row['present'] if isinstance(row, dict) else row[0])
+    return _has_trigram
+
+
+def search_condition(cur, q):
+    """
+    (SQL condition, args) restricting a products query to rows matching `q`,
+    for the catalog listings. Returns None when `q` has no searchable words.
+    """
+    terms = query_terms(q)
+    if not terms:
+        return None
+    if type(cur).__module__ == "sqlite3":
+        return "id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH %s)", [fts_match(terms)]
+    sql = "search_vector @@ to_tsquery('english', %s)"
+    args = [prefix_tsquery(terms)]
+    if has_trigram(cur):
+        sql = f"({sql} OR %s <%% name)"
+        args.append(" ".join(terms))
+        _set_trigram_threshold(cur)
+    return sql, args
+
+
+def _set_trigram_threshold(cur):
+    cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", (str(TRIGRAM_THRESHOLD),))
+    cur.fetchall()
+
+
+def search_products(cur, q, limit=SUGGEST_LIMIT):
+    """
+    Ranked products matching `q` (id, name, price, stock, image), best first.
+    `cur` is a psycopg2 RealDictCursor or a cursor from
+    queries.connect_sqlite() (dict rows).
+    """
+    terms = query_terms(q)
+    if not terms:
+        return []
+    if type(cur).__module__ == "sqlite3":
+        return _search_sqlite(cur, terms, limit)
+
+    tsquery = prefix_tsquery(terms)
+    if not has_trigram(cur):
+        cur.execute("""
+            SELECT id, name, price, stock, image
+            FROM products, to_tsquery('english', %s) query
+            WHERE search_vector @@ query
+            ORDER BY ts_rank_cd(search_vector, query) DESC, id
+            LIMIT %s
+        """, (tsquery, limit))
+        return cur.fetchall()
+
+    # Full-text hits first, then near-miss names by trigram word similarity
+    _set_trigram_threshold(cur)
+    cur.execute("""
+        WITH query AS (SELECT to_tsquery('english', %(tsquery)s) AS tsq),
+        text_hits AS (
+            SELECT id, name, price, stock, image, 0 AS tier, ts_rank_cd(search_vector, query.tsq) AS rank
+            FROM products, query
+            WHERE search_vector @@ query.tsq
+            ORDER BY rank DESC, id
+            LIMIT %(limit)s
+        ),
+        fuzzy_hits AS (
+            SELECT id, name, price, stock, image, 1 AS tier, word_similarity(%(words)s, name) AS rank
+            FROM products
+            WHERE %(words)s <%% name AND id NOT IN (SELECT id FROM text_hits)
+            ORDER BY rank DESC, id
+            LIMIT %(limit)s
+        )
+        SELECT id, name, price, stock, image FROM (
+            SELECT * FROM text_hits UNION ALL SELECT * FROM fuzzy_hits
+        ) hits
+        ORDER BY tier, rank DESC, id
+        LIMIT %(limit)s
+    """, {"tsquery": tsquery, "words": " ".join(terms), "limit": limit})
+    return cur.fetchall()
+
+
+# -------------------- SQLite (FTS5) --------------------
+SQLITE_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, description, content='products', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+    INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+"""
+
+
+def ensure_sqlite_search(conn):
+    """Create the FTS5 index and its triggers on a SQLite connection, indexing existing products."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    ).fetchone()
+    conn.executescript(SQLITE_SCHEMA)
+    if not exists:
+        conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def fts_match(terms):
+    """FTS5 MATCH input matching every term as a prefix: '"air"* "fry"*'."""
+    # Quoted terms with a trailing * are prefix matches; FTS5 ANDs them
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _search_sqlite(cur, terms, limit):
+    cur.execute("""
+        SELECT p.id, p.name, p.price, p.stock, p.image
+        FROM products_fts
+        JOIN products p ON p.id = products_fts.rowid
+        WHERE products_fts MATCH ?
+        ORDER BY bm25(products_fts, 10.0, 1.0), p.id
+        LIMIT ?
+    """, (fts_match(terms), limit))
+    return cur.fetchall()
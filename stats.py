@@ -0,0 +1,157 @@
+"""
+Dashboard statistics maintained incrementally.
+
+stats_counters holds running totals (users, products, orders, revenue) and
+sales_daily holds units / revenue / orders per product per day. The routes
+that change those numbers update them in the same transaction as their own
+write (checkout through the order_placed job, see tasks.py), so the admin
+dashboard reads a handful of rows instead of counting the transactional
+tables. Deleting a user, whose orders cascade away, subtracts them first
+(forget_user_orders), so the totals keep matching the tables.
+
+Counters are split across COUNTER_SHARDS rows per name and each update
+picks a shard at random. Without that, every checkout would queue on the
+single 'orders' row until the previous one committed.
+
+rebuild_stats() recomputes everything from the transactional tables (see
+rebuild_stats.py). Sales history for orders whose products or users have
+since been deleted is lost on rebuild, since those rows cascade away;
+orders from before price_at_time was recorded are valued at today's price.
+"""
+import random
+
+COUNTER_SHARDS = 16
+
+
+def incr_counter(cur, name, delta=1):
+    cur.execute("""
+        INSERT INTO stats_counters (name, shard, value) VALUES (%s, %s, %s)
+        ON CONFLICT (name, shard) DO UPDATE SET value = stats_counters.value + EXCLUDED.value
+    """, (name, random.randrange(COUNTER_SHARDS), delta))
+
+
+def record_order(cur, order_id):
+    """Add a just-placed order to the counters and daily sales rollup."""
+    # ORDER BY keeps the rollup rows locked in product id order, like place_order
+    cur.execute("""
+        WITH lines AS (
+            SELECT o.order_date::date AS day, oi.product_id, SUM(oi.quantity) AS units,
+                   SUM(oi.quantity * COALESCE(oi.price_at_time, 0)) AS revenue
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.id = %s
+            GROUP BY o.order_date::date, oi.product_id
+        ), rollup AS (
+            INSERT INTO sales_daily (day, product_id, units, revenue, orders)
+            SELECT day, product_id, units, revenue, 1 FROM lines ORDER BY product_id
+            ON CONFLICT (day, product_id) DO UPDATE SET
+                units = sales_daily.units + EXCLUDED.units,
+                revenue = sales_daily.revenue + EXCLUDED.revenue,
+                orders = sales_daily.orders + 1
+        )
+        SELECT COALESCE(SUM(revenue), 0) FROM lines
+    """, (order_id,))
+    revenue = cur.fetchone()[0]
+    incr_counter(cur, 'orders', 1)
+    incr_counter(cur, 'revenue', revenue)
+
+
+def forget_user_orders(cur, user_id):
+    """
+    Take a user's orders out of the counters and daily sales rollup, before
+    deleting the user (their orders cascade away with them).
+    """
+    # Same product id lock order as record_order and place_order
+    cur.execute("""
+        SELECT 1 FROM sales_daily s
+        WHERE (s.day, s.product_id) IN (
+            SELECT o.order_date::date, oi.product_id
+            FROM orders o JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.user_id = %s
+        )
+        ORDER BY s.product_id, s.day
+        FOR UPDATE
+    """, (user_id,))
+    cur.execute("""
+        WITH lines AS (
+            SELECT o.order_date::date AS day, oi.product_id, SUM(oi.quantity) AS units,
+                   SUM(oi.quantity * COALESCE(oi.price_at_time, 0)) AS revenue, COUNT(DISTINCT o.id) AS orders
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.user_id = %s
+            GROUP BY o.order_date::date, oi.product_id
+        ), rollup AS (
+            UPDATE sales_daily s SET
+                units = s.units - l.units,
+                revenue = s.revenue - l.revenue,
+                orders = s.orders - l.orders
+            FROM lines l
+            WHERE s.day = l.day AND s.product_id = l.product_id
+        )
+        SELECT (SELECT COALESCE(SUM(revenue), 0) FROM lines),
+               (SELECT COUNT(*) FROM orders WHERE user_id = %s)
+    """, (user_id, user_id))
+    revenue, orders = cur.fetchone()
+    if orders:
+        incr_counter(cur, 'orders', -orders)
+        incr_counter(cur, 'revenue', -revenue)
+
+
+def rebuild_stats(cur):
+    """Recompute counters and the daily sales rollup from scratch. Caller commits."""
+    cur.execute("LOCK TABLE stats_counters, sales_daily IN EXCLUSIVE MODE")
+    cur.execute("DELETE FROM stats_counters")
+    cur.execute("""
+        INSERT INTO stats_counters (name, shard, value)
+        SELECT 'users', 0, COUNT(*) FROM users WHERE role = 'user'
+        UNION ALL SELECT 'products', 0, COUNT(*) FROM products
+        UNION ALL SELECT 'orders', 0, COUNT(*) FROM orders
+        UNION ALL SELECT 'revenue', 0, COALESCE(SUM(oi.quantity * COALESCE(oi.price_at_time, p.price, 0)), 0)
+            FROM order_items oi LEFT JOIN products p ON p.id = oi.product_id
+    """)
+    cur.execute("DELETE FROM sales_daily")
+    cur.execute("""
+        INSERT INTO sales_daily (day, product_id, units, revenue, orders)
+        SELECT o.order_date::date, oi.product_id, SUM(oi.quantity),
+               SUM(oi.quantity * COALESCE(oi.price_at_time, p.price, 0)), COUNT(DISTINCT o.id)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        LEFT JOIN products p ON p.id = oi.product_id
+        GROUP BY o.order_date::date, oi.product_id
+    """)
+
+
+def dashboard_stats(cur, days=14, top=5):
+    """
+    Counters, revenue per day for the last `days` days, and the top sellers
+    over that window. `cur` must be a RealDictCursor.
+    """
+    cur.execute("SELECT name, SUM(value) AS value FROM stats_counters GROUP BY name")
+    counters = {row['name']: row['value'] for row in cur.fetchall()}
+    cur.execute("""
+        SELECT day, SUM(units) AS units, SUM(revenue) AS revenue
+        FROM sales_daily
+        WHERE day > CURRENT_DATE - %s
+        GROUP BY day
+        ORDER BY day DESC
+    """, (days,))
+    daily = cur.fetchall()
+    cur.execute("""
+        SELECT s.product_id, p.name, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+        FROM sales_daily s
+        JOIN products p ON p.id = s.product_id
+        WHERE s.day > CURRENT_DATE - %s
+        GROUP BY s.product_id, p.name
+        ORDER BY revenue DESC
+        LIMIT %s
+    """, (days, top))
+    top_products = cur.fetchall()
+    return {
+        'total_users': int(counters.get('users', 0)),
+        'total_products': int(counters.get('products', 0)),
+        'total_orders': int(counters.get('orders', 0)),
+        'total_revenue': counters.get('revenue', 0),
+        'daily': daily,
+        'top_products': top_products,
+        'days': days,
+    }
@@ -0,0 +1,24 @@
+"""
+Handlers for the background job queue (see jobs.py). Each runs on the
+worker's cursor in the transaction that completes its job.
+"""
+from images import make_derivatives
+from invoices import snapshot_invoices
+from jobs import handler
+from product_cache import bump_catalog_version
+from stats import record_order
+
+
+@handler("order_placed")
+def order_placed(cur, payload):
+    """Dashboard counters, the daily sales rollup and the invoice snapshot of a new order."""
+    record_order(cur, payload["order_id"])
+    snapshot_invoices(cur, [payload["order_id"]])
+
+
+@handler("image_derivatives")
+def image_derivatives(cur, payload):
+    """Resized and WebP variants of an uploaded product image."""
+    if make_derivatives(payload["path"]):
+        # Catalog fragments cached before now were rendered without the srcset
+        bump_catalog_version(cur)
@@ -0,0 +1,44 @@
+"""
+Jinja bytecode cache shipped with the deployment.
+
+build_assets.py compiles every template into jinja_cache/ and the directory
+is committed, so a cold serverless instance loads compiled templates instead
+of parsing and compiling each one on its first render. Entries are keyed by
+template name only (not by absolute path, which differs between the build
+machine and the deployment) and carry a checksum of the template source:
+an edited template simply misses the cache and is compiled as usual.
+
+At runtime the cache is read-only, since the deployment filesystem may be.
+"""
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+BYTECODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jinja_cache")
+
+
+class ShippedBytecodeCache(FileSystemBytecodeCache):
+    def __init__(self, directory=BYTECODE_DIR, writable=False):
+        super().__init__(directory, "%s.cache")
+        self.writable = writable
+
+    def get_cache_key(self, name, filename=None):
+        return name.replace("/", "__")
+
+    def load_bytecode(self, bucket):
+        try:
+            super().load_bytecode(bucket)
+        except (OSError, ValueError, EOFError):
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        if self.writable:
+            super().dump_bytecode(bucket)
+
+
+def compile_templates(env):
+    """Compile every template of `env` into its (writable) bytecode cache. Returns the names."""
+    names = env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        env.get_template(name)
+    return names
@@ -0,0 +1,49 @@
+"""
+product_import against a real PostgreSQL database (TEST_DATABASE_URL), in
+a transaction that is rolled back. Skipped when the variable is not set.
+"""
+import os
+
+import pytest
+
+from product_import import import_products
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+
+@pytest.fixture
+def cur():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    conn = psycopg2.connect(url)
+    try:
+        with conn.cursor() as cur:
+            yield cur
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_new_sku_without_price_is_rejected(cur):
+    rows = [
+        (2, {"sku": "TEST-NO-PRICE", "name": "No price"}),
+        (3, {"sku": "TEST-PRICED", "name": "Priced", "price": "9.50"}),
+    ]
+    report = import_products(cur, rows, mode="upsert")
+
+    assert report.errors == [(2, "price required for new products")]
+    assert report.inserted == 1
+    cur.execute("SELECT sku, price FROM products WHERE sku LIKE 'TEST-%' ORDER BY sku")
+    assert [(sku, str(price)) for sku, price in cur.fetchall()] == [("TEST-PRICED", "9.50")]
+
+
+def test_existing_sku_without_price_keeps_its_price(cur):
+    cur.execute("INSERT INTO products (sku, name, price, stock) VALUES ('TEST-EXISTING', 'Old', 4.25, 1)")
+    report = import_products(cur, [(2, {"sku": "TEST-EXISTING", "name": "New name"})], mode="upsert")
+
+    assert report.errors == []
+    assert report.updated == 1
+    cur.execute("SELECT name, price FROM products WHERE sku = 'TEST-EXISTING'")
+    name, price = cur.fetchone()
+    assert (name, str(price)) == ("New name", "4.25")
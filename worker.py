@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Run background jobs from the jobs table (see jobs.py and tasks.py). The
+app only queues jobs when started with BACKGROUND_JOBS=True; otherwise it
+runs them inline. Either way, the worker also deletes expired anonymous
+carts once an hour (carts.expire_anonymous_carts), so run it, or
+`python worker.py --once` from cron, on every deployment.
+
+Each process keeps one connection for claiming and running jobs and one
+LISTENing for new ones, so an idle worker wakes as soon as a route commits
+a job instead of polling. Due retries are picked up every --poll seconds.
+SIGTERM / Ctrl-C let the current job finish before exiting.
+
+    DATABASE_URL=postgresql://... python worker.py
+    python worker.py --processes 4
+    python worker.py --once                  # run every due job, then exit (cron)
+    python worker.py --status                # queued / running / dead jobs per kind
+    python worker.py --retry-dead [--kind order_placed]
+"""
+import argparse
+import multiprocessing
+import os
+import select
+import signal
+import sys
+import time
+
+import psycopg2
+
+import carts
+import jobs
+import tasks  # noqa: F401  registers the job handlers
+
+DEFAULT_POLL = 5.0  # seconds between checks for due retries when no notification arrives
+EXPIRED_CHECK_INTERVAL = 60.0  # seconds between sweeps for jobs of dead workers
+CART_EXPIRY_INTERVAL = 3600.0  # seconds between sweeps for expired anonymous carts
+
+
+def connect(database_url):
+    # Supabase requires SSL
+    if "supabase" in database_url:
+        return psycopg2.connect(database_url, sslmode="require")
+    return psycopg2.connect(database_url)
+
+
+def expire_carts(conn):
+    """Delete expired anonymous carts in batches, one transaction each. Returns how many."""
+    cur, total = conn.cursor(), 0
+    try:
+        while True:
+            deleted = carts.expire_anonymous_carts(cur)
+            conn.commit()
+            total += deleted
+            if deleted < carts.EXPIRE_BATCH:
+                return total
+    finally:
+        cur.close()
+
+
+def work(database_url, poll=DEFAULT_POLL, once=False, lease=jobs.LEASE):
+    """Worker process loop: run due jobs until stopped (or, with `once`, until none are due)."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    name = f"worker {os.getpid()}"
+
+    conn = connect(database_url)
+    listener = connect(database_url)
+    listener.autocommit = True
+    listener.cursor().execute(f"LISTEN {jobs.NOTIFY_CHANNEL}")
+    swept_at = carts_swept_at = 0.0
+    try:
+        while not stopping:
+            if time.monotonic() - carts_swept_at >= CART_EXPIRY_INTERVAL:
+                expired = expire_carts(conn)
+                if expired:
+                    print(f"{name}: deleted {expired} expired anonymous cart(s)")
+                carts_swept_at = time.monotonic()
+            if time.monotonic() - swept_at >= EXPIRED_CHECK_INTERVAL:
+                cur = conn.cursor()
+                released = jobs.requeue_expired(cur)
+                conn.commit()
+                cur.close()
+                if released:
+                    print(f"{name}: released {released} job(s) left by a stopped worker")
+                swept_at = time.monotonic()
+            if jobs.run_next(conn, lease, log=lambda msg: print(f"{name}: {msg}")):
+                continue
+            if once:
+                break
+            try:
+                if select.select([listener], [], [], poll)[0]:
+                    listener.poll()
+                    listener.notifies.clear()
+            except InterruptedError:
+                pass
+    finally:
+        listener.close()
+        conn.close()
+
+
+def run_processes(database_url, processes, poll, once):
+    """Start `processes` workers and restart any that exit unexpectedly, until stopped."""
+    def start():
+        p = multiprocessing.Process(target=work, args=(database_url, poll, once), daemon=False)
+        p.start()
+        return p
+
+    stopping = []
+
+    def stop(*_):
+        stopping.append(True)
+        for p in workers:
+            if p.is_alive():
+                p.terminate()  # SIGTERM: the worker finishes its current job
+
+    workers = [start() for _ in range(processes)]
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Started {processes} worker process(es): {', '.join(str(p.pid) for p in workers)}")
+    while workers:
+        time.sleep(1)
+        for i, p in enumerate(workers):
+            if p.is_alive():
+                continue
+            p.join()
+            if stopping or once or p.exitcode == 0:
+                workers[i] = None
+            else:
+                print(f"worker {p.pid} exited with {p.exitcode}; restarting")
+                workers[i] = start()
+        workers = [p for p in workers if p is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("JOB_WORKERS", "1")),
+                        help="worker processes to run (default JOB_WORKERS or 1)")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL,
+                        help=f"seconds between checks for due retries (default {DEFAULT_POLL})")
+    parser.add_argument("--once", action="store_true", help="run the jobs that are due, then exit")
+    parser.add_argument("--status", action="store_true", help="show the queue and exit")
+    parser.add_argument("--retry-dead", action="store_true", help="requeue dead-lettered jobs and exit")
+    parser.add_argument("--kind", help="with --retry-dead: only jobs of this kind")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("ERROR: environment variable DATABASE_URL not set")
+        sys.exit(1)
+
+    if args.status or args.retry_dead:
+        conn = connect(database_url)
+        try:
+            cur = conn.cursor()
+            if args.retry_dead:
+                print(f"Requeued {jobs.retry_dead(cur, args.kind)} dead job(s).")
+            for kind, status, count, oldest in jobs.queue_counts(cur):
+                print(f"  {kind:<20} {status:<8} {count:>8}  oldest due {oldest:%Y-%m-%d %H:%M:%S}")
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+        return
+
+    print("Using DATABASE_URL:", database_url.split("@", 1)[0] + "@...")
+    if args.processes <= 1:
+        work(database_url, args.poll, args.once)
+    else:
+        run_processes(database_url, args.processes, args.poll, args.once)
+
+
+if __name__ == "__main__":
+    main()